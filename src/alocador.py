@@ -0,0 +1,228 @@
+"""Alocador de blocos do disco simulado.
+
+O espaço é dividido em blocos de tamanho fixo. Um bitmap registra os
+blocos em uso e, em paralelo, as regiões livres são mantidas como extents
+(bloco inicial, quantidade) em duas listas ordenadas: por início, para
+fundir vizinhos ao liberar, e por tamanho, para a escolha best-fit. Assim
+alocar ou liberar custa O(log n) no número de extents livres, e não no
+número de blocos.
+"""
+import re
+from bisect import bisect_left, insort
+from typing import Callable, Dict, List, Optional, Tuple
+
+BLOCK_SIZE = 1024
+
+Extent = Tuple[int, int]
+
+_RUNS = re.compile(rb"\x00+|\xff+|[\x01-\xfe]")
+
+
+def blocks_for(nbytes: int, block_size: int = BLOCK_SIZE) -> int:
+    return -(-nbytes // block_size)
+
+
+def extent_blocks(extents: List[Extent]) -> int:
+    return sum(count for _, count in extents)
+
+
+class BlockAllocator:
+    """Bitmap de blocos com listas de extents livres."""
+
+    def __init__(self, total_blocks: int, block_size: int = BLOCK_SIZE, bitmap: Optional[bytes] = None,
+                 on_change: Optional[Callable[[int, int], None]] = None):
+        self.total_blocks = total_blocks
+        self.block_size = block_size
+        self.bitmap = bytearray(bitmap) if bitmap is not None else bytearray(-(-total_blocks // 8))
+        # Chamado com (primeiro byte, último byte) do bitmap alterado
+        self.on_change = on_change
+        self._starts: List[int] = []
+        self._lengths: Dict[int, int] = {}
+        self._by_size: List[Extent] = []  # (tamanho, início)
+        self.free_blocks = 0
+        self._build_free_lists()
+
+    def _build_free_lists(self):
+        run_start = None
+        for match in _RUNS.finditer(self.bitmap):
+            chunk = match.group()
+            base = match.start() * 8
+            if chunk[0] == 0x00:
+                if run_start is None:
+                    run_start = base
+            elif chunk[0] == 0xFF:
+                if run_start is not None:
+                    self._insert_run(run_start, base)
+                    run_start = None
+            else:
+                for bit in range(8):
+                    if chunk[0] & (1 << bit):
+                        if run_start is not None:
+                            self._insert_run(run_start, base + bit)
+                            run_start = None
+                    elif run_start is None:
+                        run_start = base + bit
+        if run_start is not None:
+            self._insert_run(run_start, self.total_blocks)
+
+    def reload(self, bitmap: bytes):
+        """Adota o bitmap dado (o da imagem após desfazer uma transação) e refaz as listas livres."""
+        self.bitmap[:] = bitmap
+        self._starts, self._lengths, self._by_size = [], {}, []
+        self.free_blocks = 0
+        self._build_free_lists()
+
+    def _insert_run(self, start: int, end: int):
+        # Os bits de preenchimento do último byte não são blocos
+        self._insert_free(start, min(end, self.total_blocks) - start)
+
+    # Listas de extents livres
+    def _insert_free(self, start: int, length: int):
+        if length <= 0:
+            return
+        insort(self._starts, start)
+        self._lengths[start] = length
+        insort(self._by_size, (length, start))
+        self.free_blocks += length
+
+    def _remove_free(self, start: int):
+        length = self._lengths.pop(start)
+        self._starts.pop(bisect_left(self._starts, start))
+        self._by_size.pop(bisect_left(self._by_size, (length, start)))
+        self.free_blocks -= length
+        return length
+
+    def _take(self, start: int, count: int):
+        """Retira `count` blocos do início do extent livre que começa em `start`."""
+        length = self._remove_free(start)
+        self._insert_free(start + count, length - count)
+
+    # Bitmap
+    def _mark(self, start: int, count: int, used: bool):
+        end = start + count
+        first_byte, last_byte = start // 8, (end - 1) // 8
+        bm = self.bitmap
+        if first_byte == last_byte:
+            mask = ((1 << count) - 1) << (start % 8)
+            bm[first_byte] = bm[first_byte] | mask if used else bm[first_byte] & ~mask
+        else:
+            head = (0xFF << (start % 8)) & 0xFF
+            tail = (1 << (end - last_byte * 8)) - 1
+            bm[first_byte] = bm[first_byte] | head if used else bm[first_byte] & ~head
+            bm[last_byte] = bm[last_byte] | tail if used else bm[last_byte] & ~tail
+            bm[first_byte + 1:last_byte] = (b"\xff" if used else b"\x00") * (last_byte - first_byte - 1)
+        if self.on_change is not None:
+            self.on_change(first_byte, last_byte)
+
+    def is_used(self, block: int) -> bool:
+        return bool(self.bitmap[block // 8] & (1 << (block % 8)))
+
+    # Alocação
+    def alloc(self, count: int, after: Optional[Extent] = None) -> List[Extent]:
+        """Aloca `count` blocos como uma lista de extents.
+
+        Se `after` for dado, tenta primeiro continuar logo após esse extent,
+        para que arquivos cresçam de forma contígua. Depois usa best-fit e,
+        se nenhuma região comporta o pedido inteiro, junta as maiores.
+        """
+        if count <= 0:
+            return []
+        if count > self.free_blocks:
+            raise MemoryError("Disco cheio")
+        result: List[Extent] = []
+        if after is not None:
+            end = after[0] + after[1]
+            length = self._lengths.get(end)
+            if length:
+                take = min(length, count)
+                self._take(end, take)
+                result.append((end, take))
+                count -= take
+        while count:
+            i = bisect_left(self._by_size, (count, -1))
+            length, start = self._by_size[i] if i < len(self._by_size) else self._by_size[-1]
+            take = min(length, count)
+            self._take(start, take)
+            result.append((start, take))
+            count -= take
+        for start, n in result:
+            self._mark(start, n, True)
+        return result
+
+    def free(self, extents: List[Extent]):
+        for start, count in extents:
+            if count <= 0:
+                continue
+            self._mark(start, count, False)
+            # Funde com os extents livres vizinhos
+            i = bisect_left(self._starts, start)
+            if i > 0:
+                prev = self._starts[i - 1]
+                if prev + self._lengths[prev] == start:
+                    count += start - prev
+                    self._remove_free(prev)
+                    start = prev
+            if start + count in self._lengths:
+                count += self._remove_free(start + count)
+            self._insert_free(start, count)
+
+    def resize(self, extents: List[Extent], blocks: int) -> List[Extent]:
+        """Cresce ou encolhe uma lista de extents para `blocks` blocos, em O(extents)."""
+        have = extent_blocks(extents)
+        if blocks > have:
+            new = self.alloc(blocks - have, after=extents[-1] if extents else None)
+            extents = list(extents)
+            if extents and new and new[0][0] == extents[-1][0] + extents[-1][1]:
+                last = extents.pop()
+                new[0] = (last[0], last[1] + new[0][1])
+            return extents + new
+        if blocks < have:
+            kept, freed, total = [], [], 0
+            for start, count in extents:
+                if total >= blocks:
+                    freed.append((start, count))
+                elif total + count > blocks:
+                    keep = blocks - total
+                    kept.append((start, keep))
+                    freed.append((start + keep, count - keep))
+                else:
+                    kept.append((start, count))
+                total += count
+            self.free(freed)
+            return kept
+        return extents
+
+    # Estatísticas
+    @property
+    def used_blocks(self) -> int:
+        return self.total_blocks - self.free_blocks
+
+    def largest_free(self) -> int:
+        """Tamanho, em blocos, da maior região livre contígua."""
+        return self._by_size[-1][0] if self._by_size else 0
+
+    def fragmentation(self) -> float:
+        """Fração do espaço livre fora da maior região contígua (0 = nada fragmentado)."""
+        if not self.free_blocks:
+            return 0.0
+        return 1 - self.largest_free() / self.free_blocks
+
+    def stats(self) -> dict:
+        return {
+            "block_size": self.block_size,
+            "total_blocks": self.total_blocks,
+            "free_blocks": self.free_blocks,
+            "free_extents": len(self._starts),
+            "largest_free": self.largest_free() * self.block_size,
+            "fragmentation": self.fragmentation(),
+        }
+
+    def check(self) -> List[str]:
+        """Confere se as listas de extents livres batem com o bitmap."""
+        problems = []
+        expected = BlockAllocator(self.total_blocks, self.block_size, self.bitmap)
+        if expected._lengths != self._lengths:
+            problems.append("extents livres divergem do bitmap")
+        if expected.free_blocks != self.free_blocks:
+            problems.append(f"blocos livres: {self.free_blocks} registrados, {expected.free_blocks} no bitmap")
+        return problems
@@ -0,0 +1,660 @@
+"""Benchmarks das operações do sistema de arquivos.
+
+Execute com `python benchmark.py` a partir da pasta src. Com `--suite`,
+roda só a suíte de regressão; `--json resultados.json` grava os resultados
+e `--base resultados.json` compara uma nova rodada com eles, saindo com
+código 1 se alguma medida piorou além da tolerância.
+"""
+import argparse
+import dataclasses
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import filesystem
+from conteudo import CHUNK_SIZE, ChunkStore, MemoryData
+from filesystem import DirectoryNode, FileNode, FileSystem
+from persistencia import DiskImage
+
+SIZES = (10, 1_000, 100_000)
+
+
+def _throughput(count: int, elapsed: float) -> str:
+    return f"{count / elapsed:>14,.0f} ops/s" if elapsed > 0 else f"{'-':>14} ops/s"
+
+
+def bench_children(n: int):
+    """Mede mkdir, touch e get_child em um diretório com n filhos."""
+    fs = FileSystem()
+    half = n // 2
+
+    start = time.perf_counter()
+    for i in range(half):
+        fs.mkdir(f"dir{i}")
+    t_mkdir = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(n - half):
+        fs.touch(f"arq{i}")
+    t_touch = time.perf_counter() - start
+
+    names = fs.ls()
+    start = time.perf_counter()
+    for name in names:
+        fs.cwd.get_child(name)
+    t_get = time.perf_counter() - start
+
+    return {
+        "mkdir": (half, t_mkdir),
+        "touch": (n - half, t_touch),
+        "get_child": (len(names), t_get),
+    }
+
+
+def bench_paths(depth: int, lookups: int = 100_000):
+    """Mede Node.path e resolve() em uma cadeia de diretórios com a profundidade dada."""
+    fs = FileSystem()
+    for i in range(depth):
+        fs.mkdir(f"d{i}")
+        fs.cd(f"d{i}")
+    fs.touch("arq")
+    leaf = fs.cwd.get_child("arq")
+    path = leaf.path
+
+    start = time.perf_counter()
+    for _ in range(lookups):
+        leaf.path
+    t_path = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(lookups):
+        fs.resolve(path)
+    t_resolve = time.perf_counter() - start
+
+    return {
+        "path": (lookups, t_path),
+        "resolve": (lookups, t_resolve),
+    }
+
+
+def bench_readers(threads: int, writers: int = 1, duration: float = 0.5, dirs: int = 10, files: int = 20):
+    """Mede leituras concorrentes (resolve, ls, read) com escritores em outros diretórios.
+
+    Cada leitor resolve um caminho ao acaso, lista o diretório e lê o
+    arquivo; cada escritor acrescenta e trunca arquivos do seu próprio
+    diretório. Ao fim, confere os totais com fsck. Retorna as operações
+    de leitura e de escrita e o tempo decorrido.
+    """
+    fs = FileSystem()
+    paths = []
+    for d in range(dirs):
+        fs.mkdir(f"d{d}")
+        for f in range(files):
+            node = fs.open(f"d{d}/arq{f}", create=True)
+            fs.write(node, 0, b"conteudo %d %d " % (d, f) * 16)
+            paths.append(node.path)
+    writable = []
+    for w in range(writers):
+        fs.mkdir(f"w{w}")
+        writable.append([fs.open(f"w{w}/arq{f}", create=True).path for f in range(files)])
+
+    stop = threading.Event()
+    counts = []
+
+    def reader(seed):
+        rng = random.Random(seed)
+        n = 0
+        while not stop.is_set():
+            node = fs.resolve(rng.choice(paths))
+            with filesystem.lock_nodes(node.parent, write=False):
+                len(node.parent.children)
+            fs.read(node, 0, 64)
+            n += 1
+        counts.append(("read", n))
+
+    def writer(w):
+        rng = random.Random(w)
+        n = 0
+        while not stop.is_set():
+            node = fs.resolve(rng.choice(writable[w]))
+            fs.append(node, b"x" * rng.randrange(1, 512))
+            if node.size > 4096:
+                fs.truncate(node, 0)
+            n += 1
+        counts.append(("write", n))
+
+    workers = [threading.Thread(target=reader, args=(i,)) for i in range(threads)]
+    workers += [threading.Thread(target=writer, args=(w,)) for w in range(writers)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+    drift = fs.fsck()
+    if drift:
+        raise AssertionError(f"totais divergentes após o teste concorrente: {drift[:3]}")
+    return {
+        "leituras": (sum(n for kind, n in counts if kind == "read"), elapsed),
+        "escritas": (sum(n for kind, n in counts if kind == "write"), elapsed),
+    }
+
+
+def bench_browse(dirs: int, files: int, cache_nodes: int = 1_000):
+    """Abre uma imagem com dirs pastas de files arquivos e navega por ela.
+
+    Mede o tempo para abrir a imagem e listar uma pasta, com os nós lidos,
+    e o de percorrer todas as pastas com o orçamento cache_nodes, com o
+    maior número de nós em memória durante o percurso.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "disco.img")
+        fs = FileSystem(DiskImage.create(path, 16 * 1024 * 1024, inode_count=dirs * (files + 1) + 16))
+        with fs.batch():
+            for d in range(dirs):
+                fs.cd("/")
+                fs.mkdir(f"pasta{d}")
+                fs.cd(f"/pasta{d}")
+                for f in range(files):
+                    fs.touch(f"arquivo{f}.txt")
+        fs.close()
+
+        start = time.perf_counter()
+        fs = FileSystem(DiskImage(path), cache_nodes=cache_nodes)
+        fs.cd(f"/pasta{dirs // 2}")
+        fs.ls()
+        t_open = time.perf_counter() - start
+        opened = len(fs.image.nodes)
+
+        peak = 0
+        start = time.perf_counter()
+        for d in range(dirs):
+            fs.cd(f"/pasta{d}")
+            fs.ls()
+            peak = max(peak, len(fs.image.nodes))
+        t_walk = time.perf_counter() - start
+        fs.close()
+    return {"abrir": (opened, t_open), "percorrer": (peak, t_walk)}
+
+
+def bench_page_cache(policy: str, pages: int, files: int = 64, reads: int = 20_000):
+    """Mede o cache de páginas com a política e a capacidade dadas.
+
+    A carga mistura leituras aleatórias de 1 KiB concentradas em um quinto
+    dos arquivos (80% dos acessos) com varreduras sequenciais de arquivos
+    inteiros, que poluem o cache. Retorna a vazão das leituras e as
+    estatísticas do cache.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "disco.img")
+        DiskImage.create(path, 1024 * 1024).close()
+        fs = FileSystem(DiskImage(path, cache_pages=pages, cache_policy=policy))
+        nodes = []
+        for f in range(files):
+            node = fs.touch(f"arquivo{f}")
+            fs.write(node, 0, bytes([f]) * 8192)
+            nodes.append(node)
+        fs.content_index.wait()
+        fs.image.cache.drop()
+        hot = nodes[:files // 5]
+        rng = random.Random(0)
+        start = time.perf_counter()
+        for i in range(reads):
+            if i % 1000 == 999:
+                scanned = rng.choice(nodes)
+                for offset in range(0, 8192, 1024):
+                    fs.read(scanned, offset, 1024)
+            node = rng.choice(hot) if rng.random() < 0.8 else rng.choice(nodes)
+            fs.read(node, rng.randrange(8) * 1024, 1024)
+        elapsed = time.perf_counter() - start
+        stats = fs.cache_stats()
+        fs.close()
+    return reads, elapsed, stats
+
+
+def _dict_layout(cls, *bases):
+    """Cópia do dataclass de nó com __dict__ por instância, o layout anterior aos __slots__."""
+    fields = []
+    for f in dataclasses.fields(cls):
+        kwargs = {"init": f.init, "repr": f.repr}
+        if f.default is not dataclasses.MISSING:
+            kwargs["default"] = f.default
+        if f.default_factory is not dataclasses.MISSING:
+            kwargs["default_factory"] = f.default_factory
+        fields.append((f.name, f.type, dataclasses.field(**kwargs)))
+    return dataclasses.make_dataclass(cls.__name__ + "ComDict", fields, eq=False)
+
+
+class _DictData:
+    """MemoryData sem __slots__, com os mesmos atributos."""
+
+    def __init__(self, store):
+        self.store = store
+        self.chunk_size = CHUNK_SIZE
+        self.chunks = []
+        self.length = 0
+
+
+def _build_tree(n: int, file_cls, dir_cls, data_cls, separate_times: bool, fanout: int = 1000):
+    """Monta uma árvore com n nós em diretórios de até fanout filhos, sem o FileSystem."""
+    store = ChunkStore()
+    root = dir_cls(name="C:")
+    nodes = [root]
+    directory = root
+    for i in range(1, n):
+        if i % fanout == 1:
+            node = dir_cls(name=f"pasta{i}", parent=root)
+            root._children[node.name] = node
+            directory = node
+        else:
+            node = file_cls(name=f"arquivo{i}.txt", parent=directory, data=data_cls(store))
+            directory._children[node.name] = node
+        if separate_times:
+            # Como antes: um float por data
+            node.mtime = time.time()
+            node.atime = time.time()
+        nodes.append(node)
+    return nodes
+
+
+def bench_memory(n: int):
+    """Compara com tracemalloc a memória por nó dos nós com __slots__ e com __dict__.
+
+    Mede só a árvore (nós, nomes, datas, dicionários de filhos e objetos
+    de conteúdo); os índices do FileSystem ficam de fora. Retorna, para
+    cada layout, (bytes por nó, tempo de montagem).
+    """
+    layouts = {
+        "slots": (FileNode, DirectoryNode, MemoryData, False),
+        "dict": (_dict_layout(FileNode), _dict_layout(DirectoryNode), _DictData, True),
+    }
+    results = {}
+    for layout, args in layouts.items():
+        tracemalloc.start()
+        start = time.perf_counter()
+        nodes = _build_tree(n, *args)
+        elapsed = time.perf_counter() - start
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del nodes
+        results[layout] = (current / n, elapsed)
+    return results
+
+
+def bench_metrics(n: int = 20_000):
+    """Mede touch e stat no mesmo sistema, com as métricas desligadas e depois ligadas."""
+    fs = FileSystem()
+    results = {}
+    for label in ("desligadas", "ligadas"):
+        if label == "ligadas":
+            fs.enable_metrics()
+        fs.mkdir(label)
+        fs.cd(label)
+        start = time.perf_counter()
+        for i in range(n):
+            fs.touch(f"arq{i}")
+        t_touch = time.perf_counter() - start
+        nodes = list(fs.cwd.children.values())
+        start = time.perf_counter()
+        for node in nodes:
+            fs.stat(node)
+        t_stat = time.perf_counter() - start
+        fs.cd("/")
+        results[label] = {"touch": (n, t_touch), "stat": (len(nodes), t_stat)}
+    return results
+
+
+# Suíte de regressão: árvores sintéticas reprodutíveis, resultados em JSON
+SUITE_SEED = 1234
+SUITE_REPEATS = 3  # cada medida fica com a melhor de algumas rodadas
+SUITE_TOLERANCE = 0.25  # queda de vazão (ou aumento de memória) aceita em relação à base
+SUITE_DISK_SIZE = 256 * 1024 * 1024
+SUITE_WORDS = ("disco", "bloco", "inode", "arquivo", "pasta", "journal", "cache", "página",
+               "lixeira", "cópia", "índice", "trava")
+
+
+def _synthetic_tree(shape: str, scale: int = 1):
+    """Monta a árvore sintética 'larga', 'profunda' ou 'mista'.
+
+    larga: uma pasta com 5000 arquivos vazios; profunda: uma cadeia de 200
+    pastas com 5 arquivos em cada nível; mista: 3 níveis de 10 pastas com 2
+    arquivos de texto de 0 a 8 KiB em cada folha. scale multiplica o número
+    de arquivos (larga), de níveis (profunda) ou de pastas na raiz (mista).
+    Retorna o sistema e os caminhos das pastas e dos arquivos criados.
+    """
+    rng = random.Random(SUITE_SEED)
+    fs = FileSystem()
+    dirs, files = [], []
+    if shape == "larga":
+        dirs.append("/larga/")
+        files += [f"/larga/arquivo{i}.txt" for i in range(5_000 * scale)]
+    elif shape == "profunda":
+        path = ""
+        for level in range(200 * scale):
+            path += f"/nivel{level}"
+            dirs.append(path + "/")
+            files += [f"{path}/arquivo{i}.txt" for i in range(5)]
+    elif shape == "mista":
+        level = [""]
+        for depth in range(3):
+            level = [f"{parent}/pasta{i}" for parent in level for i in range(10 * (scale if depth == 0 else 1))]
+            dirs += [path + "/" for path in level]
+        files += [f"{leaf}/arquivo{i}.txt" for leaf in level for i in range(2)]
+    else:
+        raise ValueError(f"Forma de árvore desconhecida: '{shape}'")
+    fs.bulk_create(dirs + files)
+    if shape == "mista":
+        # Em um lote, o indexador de conteúdo só acorda no fim
+        with fs.batch():
+            for path in files:
+                text = " ".join(rng.choices(SUITE_WORDS, k=rng.choice((0, 16, 128, 1024))))
+                if text:
+                    fs.write(fs.resolve(path), 0, text.encode())
+        # A indexação de conteúdo em segundo plano não deve disputar as medidas
+        fs.content_index.wait()
+    return fs, [d.rstrip("/") for d in dirs], files
+
+
+def _suite_mkdir(fs, rng, dirs, files):
+    fs.cd(dirs[-1])
+    for i in range(1_000):
+        fs.mkdir(f"nova{i}")
+    return 1_000
+
+
+def _suite_touch(fs, rng, dirs, files):
+    fs.cd(dirs[-1])
+    for i in range(1_000):
+        fs.touch(f"nova{i}.txt")
+    return 1_000
+
+
+def _suite_cd(fs, rng, dirs, files):
+    targets = [rng.choice(dirs) for _ in range(10_000)]
+    for path in targets:
+        fs.cd(path)
+    return len(targets)
+
+
+def _suite_ls(fs, rng, dirs, files):
+    count = 0
+    for _ in range(2_000):
+        fs.cd(rng.choice(dirs))
+        count += len(fs.ls())
+    return count  # entradas listadas
+
+
+def _suite_stat(fs, rng, dirs, files):
+    nodes = [fs.resolve(rng.choice(files)) for _ in range(10_000)]
+    for node in nodes:
+        fs.stat(node)
+    return len(nodes)
+
+
+def _suite_rm_trash(fs, rng, dirs, files):
+    victims = rng.sample(files, min(1_000, len(files)))
+    for path in victims:
+        fs.rm(path)
+    return len(victims)
+
+
+def _suite_rm_permanent(fs, rng, dirs, files):
+    victims = rng.sample(files, min(1_000, len(files)))
+    for path in victims:
+        fs.rm(path, to_trash=False)
+    return len(victims)
+
+
+def _suite_restore(fs, rng, dirs, files):
+    victims = rng.sample(files, min(1_000, len(files)))
+    nodes = [fs.resolve(path) for path in victims]
+    for path in victims:
+        fs.rm(path)
+    # Nomes repetidos ganham sufixo na lixeira
+    names = [node.name for node in nodes]
+    # Só a restauração é cronometrada
+    start = time.perf_counter()
+    for name in names:
+        fs.restore_from_trash(name)
+    return len(names), time.perf_counter() - start
+
+
+def _suite_copy(fs, rng, dirs, files):
+    source = fs.resolve(dirs[0])
+    target = fs.resolve(dirs[0].rsplit("/", 1)[0] or "/")
+    copy = fs.copy_node(source, target)
+    # Percorrer a cópia materializa os diretórios preguiçosos
+    return sum(1 for _ in filesystem.walk(copy))  # nós copiados
+
+
+def _suite_rename(fs, rng, dirs, files):
+    # Vai e volta com a maior subárvore: o custo não depende do tamanho dela
+    fs.bulk_create(["/destino/"])
+    node = fs.resolve(dirs[0])
+    home = node.parent
+    start = time.perf_counter()
+    for _ in range(500):
+        fs.rename(node, "/destino")
+        fs.rename(node, home)
+    return 1_000, time.perf_counter() - start
+
+
+def _suite_find(fs, rng, dirs, files):
+    for _ in range(1_000):
+        fs.find(f"arquivo{rng.randrange(5)}", limit=100)
+    return 1_000
+
+
+def _suite_search(fs, rng, dirs, files):
+    for _ in range(200):
+        fs.search_content(" ".join(rng.sample(SUITE_WORDS, 2)))
+    return 200
+
+
+def _suite_path(fs, rng, dirs, files):
+    nodes = [fs.resolve(rng.choice(files)) for _ in range(1_000)]
+    count = 0
+    for _ in range(100):
+        # Metade das leituras depois de uma invalidação, como após um rename
+        filesystem.invalidate_paths()
+        for node in nodes:
+            node.path
+            node.path
+        count += 2 * len(nodes)
+    return count
+
+
+SUITE_OPERATIONS = {
+    "mkdir": _suite_mkdir,
+    "touch": _suite_touch,
+    "cd": _suite_cd,
+    "ls": _suite_ls,
+    "stat": _suite_stat,
+    "rm_lixeira": _suite_rm_trash,
+    "rm_definitivo": _suite_rm_permanent,
+    "restaurar": _suite_restore,
+    "copy_node": _suite_copy,
+    "rename": _suite_rename,
+    "find": _suite_find,
+    "search_content": _suite_search,
+    "path": _suite_path,
+}
+SUITE_SHAPES = ("larga", "profunda", "mista")
+
+
+def bench_suite(scale: int = 1, shapes=SUITE_SHAPES, operations=None) -> dict:
+    """Roda as operações da suíte em cada árvore sintética.
+
+    Cada operação recebe uma árvore nova (a montagem não é cronometrada)
+    e fica com a melhor de SUITE_REPEATS rodadas. A memória de pico de cada
+    árvore é medida com tracemalloc em uma montagem à parte, para não pesar
+    nas vazões. Retorna {"forma/operação": {"ops", "segundos", "ops_por_s"}}
+    mais {"forma/memoria_pico": {"bytes", "bytes_por_no"}}.
+    """
+    results = {}
+    for shape in shapes:
+        tracemalloc.start()
+        fs, dirs, files = _synthetic_tree(shape, scale)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        nodes = len(dirs) + len(files) + 2
+        results[f"{shape}/memoria_pico"] = {"bytes": peak, "bytes_por_no": peak / nodes}
+        fs.close()
+        del fs
+        for op in operations or SUITE_OPERATIONS:
+            best = None
+            for repeat in range(SUITE_REPEATS):
+                fs, dirs, files = _synthetic_tree(shape, scale)
+                rng = random.Random(SUITE_SEED + repeat)
+                start = time.perf_counter()
+                outcome = SUITE_OPERATIONS[op](fs, rng, dirs, files)
+                elapsed = time.perf_counter() - start
+                if isinstance(outcome, tuple):
+                    count, elapsed = outcome
+                else:
+                    count = outcome
+                fs.close()
+                if best is None or elapsed < best[1]:
+                    best = (count, elapsed)
+            count, elapsed = best
+            results[f"{shape}/{op}"] = {
+                "ops": count,
+                "segundos": elapsed,
+                "ops_por_s": count / elapsed if elapsed > 0 else float("inf"),
+            }
+    return results
+
+
+def compare_suite(results: dict, baseline: dict, tolerance: float = SUITE_TOLERANCE) -> list:
+    """Compara os resultados com uma base salva.
+
+    Regressão é uma vazão abaixo de (1 - tolerance) vezes a da base ou uma
+    memória de pico acima de (1 + tolerance) vezes. Retorna linhas
+    (chave, base, atual, variação, regrediu) para as chaves presentes nos dois.
+    """
+    rows = []
+    for key, base in baseline.items():
+        current = results.get(key)
+        if current is None:
+            continue
+        if "bytes" in base:
+            change = current["bytes"] / base["bytes"] - 1 if base["bytes"] else 0.0
+            rows.append((key, base["bytes"], current["bytes"], change, change > tolerance))
+        else:
+            change = current["ops_por_s"] / base["ops_por_s"] - 1 if base["ops_por_s"] else 0.0
+            rows.append((key, base["ops_por_s"], current["ops_por_s"], change, change < -tolerance))
+    return rows
+
+
+def run_suite(scale: int = 1, output=None, baseline=None, tolerance: float = SUITE_TOLERANCE) -> bool:
+    """Roda a suíte, grava o JSON em output e compara com o JSON baseline; False se houve regressão."""
+    previous_size = filesystem.MAX_DISK_SIZE
+    filesystem.MAX_DISK_SIZE = SUITE_DISK_SIZE
+    try:
+        results = bench_suite(scale)
+    finally:
+        filesystem.MAX_DISK_SIZE = previous_size
+    report = {
+        "versao": 1,
+        "python": platform.python_version(),
+        "maquina": platform.machine(),
+        "escala": scale,
+        "repeticoes": SUITE_REPEATS,
+        "resultados": results,
+    }
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if baseline is None:
+        print(f"{'medida':<26} {'vazão':>20}")
+        for key, result in results.items():
+            if "bytes" in result:
+                print(f"{key:<26} {result['bytes'] / 2**20:>13,.1f} MiB ({result['bytes_por_no']:,.0f} bytes/nó)")
+            else:
+                print(f"{key:<26} {_throughput(result['ops'], result['segundos'])}")
+        return True
+    with open(baseline, encoding="utf-8") as f:
+        base = json.load(f)
+    if base.get("escala") != scale:
+        raise ValueError(f"A base foi medida com escala {base.get('escala')}, não {scale}")
+    rows = compare_suite(results, base["resultados"], tolerance)
+    print(f"{'medida':<26} {'base':>14} {'atual':>14} {'variação':>9}")
+    for key, before, after, change, regressed in rows:
+        mark = "  REGRESSÃO" if regressed else ""
+        print(f"{key:<26} {before:>14,.0f} {after:>14,.0f} {change:>+9.1%}{mark}")
+    regressions = [row for row in rows if row[4]]
+    if regressions:
+        print(f"\n{len(regressions)} regressões acima da tolerância de {tolerance:.0%}", file=sys.stderr)
+    return not regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do sistema de arquivos")
+    parser.add_argument("--suite", action="store_true",
+                        help="roda só a suíte de regressão sobre árvores sintéticas")
+    parser.add_argument("--json", metavar="ARQUIVO", help="grava os resultados da suíte em JSON")
+    parser.add_argument("--base", metavar="ARQUIVO",
+                        help="compara a suíte com um JSON salvo antes; sai com código 1 se houver regressão")
+    parser.add_argument("--tolerancia", type=float, default=SUITE_TOLERANCE,
+                        help="variação aceita em relação à base (padrão: %(default)s)")
+    parser.add_argument("--escala", type=int, default=1, help="multiplica o tamanho das árvores da suíte")
+    args = parser.parse_args(argv)
+
+    # Os benchmarks precisam de diretórios maiores que o limite didático
+    previous_limit = filesystem.MAX_CHILDREN
+    filesystem.MAX_CHILDREN = None
+    try:
+        if args.suite or args.json or args.base:
+            return 0 if run_suite(args.escala, args.json, args.base, args.tolerancia) else 1
+        print(f"{'filhos':>8}  {'operação':<10} {'vazão':>20}")
+        for n in SIZES:
+            for op, (count, elapsed) in bench_children(n).items():
+                print(f"{n:>8}  {op:<10} {_throughput(count, elapsed)}")
+        print()
+        print(f"{'profund.':>8}  {'operação':<10} {'vazão':>20}")
+        for depth in (1, 10, 100):
+            for op, (count, elapsed) in bench_paths(depth).items():
+                print(f"{depth:>8}  {op:<10} {_throughput(count, elapsed)}")
+        print()
+        print(f"{'threads':>8}  {'operação':<10} {'vazão':>20}")
+        for threads in (1, 2, 4, 8):
+            for op, (count, elapsed) in bench_readers(threads).items():
+                print(f"{threads:>8}  {op:<10} {_throughput(count, elapsed)}")
+        print()
+        print(f"{'pastas':>8}  {'operação':<10} {'nós em memória':>15} {'tempo':>9}")
+        for dirs in (10, 100):
+            for op, (nodes, elapsed) in bench_browse(dirs, 100).items():
+                print(f"{dirs:>8}  {op:<10} {nodes:>15,} {elapsed:>8.3f}s")
+        print()
+        print(f"{'páginas':>8}  {'política':<10} {'vazão':>20} {'acertos':>8} {'antecip.':>9}")
+        for pages in (64, 256):
+            for policy in ("lru", "clock", "arc"):
+                count, elapsed, stats = bench_page_cache(policy, pages)
+                print(f"{pages:>8}  {policy:<10} {_throughput(count, elapsed)} {stats['hit_rate']:>8.1%}"
+                      f" {stats['read_ahead_hits']:>9,}")
+        print()
+        print(f"{'métricas':>10}  {'operação':<10} {'vazão':>20}")
+        for label, ops in bench_metrics().items():
+            for op, (count, elapsed) in ops.items():
+                print(f"{label:>10}  {op:<10} {_throughput(count, elapsed)}")
+        print()
+        print(f"{'nós':>10}  {'layout':<6} {'bytes/nó':>9} {'5M nós':>10} {'montagem':>9}")
+        for n in (10_000, 100_000):
+            results = bench_memory(n)
+            for layout, (per_node, elapsed) in results.items():
+                print(f"{n:>10,}  {layout:<6} {per_node:>9,.0f} {per_node * 5e6 / 2**20:>6,.0f} MiB {elapsed:>8.2f}s")
+            print(f"{'':>10}  economia com slots: {1 - results['slots'][0] / results['dict'][0]:.0%}")
+    finally:
+        filesystem.MAX_CHILDREN = previous_limit
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,380 @@
+"""Interpretador de comandos do sistema de arquivos, sem interface gráfica.
+
+Traduz comandos no estilo do shell em chamadas ao FileSystem:
+
+    mkdir [-p] caminho...           touch caminho...
+    rm [-r] [-f] [--lixeira] caminho...
+    mv origem destino               cp [-r] origem destino
+    ls [-l] [caminho]               find [caminho] [-name padrão] [-type f|d]
+    du [-s] [caminho...]            stat caminho...
+    cd caminho                      pwd
+
+Execute com `python comandos.py [imagem] [script]` a partir da pasta src:
+sem imagem (ou com '-'), o sistema de arquivos fica em memória; sem script, os comandos
+são lidos da entrada padrão (com um prompt, se ela for um terminal). Linhas
+em branco e iniciadas por '#' são ignoradas.
+
+Scripts longos rodam em lotes de SCRIPT_BATCH comandos, cada lote uma
+transação na imagem e um único lote de eventos. Sequências de `mkdir -p` e
+`touch` viram uma só chamada a FileSystem.bulk_create, e sequências de
+`rm -r` uma só chamada a bulk_remove, que resolvem cada diretório pai e
+atualizam os totais uma vez por lote; se o lote falhar, os comandos são
+refeitos um a um para apontar a linha com erro.
+"""
+import itertools
+import os
+import shlex
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, Optional, TextIO, Tuple
+
+import filesystem
+from filesystem import DirectoryNode, FileSystem, walk
+from persistencia import DiskImage
+
+SCRIPT_BATCH = 1000  # comandos por transação ao executar um script
+
+COMANDOS: Dict[str, Callable[["Interpretador", List[str]], None]] = {}
+
+
+def comando(name: str):
+    """Registra a função como o comando name."""
+    def register(fn):
+        COMANDOS[name] = fn
+        return fn
+    return register
+
+
+class ErroDeComando(Exception):
+    """Uso incorreto de um comando (opção desconhecida, argumentos faltando)."""
+
+
+def _opcoes(args: List[str], flags: str = "", long: Tuple[str, ...] = (),
+            valued: Tuple[str, ...] = ()) -> Tuple[set, Dict[str, str], List[str]]:
+    """Separa as opções dos operandos.
+
+    flags são opções de uma letra, que podem vir juntas (-rf); long são
+    opções longas (--lixeira); valued são opções seguidas de um valor
+    (-name padrão). Retorna (opções, valores, operandos).
+    """
+    options, values, operands = set(), {}, []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg in valued:
+            if i + 1 == len(args):
+                raise ErroDeComando(f"{arg} precisa de um valor")
+            values[arg] = args[i + 1]
+            i += 2
+            continue
+        if arg.startswith("--"):
+            if arg[2:] not in long:
+                raise ErroDeComando(f"opção desconhecida: {arg}")
+            options.add(arg[2:])
+        elif arg.startswith("-") and len(arg) > 1:
+            for flag in arg[1:]:
+                if flag not in flags:
+                    raise ErroDeComando(f"opção desconhecida: -{flag}")
+                options.add(flag)
+        else:
+            operands.append(arg)
+        i += 1
+    return options, values, operands
+
+
+def _data(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M", time.localtime(timestamp))
+
+
+def _linha(line: str) -> List[str]:
+    """Quebra a linha em palavras; shlex só quando há aspas, escapes ou comentários."""
+    if '"' in line or "'" in line or "\\" in line or "#" in line:
+        return shlex.split(line, comments=True)
+    return line.split()
+
+
+def _acumulavel(words: List[str]) -> Optional[str]:
+    """Lote de bulk_create ou bulk_remove em que o comando pode entrar, ou None."""
+    name, args = words[0], words[1:]
+    try:
+        if name == "touch" or name == "mkdir":
+            options, _, operands = _opcoes(args, "p" if name == "mkdir" else "")
+            if operands and (name == "touch" or "p" in options):
+                return "criar"
+        elif name == "rm":
+            options, _, operands = _opcoes(args, "rf")
+            if operands and "r" in options:
+                return "remover-f" if "f" in options else "remover"
+    except ErroDeComando:
+        pass  # o erro aparece ao executar a linha sozinha
+    return None
+
+
+class Interpretador:
+    """Executa comandos sobre um FileSystem, escrevendo a saída em out."""
+
+    def __init__(self, fs: FileSystem, out: TextIO = sys.stdout):
+        self.fs = fs
+        self.out = out
+
+    def print(self, text: str):
+        self.out.write(text + "\n")
+
+    def executar(self, line: str):
+        """Executa uma linha de comando; erros são levantados para quem chamou."""
+        words = _linha(line)
+        if not words:
+            return
+        name, args = words[0], words[1:]
+        fn = COMANDOS.get(name)
+        if fn is None:
+            raise ErroDeComando(f"comando desconhecido: {name}")
+        fn(self, args)
+
+    def executar_script(self, lines: Iterable[str], stop_on_error: bool = False) -> int:
+        """Executa as linhas em lotes de SCRIPT_BATCH; retorna o número de erros.
+
+        Cada erro é relatado com o número da linha na saída de erros.
+        """
+        errors = 0
+        numbered = enumerate(lines, 1)
+        while True:
+            chunk = list(itertools.islice(numbered, SCRIPT_BATCH))
+            if not chunk:
+                return errors
+            pending: List[Tuple[int, str, str, List[str]]] = []  # (linha, lote, texto, palavras)
+            with self.fs.batch():
+                for lineno, line in chunk:
+                    words = _linha(line)
+                    if not words:
+                        continue
+                    kind = _acumulavel(words)
+                    if pending and kind != pending[-1][1]:
+                        errors += self._descarregar(pending)
+                    if kind is not None:
+                        pending.append((lineno, kind, line, words))
+                    else:
+                        errors += self._linha_isolada(lineno, line)
+                    if errors and stop_on_error:
+                        return errors
+                errors += self._descarregar(pending)
+            if errors and stop_on_error:
+                return errors
+
+    def _descarregar(self, pending) -> int:
+        """Executa os comandos acumulados em uma única chamada em lote; retorna os erros."""
+        if not pending:
+            return 0
+        items, pending[:] = list(pending), []
+        kind = items[0][1]
+        try:
+            if kind == "criar":
+                paths = []
+                for _, _, _, words in items:
+                    for path in _opcoes(words[1:], "p")[2]:
+                        path = path.rstrip("/")
+                        if words[0] == "mkdir":
+                            # mkdir -p: cada diretório do caminho, para o lote não criar pais de um touch
+                            paths.extend(path[:i + 1] for i, c in enumerate(path) if c == "/" and i)
+                            paths.append(path + "/")
+                        else:
+                            paths.append(path)
+                self.fs.bulk_create(paths, parents=False, exist_ok=True)
+            else:
+                paths = [p for _, _, _, words in items for p in _opcoes(words[1:], "rf")[2]]
+                self.fs.bulk_remove(paths, missing_ok=kind == "remover-f")
+        except (ErroDeComando, OSError, MemoryError, ValueError):
+            # Refaz um a um para apontar a linha que falhou
+            return sum(self._linha_isolada(lineno, line) for lineno, _, line, _ in items)
+        return 0
+
+    def _linha_isolada(self, lineno: int, line: str) -> int:
+        try:
+            self.executar(line)
+        except (ErroDeComando, OSError, MemoryError, ValueError) as e:
+            sys.stderr.write(f"linha {lineno}: {e}\n")
+            return 1
+        return 0
+
+
+# Comandos
+@comando("mkdir")
+def comando_mkdir(shell: Interpretador, args: List[str]):
+    options, _, paths = _opcoes(args, "p")
+    if not paths:
+        raise ErroDeComando("uso: mkdir [-p] caminho...")
+    shell.fs.bulk_create([p.rstrip("/") + "/" for p in paths], parents="p" in options, exist_ok="p" in options)
+
+
+@comando("touch")
+def comando_touch(shell: Interpretador, args: List[str]):
+    _, _, paths = _opcoes(args)
+    if not paths:
+        raise ErroDeComando("uso: touch caminho...")
+    shell.fs.bulk_create([p.rstrip("/") for p in paths], parents=False, exist_ok=True)
+
+
+@comando("rm")
+def comando_rm(shell: Interpretador, args: List[str]):
+    options, _, paths = _opcoes(args, "rf", ("lixeira",))
+    if not paths:
+        raise ErroDeComando("uso: rm [-r] [-f] [--lixeira] caminho...")
+    fs = shell.fs
+    for path in paths:
+        try:
+            node = fs.resolve(path)
+        except FileNotFoundError:
+            if "f" in options:
+                continue
+            raise
+        if isinstance(node, DirectoryNode) and "r" not in options:
+            raise IsADirectoryError(f"{node.path} é um diretório (use rm -r)")
+        if "lixeira" in options:
+            fs.rm(path)
+        else:
+            fs.bulk_remove([path])
+
+
+@comando("mv")
+def comando_mv(shell: Interpretador, args: List[str]):
+    _, _, paths = _opcoes(args)
+    if len(paths) != 2:
+        raise ErroDeComando("uso: mv origem destino")
+    fs = shell.fs
+    node = fs.resolve(paths[0])
+    target, name = _destino(fs, paths[1], node)
+    fs.rename(node, target, name=name)
+
+
+@comando("cp")
+def comando_cp(shell: Interpretador, args: List[str]):
+    options, _, paths = _opcoes(args, "r")
+    if len(paths) != 2:
+        raise ErroDeComando("uso: cp [-r] origem destino")
+    fs = shell.fs
+    node = fs.resolve(paths[0])
+    if isinstance(node, DirectoryNode) and "r" not in options:
+        raise IsADirectoryError(f"{node.path} é um diretório (use cp -r)")
+    target, name = _destino(fs, paths[1], node)
+    fs.copy_node(node, target, name=name)
+
+
+def _destino(fs: FileSystem, path: str, node) -> Tuple[DirectoryNode, str]:
+    """Diretório e nome de destino de mv e cp: dentro de um diretório existente, ou um caminho novo."""
+    try:
+        target = fs.resolve(path)
+    except FileNotFoundError:
+        return fs._locate(path.rstrip("/"))
+    if not isinstance(target, DirectoryNode):
+        raise FileExistsError(f"{target.path} já existe")
+    if node.name in target.children:
+        raise FileExistsError(f"{target.children[node.name].path} já existe")
+    return target, node.name
+
+
+@comando("ls")
+def comando_ls(shell: Interpretador, args: List[str]):
+    options, _, paths = _opcoes(args, "l")
+    node = shell.fs.resolve(paths[0] if paths else ".")
+    children = list(node.children.values()) if isinstance(node, DirectoryNode) else [node]
+    for child in children:
+        if "l" in options:
+            kind = "d" if isinstance(child, DirectoryNode) else "-"
+            size = child.subtree_size if isinstance(child, DirectoryNode) else child.size
+            shell.print(f"{kind} {size:>10} {_data(child.mtime)} {child.name}")
+        else:
+            shell.print(child.name)
+
+
+@comando("find")
+def comando_find(shell: Interpretador, args: List[str]):
+    _, values, paths = _opcoes(args, valued=("-name", "-type"))
+    fs = shell.fs
+    root = fs.resolve(paths[0] if paths else ".")
+    kind = {"f": "file", "d": "dir", None: None}.get(values.get("-type"), "")
+    if kind == "":
+        raise ErroDeComando("-type aceita f ou d")
+    if "-name" in values:
+        # Pelo índice de nomes: só nós já carregados
+        found = fs.find(values["-name"], root, type=kind)
+    else:
+        found = [n for n in walk(root) if kind is None or n.kind == kind]
+    for path in sorted(n.path for n in found):
+        shell.print(path)
+
+
+@comando("du")
+def comando_du(shell: Interpretador, args: List[str]):
+    options, _, paths = _opcoes(args, "s")
+    for path in paths or ["."]:
+        node = shell.fs.resolve(path)
+        if not isinstance(node, DirectoryNode):
+            shell.print(f"{node.size:>10} {node.path}")
+            continue
+        # Os totais da subárvore são mantidos pelo FileSystem: nada é somado aqui
+        if "s" not in options:
+            # Pré-ordem invertida: subdiretórios antes dos pais, como no du
+            for n in reversed(list(walk(node))):
+                if isinstance(n, DirectoryNode) and n is not node:
+                    shell.print(f"{n.subtree_size:>10} {n.path}")
+        shell.print(f"{node.subtree_size:>10} {node.path}")
+
+
+@comando("stat")
+def comando_stat(shell: Interpretador, args: List[str]):
+    _, _, paths = _opcoes(args)
+    if not paths:
+        raise ErroDeComando("uso: stat caminho...")
+    for path in paths:
+        info = shell.fs.stat(shell.fs.resolve(path))
+        info.pop("children", None)
+        for key in ("ctime", "mtime", "atime"):
+            info[key] = _data(info[key])
+        shell.print("  ".join(f"{key}: {value}" for key, value in info.items()))
+
+
+@comando("cd")
+def comando_cd(shell: Interpretador, args: List[str]):
+    _, _, paths = _opcoes(args)
+    shell.fs.cd(paths[0] if paths else "/")
+
+
+@comando("pwd")
+def comando_pwd(shell: Interpretador, args: List[str]):
+    shell.print(shell.fs.cwd.path)
+
+
+def abrir(path: Optional[str] = None) -> FileSystem:
+    """Sistema de arquivos em memória, ou sobre a imagem em disco dada (criada se não existir)."""
+    if path is None:
+        return FileSystem()
+    image = DiskImage(path) if os.path.exists(path) else DiskImage.create(path)
+    return FileSystem(image)
+
+
+def main(argv: List[str]) -> int:
+    # Scripts criam diretórios bem maiores que o limite didático
+    filesystem.MAX_CHILDREN = None
+    fs = abrir(argv[1] if len(argv) > 1 and argv[1] != "-" else None)
+    shell = Interpretador(fs)
+    try:
+        if len(argv) > 2:
+            with open(argv[2], encoding="utf-8") as script:
+                return 1 if shell.executar_script(script) else 0
+        if not sys.stdin.isatty():
+            return 1 if shell.executar_script(sys.stdin) else 0
+        while True:
+            try:
+                line = input(f"{fs.cwd.path}$ ")
+            except EOFError:
+                return 0
+            try:
+                shell.executar(line)
+            except (ErroDeComando, OSError, MemoryError, ValueError) as e:
+                print(e, file=sys.stderr)
+    finally:
+        fs.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
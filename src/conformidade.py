@@ -0,0 +1,817 @@
+"""Testes de conformidade do FileSystem, os mesmos para todos os backends.
+
+A interface gráfica e os scripts usam o mesmo FileSystem, em memória ou
+sobre uma imagem em disco (persistencia.DiskImage); cada verificação
+abaixo roda uma vez em cada backend, para que os dois se comportem igual
+em contabilidade, lixeira, datas, cópias e eventos.
+
+Execute com `python conformidade.py` a partir da pasta src; a saída tem
+uma linha por verificação e backend, e o código de saída é 1 se alguma
+falhar.
+"""
+import contextlib
+import functools
+import os
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+import filesystem
+from eventos import CREATE, DELETE, MODIFY, MOVE, RESTORE, TRASH
+from filesystem import FileSystem
+from persistencia import DiskImage
+from tarefas import Cancelled, Job
+
+CHECKS = []
+
+
+def check(fn):
+    """Registra uma verificação fn(fs, reopen); reopen() fecha e reabre o fs, ou é None."""
+    CHECKS.append(fn)
+    return fn
+
+
+@contextlib.contextmanager
+def memory_backend():
+    yield FileSystem(), None
+
+
+@contextlib.contextmanager
+def image_backend(policy="lru"):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "disco.img")
+        DiskImage.create(path, filesystem.MAX_DISK_SIZE).close()
+        opened = [FileSystem(DiskImage(path, cache_policy=policy))]
+
+        def reopen():
+            opened[-1].close()
+            opened.append(FileSystem(DiskImage(path, cache_policy=policy)))
+            return opened[-1]
+
+        try:
+            yield opened[0], reopen
+        finally:
+            opened[-1].close()
+
+
+BACKENDS = {
+    "memória": memory_backend,
+    "imagem": image_backend,
+    "imagem/clock": functools.partial(image_backend, "clock"),
+    "imagem/arc": functools.partial(image_backend, "arc"),
+}
+
+
+def _assert_consistent(fs):
+    drift = fs.fsck()
+    assert not drift, f"fsck encontrou divergências: {drift[:3]}"
+
+
+@check
+def criar_e_resolver(fs, reopen):
+    fs.mkdir("docs")
+    fs.cd("docs")
+    fs.mkdir("sub")
+    node = fs.touch("a.txt", 10)
+    assert fs.resolve("/docs/a.txt") is node
+    assert fs.resolve("sub/../a.txt") is node
+    assert node.path == "/docs/a.txt"
+    assert sorted(fs.ls()) == ["a.txt", "sub"]
+    for name, exc in (("a.txt", FileExistsError), ("sub", FileExistsError)):
+        try:
+            fs.mkdir(name)
+        except exc:
+            pass
+        else:
+            raise AssertionError(f"mkdir de '{name}' existente não falhou")
+    _assert_consistent(fs)
+
+
+@check
+def nomes_invalidos(fs, reopen):
+    fs.bulk_create(["d/f"])
+    f = fs.resolve("/d/f")
+    attempts = [lambda name: fs.mkdir(name), lambda name: fs.touch(name),
+                lambda name: fs.rename(f, fs.root, name=name),
+                lambda name: fs.copy_node(f, fs.root, name=name)]
+    for name in ("", ".", "..", "a/b", "/x"):
+        for attempt in attempts:
+            try:
+                attempt(name)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"nome {name!r} foi aceito")
+    assert sorted(fs.root.children) == ["Lixeira", "d"] and f.parent is fs.resolve("/d")
+    _assert_consistent(fs)
+
+
+@check
+def nomes_da_interface(fs, reopen):
+    # A interface cria no diretório atual e remove pelo nome, que o rm trata como caminho
+    fs.mkdir("d")
+    fs.cd("/d")
+    names = ["a b", ".oculto", "..x", "x..", "nome.com.pontos", "ç", "a\\b"]
+    for i, name in enumerate(names):
+        if i % 2:
+            fs.mkdir(name)
+        else:
+            fs.touch(name, 3)
+        assert fs.resolve(name) is fs.cwd.children[name]
+    for name in names[:4]:
+        fs.rm(name)
+        fs.delete_from_trash(name)
+    for name in names[4:]:
+        fs.rm(name, to_trash=False)
+    assert not fs.cwd.children and not fs.trash.children
+    try:
+        fs.mkdir("a/b")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("a interface criou um nome com '/'")
+    _assert_consistent(fs)
+
+
+@check
+def nomes_longos(fs, reopen):
+    limit = filesystem.MAX_NAME
+    fs.bulk_create(["a/", "b/"])
+    fs.cd("/a")
+    fs.touch("n" * limit)
+    for attempt in (lambda: fs.touch("n" * (limit + 1)), lambda: fs.mkdir("ç" * (limit // 2 + 1)),
+                    lambda: fs.bulk_create(["/a/" + "x" * (limit + 1)]),
+                    lambda: fs.rename("/a/" + "n" * limit, "/b/" + "n" * (limit + 1))):
+        try:
+            attempt()
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("nome acima de MAX_NAME foi aceito")
+    # Sufixos de colisão que passam do limite falham antes de alterar a árvore
+    fs.rm("n" * limit)
+    fs.cd("/b")
+    fs.touch("n" * limit)
+    node = fs.touch("c" * (limit - 5))
+    for attempt in (lambda: fs.rm("n" * limit), lambda: fs.copy_node(node)):
+        try:
+            attempt()
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("sufixo acima de MAX_NAME foi aceito")
+    assert sorted(fs.ls()) == ["c" * (limit - 5), "n" * limit] and len(fs.trash.children) == 1
+    _assert_consistent(fs)
+    if reopen is not None:
+        fs = reopen()
+        assert sorted(fs.resolve("/b").children) == ["c" * (limit - 5), "n" * limit]
+        _assert_consistent(fs)
+
+
+@check
+def contabilidade(fs, reopen):
+    fs.mkdir("d")
+    node = fs.open("/d/f", create=True)
+    fs.write(node, 0, b"abc" * 100)
+    fs.append(node, b"xyz")
+    assert node.size == 303 and fs.read(node, 300) == b"xyz"
+    d = fs.resolve("/d")
+    assert (d.subtree_size, d.file_count, d.dir_count) == (303, 1, 0)
+    fs.truncate(node, 3)
+    assert fs.read(node) == b"abc"
+    assert fs.get_disk_usage() == 3 and fs.root.subtree_size == 3
+    _assert_consistent(fs)
+
+
+@check
+def lixeira(fs, reopen):
+    fs.mkdir("d")
+    fs.cd("/d")
+    first = fs.touch("x", 5)
+    fs.rm("x")
+    second = fs.touch("x", 7)
+    fs.rm("x")
+    assert set(fs.trash.children) == {"x", "x_1"}
+    assert fs.trash.children["x"] is first and fs.trash.children["x_1"] is second
+    # Itens na lixeira continuam ocupando espaço
+    assert fs.get_disk_usage() == 12
+    fs.restore_from_trash("x")
+    assert fs.resolve("/d/x") is first and first.ino not in fs.file_index.trashed
+    fs.restore_from_trash("x_1")
+    # O nome original está ocupado: a restauração escolhe outro
+    assert fs.resolve("/d/x_1") is second
+    assert not fs.trash.children
+    fs.cd("/")
+    for to_trash in (True, False):
+        try:
+            fs.rm("Lixeira", to_trash=to_trash)
+        except PermissionError:
+            pass
+        else:
+            raise AssertionError(f"rm da Lixeira (to_trash={to_trash}) não falhou")
+    assert fs.root.children["Lixeira"] is fs.trash and fs.trash.parent is fs.root
+    d = fs.resolve("/d")
+    try:
+        d.add_child(fs.root)
+    except OSError:
+        pass
+    else:
+        raise AssertionError("um diretório aceitou um ancestral como filho")
+    # A restauração falha antes que o item saia da lixeira
+    fs.cd("/d")
+    item = fs.touch("y", 3)
+    fs.rm("y")
+    for i in range(filesystem.MAX_CHILDREN - len(d.children)):
+        fs.touch(f"z{i}")
+    for target, error in ((fs.trash, PermissionError), (None, MemoryError)):
+        try:
+            fs.restore_from_trash("y", target)
+        except error:
+            pass
+        else:
+            raise AssertionError(f"restauração para {target} não falhou")
+        assert fs.trash.children["y"] is item and item.ino in fs.trash_store
+        _assert_consistent(fs)
+    fs.rm("z0", to_trash=False)
+    assert fs.restore_from_trash("y") is item and item.path == "/d/y"
+    _assert_consistent(fs)
+    # O que já está na lixeira só sai dela de vez
+    fs.cd("/")
+    fs.bulk_create(["e/f"])
+    fs.rm("e")
+    for path in ("/Lixeira/e", "/Lixeira/e/f"):
+        try:
+            fs.rm(path)
+        except PermissionError:
+            pass
+        else:
+            raise AssertionError(f"{path} foi para a lixeira de novo")
+    assert list(fs.trash.children) == ["e"]
+    assert fs.trash_store.get(fs.trash.children["e"].ino).original_path == "/e"
+    fs.rm("/Lixeira/e/f", to_trash=False)
+    # Nem se cria nada lá dentro: o item ficaria sem registro
+    fs.cd("/Lixeira")
+    attempts = [lambda: fs.touch("x"), lambda: fs.mkdir("x"), lambda: fs.open("/Lixeira/e/x", create=True)]
+    attempts += [lambda p=p: fs.bulk_create([p]) for p in ("/Lixeira/x", "/Lixeira/e/x", "/Lixeira/y/z")]
+    for attempt in attempts:
+        try:
+            attempt()
+        except PermissionError:
+            pass
+        else:
+            raise AssertionError("um nó foi criado na lixeira")
+    fs.cd("/")
+    assert list(fs.trash.children) == ["e"] and not fs.trash.children["e"].children
+    _assert_consistent(fs)
+    assert fs.purge_trash(0) == 1 and not fs.trash.children
+
+
+@check
+def lixeira_registros(fs, reopen):
+    fs.bulk_create(["a/b/f", "c/", "d/"])
+    fs.write(fs.resolve("/a/b/f"), 0, b"dados")
+    fs.rm("/a/b/f")
+    # A origem some por inteiro: a restauração recria o caminho
+    fs.rm("/a", to_trash=False)
+    record = fs.trash_store.get(fs.trash.children["f"].ino)
+    assert (record.original_path, record.size) == ("/a/b/f", 5), record
+    if reopen is not None:
+        fs = reopen()
+    node = fs.restore_from_trash("f")
+    assert node.path == "/a/b/f" and fs.read(node) == b"dados"
+    assert len(fs.trash_store) == 0
+    # A lixeira não tem limite de filhos, e sim uma cota em bytes
+    fs.trash_quota = None
+    for i in range(filesystem.MAX_CHILDREN + 2):
+        fs.cd("/c" if i % 2 else "/d")
+        fs.rm(fs.touch(f"f{i}", 4).name)
+    assert len(fs.trash.children) == filesystem.MAX_CHILDREN + 2
+    assert [r.original_path for r in fs.trash_store.oldest(2)] == ["/d/f0", "/c/f1"]
+    fs.trash_quota = 10
+    fs.cd("/d")
+    fs.rm(fs.touch("ultimo", 8).name)
+    fs.wait_purge()
+    # Os mais antigos saem primeiro, até caber na cota
+    assert list(fs.trash.children) == ["ultimo"] and fs.trash.subtree_size == 8
+    assert fs.get_disk_usage() == 5 + 8
+    fs.rm(fs.touch("vazio").name)
+    fs.mkdir("pasta")
+    fs.rm("pasta")
+    assert fs.purge_trash(0) == 3
+    assert not fs.trash.children and len(fs.trash_store) == 0
+    _assert_consistent(fs)
+
+
+@check
+def lixeira_subarvore(fs, reopen):
+    fs.bulk_create(["d/s/f", "d/g", "e/"])
+    fs.write(fs.resolve("/d/g"), 0, b"dados")
+    fs.rm("/d")
+    trashed = {n.path for n in fs.file_index.trashed_nodes()}
+    assert trashed == {"/Lixeira/d", "/Lixeira/d/s", "/Lixeira/d/s/f", "/Lixeira/d/g"}, trashed
+    if reopen is not None:
+        fs = reopen()
+        fs.resolve("/Lixeira/d/s/f")
+        assert len(fs.file_index.trashed_nodes()) == 4
+    fs.restore_from_trash("d")
+    assert not fs.file_index.trashed
+    fs.rm("/d")
+    fs.purge_trash(0)
+    assert not fs.file_index.trashed
+    _assert_consistent(fs)
+
+
+@check
+def remocao_definitiva(fs, reopen):
+    baseline = fs.get_disk_usage(physical=True)
+    blocks = fs.allocator.used_blocks
+    fs.mkdir("d")
+    fs.cd("/d")
+    node = fs.touch("f")
+    fs.write(node, 0, b"dados" * 1000)
+    fs.cd("/")
+    fs.rm("d", to_trash=False)
+    assert "d" not in fs.root.children and node.ino not in fs.file_index
+    # Quem ainda tem o nó em mãos não consegue mais alterá-lo
+    fs.bulk_create(["e/g"])
+    other = fs.resolve("/e/g")
+    fs.bulk_remove(["/e"])
+    for target in (node, other):
+        for attempt in (lambda: fs.write(target, 0, b"x" * 5000), lambda: fs.truncate(target, 100)):
+            try:
+                attempt()
+            except FileNotFoundError:
+                pass
+            else:
+                raise AssertionError(f"{target.name} foi alterado depois de apagado")
+    assert fs.get_disk_usage(physical=True) == baseline
+    assert fs.allocator.used_blocks == blocks
+    _assert_consistent(fs)
+
+
+@check
+def datas(fs, reopen):
+    before = time.time()
+    fs.mkdir("d")
+    d = fs.resolve("/d")
+    assert before <= d.ctime <= d.mtime <= time.time()
+    root_mtime = fs.root.mtime
+    time.sleep(0.01)
+    fs.cd("/d")
+    node = fs.touch("f")
+    assert d.mtime > root_mtime, "criar um filho não atualizou o mtime do diretório"
+    mtime = node.mtime
+    time.sleep(0.01)
+    fs.write(node, 0, b"x")
+    assert node.mtime > mtime
+    fs.utime(node, atime=1000.0, mtime=2000.0)
+    assert (node.atime, node.mtime) == (1000.0, 2000.0)
+    assert node in fs.file_index.modified_since(1999.0, 2001.0)
+
+
+@check
+def copia(fs, reopen):
+    fs.mkdir("src")
+    fs.cd("/src")
+    node = fs.touch("f")
+    fs.write(node, 0, b"original")
+    fs.cd("/")
+    copy = fs.copy_node(fs.resolve("/src"))
+    again = fs.copy_node(fs.resolve("/src"))
+    assert (copy.name, again.name) == ("src - Cópia(1)", "src - Cópia(2)")
+    copied = fs.resolve(f"/{copy.name}/f")
+    fs.write(copied, 0, b"alterado")
+    assert fs.read(node) == b"original" and fs.read(copied) == b"alterado"
+    assert fs.get_disk_usage() == 3 * len(b"original")
+    # Copiar, esvaziar a lixeira e colar: a origem já não existe
+    src = fs.resolve("/src")
+    fs.rm("/src")
+    fs.purge_trash(0)
+    for source, target in ((node, fs.root), (src, fs.root), (copied, fs.trash)):
+        try:
+            fs.copy_node(source, target)
+        except (FileNotFoundError, PermissionError):
+            pass
+        else:
+            raise AssertionError(f"cópia de {source.name} para {target.name} não falhou")
+    assert not fs.trash.children and fs.get_disk_usage() == 2 * len(b"original")
+    _assert_consistent(fs)
+
+
+@check
+def remocao_em_lotes(fs, reopen):
+    fs.mkdir("d")
+    fs.cd("/d")
+    for i in range(4):
+        fs.mkdir(f"s{i}")
+        fs.cd(f"/d/s{i}")
+        for j in range(3):
+            fs.touch(f"f{j}", 10)
+        fs.cd("/d")
+    d = fs.resolve("/d")
+    job = Job("remoção")
+    # Cancela o job assim que o primeiro lote for entregue
+    watch = fs.watch(lambda events: job.cancel(), kinds=(DELETE,))
+    previous = filesystem.REMOVE_BATCH
+    filesystem.REMOVE_BATCH = 5
+    try:
+        fs.remove_tree(d, job)
+    except Cancelled:
+        pass
+    else:
+        raise AssertionError("remove_tree não parou ao ser cancelado")
+    finally:
+        filesystem.REMOVE_BATCH = previous
+        watch.close()
+    assert "d" in fs.root.children and d.file_count + d.dir_count == 16 - 5
+    _assert_consistent(fs)
+    fs.remove_tree(d)
+    assert "d" not in fs.root.children and fs.get_disk_usage() == 0
+    _assert_consistent(fs)
+
+
+@check
+def totais_concorrentes(fs, reopen):
+    baseline = fs.get_disk_usage(physical=True)
+    fs.bulk_create(["a/d/f", "c/"] + [f"e/g{i}" for i in range(8)])
+    f = fs.resolve("/a/d/f")
+    targets = [fs.resolve(f"/e/g{i}") for i in range(8)]
+    stop = threading.Event()
+    errors = []
+
+    def writer(nodes):
+        n = 0
+        while not stop.is_set():
+            n = n % 3000 + 1
+            for node in nodes:
+                try:
+                    fs.write(node, 0, b"x" * n)
+                    fs.truncate(node, n // 2)
+                except FileNotFoundError:
+                    pass  # apagado pela thread principal
+                except Exception as e:
+                    errors.append(e)
+                    return
+
+    threads = [threading.Thread(target=writer, args=(nodes,)) for nodes in ([f], targets)]
+    for t in threads:
+        t.start()
+    try:
+        # Escritas durante a movimentação e a remoção dos seus ancestrais
+        for i in range(100):
+            fs.rename("/c/d" if i % 2 else "/a/d", "/a" if i % 2 else "/c")
+        fs.bulk_remove([f"/e/g{i}" for i in range(0, 8, 2)])
+        for i in range(1, 8, 2):
+            fs.rm(f"/e/g{i}", to_trash=False)
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    assert not errors, errors
+    _assert_consistent(fs)
+    for name in ("a", "c", "e"):
+        fs.rm(name, to_trash=False)
+    assert fs.get_disk_usage(physical=True) == baseline
+    _assert_consistent(fs)
+
+
+@check
+def caminhos_em_cache(fs, reopen):
+    fs.bulk_create(["a/b/f"])
+    get_child = filesystem.DirectoryNode.get_child
+    removed = []
+
+    def racing(directory, name):
+        # Apaga o arquivo logo depois que a resolução abaixo o encontrou
+        child = get_child(directory, name)
+        if name == "f" and not removed:
+            removed.append(child)
+            fs.rm("/a/b/f", to_trash=False)
+        return child
+
+    filesystem.DirectoryNode.get_child = racing
+    try:
+        assert fs.resolve("/a/b/f") is removed[0]
+    finally:
+        filesystem.DirectoryNode.get_child = get_child
+    # O nó visto no meio da alteração não fica no cache de caminhos
+    try:
+        fs.resolve("/a/b/f")
+    except FileNotFoundError:
+        pass
+    else:
+        raise AssertionError("resolve devolveu um nó já apagado")
+    _assert_consistent(fs)
+
+
+@check
+def renomear(fs, reopen):
+    fs.bulk_create(["a/b/f", "a/g", "c/"])
+    b = fs.resolve("/a/b")
+    received = []
+    fs.watch(received.extend)
+    assert fs.rename("/a/b", "/c") is b and b.path == "/c/b"
+    assert fs.resolve("/c/b/f").path == "/c/b/f"
+    assert fs.resolve("/a").file_count == 1 and fs.resolve("/c").file_count == 1
+    assert [(e.kind, e.name, e.old_name) for e in received] == [(MOVE, "b", "b")]
+    fs.rename("/c/b", "/a/novo")
+    assert b.name == "novo" and fs.find("novo") == [b]
+    # Colisões ganham o próximo sufixo do diretório
+    fs.mkdir("x")
+    fs.cd("/c")
+    fs.mkdir("x")
+    fs.mkdir("x_1")
+    fs.cd("/")
+    assert fs.rename("/x", "/c").name == "x_2"
+    for src, dst in (("/a", "/a/novo"), ("/a/g", "/Lixeira")):
+        try:
+            fs.rename(src, dst)
+        except (OSError, PermissionError):
+            pass
+        else:
+            raise AssertionError(f"rename({src}, {dst}) não falhou")
+    fs.rm("/a/g")
+    fs.rename("/Lixeira/g", "/c")
+    g = fs.resolve("/c/g")
+    assert g.ino not in fs.file_index.trashed
+    # Um destino cheio recusa o nó antes que ele saia da origem
+    fs.bulk_create([f"cheio/h{i}" for i in range(filesystem.MAX_CHILDREN)])
+    failures = [lambda: fs.rename(g, "/cheio")]
+    if reopen is not None:
+        # Disco cheio ao gravar a entrada no destino, com o nó já fora da origem
+        def failing_link(*args):
+            raise MemoryError("Disco cheio")
+
+        def link_fails():
+            fs.image.link = failing_link
+            try:
+                fs.rename(g, "/a")
+            finally:
+                del fs.image.link
+
+        failures.append(link_fails)
+    for attempt in failures:
+        try:
+            attempt()
+        except MemoryError:
+            pass
+        else:
+            raise AssertionError("rename não falhou")
+        assert fs.resolve("/c/g") is g and g.path == "/c/g"
+        _assert_consistent(fs)
+    fs.cd("/c")
+    fs.touch("depois")
+    fs.cd("/")
+    if reopen is not None:
+        fs = reopen()
+        assert fs.resolve("/a/novo/f").parent.name == "novo"
+        assert {"g", "depois"} <= set(fs.resolve("/c").children)
+        assert not fs.trash.children
+    _assert_consistent(fs)
+
+
+@check
+def eventos(fs, reopen):
+    received = []
+    fs.watch(received.extend)
+    fs.mkdir("d")
+    fs.cd("/d")
+    with fs.batch():
+        node = fs.touch("f")
+        fs.write(node, 0, b"abc")
+    fs.write(node, 1, b"Z")
+    fs.truncate(node, 1)
+    fs.truncate(node, 5)
+    fs.rm("f")
+    fs.restore_from_trash("f")
+    fs.cd("/")
+    fs.rm("d", to_trash=False)
+    kinds = [(e.kind, e.name) for e in received]
+    assert kinds == [(CREATE, "d"), (CREATE, "f"), (MODIFY, "f"), (MODIFY, "f"), (MODIFY, "f"),
+                     (TRASH, "f"), (RESTORE, "f"), (DELETE, "d")], kinds
+    # Intervalos semiabertos, como os de write
+    assert received[1].range == (0, 3) and received[2].range == (1, 2)
+    assert received[3].range == (1, 3) and received[4].range == (1, 5)
+
+
+@check
+def pesquisa(fs, reopen):
+    fs.mkdir("docs")
+    fs.cd("/docs")
+    node = fs.touch("relatorio.txt")
+    fs.write(node, 0, b"o sistema de arquivos k-ario")
+    fs.touch("notas.md")
+    assert [n.name for n in fs.find("*.txt")] == ["relatorio.txt"]
+    assert {n.name for n in fs.find("o", type="file")} == {"relatorio.txt", "notas.md"}
+    results = fs.search_content('"sistema de arquivos"')
+    assert [r["node"] for r in results] == [node], results
+
+
+@check
+def operacoes_em_lote(fs, reopen):
+    created = fs.bulk_create(["a/b/f1", "a/b/f2", "a/c/", "g"])
+    assert [n.path for n in created] == ["/a", "/g", "/a/b", "/a/c", "/a/b/f1", "/a/b/f2"]
+    for paths, exc in ((["novo", "a/b/f1"], FileExistsError), (["g/x"], NotADirectoryError),
+                       (["x/y"], FileNotFoundError)):
+        try:
+            fs.bulk_create(paths, parents=False)
+        except exc:
+            pass
+        else:
+            raise AssertionError(f"bulk_create({paths}) não falhou")
+        assert "novo" not in fs.root.children, "lote inválido criou nós"
+    fs.bulk_create(["a/c/", "a/b/f3"], exist_ok=True, parents=False)
+    assert fs.root.file_count == 4 and fs.root.dir_count == 4
+    removed = fs.bulk_remove(["/a/b", "/a/b/f1", "g", "/nada"], missing_ok=True)
+    assert {n.name for n in removed} == {"b", "g"}
+    assert fs.root.file_count == 0 and list(fs.resolve("/a").children) == ["c"]
+    _assert_consistent(fs)
+
+
+@check
+def persistencia(fs, reopen):
+    if reopen is None:
+        return  # backend sem armazenamento durável
+    fs.mkdir("d")
+    fs.cd("/d")
+    node = fs.touch("f")
+    fs.write(node, 0, b"persistido")
+    fs.rm("f")
+    fs = reopen()
+    assert fs.read(fs.resolve("/Lixeira/f")) == b"persistido"
+    fs.restore_from_trash("f")
+    assert fs.resolve("/d/f").size == len(b"persistido")
+    _assert_consistent(fs)
+
+
+@check
+def transacao_abortada(fs, reopen):
+    if reopen is None:
+        return  # sem journal não há o que descartar
+    fs.mkdir("d")
+    try:
+        with fs.batch():
+            fs.cd("/d")
+            fs.write(fs.touch("f"), 0, b"dados")
+            fs.mkdir("sub")
+            raise RuntimeError("falha no meio da operação")
+    except RuntimeError:
+        pass
+    fs = reopen()
+    # A imagem ficou como estava antes da transação
+    assert not fs.resolve("/d").children and fs.root.file_count == 0
+    _assert_consistent(fs)
+    fs.cd("/d")
+    fs.write(fs.touch("f"), 0, b"dados")
+    fs.cd("/")
+    job = Job("cópia")
+    job.cancel()
+    with fs.batch():
+        fs.mkdir("e")
+        try:
+            # Desfaz a cópia parcial e sai com a exceção na transação de dentro
+            fs.copy_node(fs.resolve("/d"), job=job)
+        except Cancelled:
+            pass
+        fs.mkdir("g")
+    fs = reopen()
+    # Só o trecho da transação de dentro foi descartado
+    assert sorted(fs.root.children) == ["Lixeira", "d", "e", "g"]
+    assert fs.read(fs.resolve("/d/f")) == b"dados"
+    _assert_consistent(fs)
+    # Operações que falham no meio, depois de alterar entradas de diretório e alocar blocos
+    fs.cd("/d")
+    for i in range(4):
+        fs.write(fs.touch(f"h{i}"), 0, b"conteudo" * 200)
+    f = fs.resolve("/d/f")
+    image = fs.image
+    for name, call in (("unlink", lambda: fs.rm("/d/h3", to_trash=False)),
+                       ("store", lambda: fs.append(f, b"x" * 5000))):
+        original = getattr(image, name)
+
+        def failing(*args, original=original):
+            original(*args)
+            raise OSError("falha simulada")
+
+        setattr(image, name, failing)
+        try:
+            call()
+        except OSError:
+            pass
+        else:
+            raise AssertionError(f"a falha em {name} não chegou ao chamador")
+        finally:
+            delattr(image, name)
+    assert fs.read(f) == b"dados" and "h3" in fs.cwd.children
+    _assert_consistent(fs)
+    # As operações seguintes partem do estado desfeito, e não do que ficou pela metade
+    fs.rm("h3", to_trash=False)
+    fs.write(fs.touch("novo"), 0, b"depois")
+    fs.append(f, b"x" * 5000)
+    _assert_consistent(fs)
+    fs = reopen()
+    assert sorted(fs.resolve("/d").children) == ["f", "h0", "h1", "h2", "novo"]
+    assert fs.read(fs.resolve("/d/novo")) == b"depois"
+    assert fs.read(fs.resolve("/d/f")) == b"dados" + b"x" * 5000
+    _assert_consistent(fs)
+
+
+@check
+def despejo(fs, reopen):
+    if reopen is None:
+        return  # sem imagem não há o que despejar
+    for i in range(5):
+        fs.cd("/")
+        fs.mkdir(f"p{i}")
+        fs.cd(f"/p{i}")
+        for j in range(3):
+            fs.touch(f"f{j}", 1)
+    fs = reopen()
+    assert len(fs.image.nodes) == 2, "a abertura leu mais que a raiz e a lixeira"
+    fs.cache_nodes = 10  # raiz, os seus 6 filhos e um diretório aberto
+    held = fs.resolve("/p0/f0")
+    for i in range(5):
+        fs.cd(f"/p{i}")
+        assert fs.ls() == ["f0", "f1", "f2"]
+    assert len(fs.image.nodes) <= 10
+    fs.write(held, 0, b"x")
+    # Um nó despejado que ainda está em uso volta como o mesmo objeto
+    fs.cd("/")
+    assert fs.resolve("/p0/f0") is held and fs.read(held) == b"x"
+    _assert_consistent(fs)
+    assert fs.root.file_count == 15
+
+
+@check
+def cache_de_paginas(fs, reopen):
+    if reopen is None:
+        return  # conteúdo todo em memória, sem cache
+    payload = bytes(range(256)) * 64
+    fs.write(fs.touch("f"), 0, payload)
+    # Blocos liberados com páginas sujas, logo reaproveitados por outro arquivo
+    fs.write(fs.touch("lixo"), 0, b"x" * 4096)
+    fs.rm("lixo", to_trash=False)
+    fs.write(fs.touch("g"), 0, b"y" * 4096)
+    fs = reopen()
+    node = fs.resolve("/f")
+    assert fs.read(fs.resolve("/g")) == b"y" * 4096
+    fs.content_index.wait()  # o indexador também lê os arquivos carregados
+    fs.image.cache.drop()
+    before = fs.cache_stats()
+    chunks = [fs.read(node, offset, 1024) for offset in range(0, len(payload), 1024)]
+    assert b"".join(chunks) == payload
+    stats = fs.cache_stats()
+    # Leitura sequencial: só a primeira página falta, as demais foram lidas antes
+    assert stats["misses"] - before["misses"] == 1, stats
+    assert stats["read_ahead_hits"] - before["read_ahead_hits"] == 15, stats
+    fs.write(node, 0, b"z")
+    fs.image.sync()
+    assert fs.cache_stats()["dirty"] == 0
+
+
+@check
+def metricas(fs, reopen):
+    assert fs.metrics()["operations"] == {}
+    fs.enable_metrics()
+    fs.mkdir("d")
+    fs.cd("/d")
+    for i in range(3):
+        fs.touch(f"f{i}")
+    try:
+        fs.touch("f0")
+    except FileExistsError:
+        pass
+    fs.cd("/")
+    fs.rm("d", to_trash=False)
+    snapshot = fs.metrics(reset=True)
+    ops = snapshot["operations"]
+    assert ops["touch"]["calls"] == 4 and ops["touch"]["errors"] == 1, ops["touch"]
+    assert 0 < ops["touch"]["p50_s"] <= ops["touch"]["p99_s"] <= ops["touch"]["max_s"]
+    # A remoção definitiva percorre d e os seus três arquivos
+    assert ops["rm"]["walk_max"] == 4, ops["rm"]
+    assert fs.metrics()["operations"] == {}
+    fs.disable_metrics()
+    fs.mkdir("e")
+    assert not fs.metrics()["enabled"] and fs.metrics()["operations"] == {}
+
+
+def main():
+    failures = 0
+    for backend, make in BACKENDS.items():
+        for fn in CHECKS:
+            try:
+                with make() as (fs, reopen):
+                    fn(fs, reopen)
+            except Exception:
+                failures += 1
+                print(f"{backend:<12} {fn.__name__:<20} FALHOU")
+                traceback.print_exc()
+            else:
+                print(f"{backend:<12} {fn.__name__:<20} ok")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+"""Armazenamento do conteúdo dos arquivos."""
+import functools
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from alocador import BlockAllocator, Extent, blocks_for
+
+CHUNK_SIZE = 64 * 1024
+
+
+ChunkKey = Tuple[int, Optional[bytes]]  # (tamanho, hash); hash None para trechos só de zeros
+
+
+class Chunk:
+    """Trecho de até CHUNK_SIZE bytes, compartilhável entre cópias de um arquivo."""
+
+    __slots__ = ("buf", "length", "refs", "extents", "key")
+
+    def __init__(self, length: int, buf: Optional[bytearray] = None):
+        self.buf = buf  # None: trecho só de zeros, sem memória alocada
+        self.length = length
+        self.refs = 1
+        self.extents: List[Extent] = []
+        # Chave no índice de conteúdo; None enquanto o chunk pode ser alterado
+        self.key: Optional[ChunkKey] = None
+
+
+def chunk_key(length: int, buf: Optional[bytearray]) -> ChunkKey:
+    if buf is None:
+        return length, None
+    return length, hashlib.blake2b(buf, digest_size=20).digest()
+
+
+def _synchronized(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class ChunkStore:
+    """Dono dos chunks de um sistema de arquivos, endereçados pelo conteúdo.
+
+    Reserva os blocos de cada chunk no alocador e contabiliza os bytes
+    físicos (chunks distintos) e, entre eles, os compartilhados por mais de
+    um arquivo. Chunks com o mesmo conteúdo são guardados uma única vez:
+    depois de escrito, cada chunk é procurado pelo hash e, se já existir um
+    igual, passa a ser uma referência a ele. Um chunk é liberado quando a
+    última referência cai. Chunks são compartilhados entre arquivos, então
+    contadores, índice e alocador ficam sob uma trava única.
+    """
+
+    def __init__(self, allocator: Optional[BlockAllocator] = None):
+        self.lock = threading.RLock()
+        self.allocator = allocator
+        self.physical = 0
+        self.shared = 0
+        self.by_key: Dict[ChunkKey, Chunk] = {}
+
+    @property
+    def exclusive(self) -> int:
+        return self.physical - self.shared
+
+    @_synchronized
+    def new(self, length: int, buf: Optional[bytearray] = None, after: Optional[Extent] = None) -> Chunk:
+        """Cria um chunk; trechos só de zeros reaproveitam um já existente."""
+        if buf is None:
+            existing = self.by_key.get((length, None))
+            if existing is not None:
+                self.ref(existing)
+                return existing
+        chunk = Chunk(length, buf)
+        if self.allocator is not None and length:
+            chunk.extents = self.allocator.alloc(blocks_for(length, self.allocator.block_size), after)
+        self.physical += length
+        if buf is None:
+            self.intern(chunk)
+        return chunk
+
+    def intern(self, chunk: Chunk) -> Chunk:
+        """Retorna o chunk já armazenado com o mesmo conteúdo, ou registra este."""
+        if chunk.key is not None:
+            return chunk
+        # O hash, parte cara, é calculado fora da trava: o chunk ainda é exclusivo
+        key = chunk_key(chunk.length, chunk.buf)
+        with self.lock:
+            existing = self.by_key.get(key)
+            if existing is not None:
+                self.ref(existing)
+                self.unref(chunk)
+                return existing
+            chunk.key = key
+            self.by_key[key] = chunk
+            return chunk
+
+    @_synchronized
+    def unseal(self, chunk: Chunk):
+        """Tira do índice um chunk exclusivo que vai ser alterado no lugar."""
+        if chunk.key is not None:
+            del self.by_key[chunk.key]
+            chunk.key = None
+
+    @_synchronized
+    def resize(self, chunk: Chunk, length: int):
+        """Ajusta o tamanho de um chunk exclusivo e os seus blocos."""
+        self.unseal(chunk)
+        if self.allocator is not None:
+            chunk.extents = self.allocator.resize(chunk.extents, blocks_for(length, self.allocator.block_size))
+        self.physical += length - chunk.length
+        chunk.length = length
+
+    @_synchronized
+    def ref(self, chunk: Chunk):
+        chunk.refs += 1
+        if chunk.refs == 2:
+            self.shared += chunk.length
+
+    @_synchronized
+    def unref(self, chunk: Chunk):
+        chunk.refs -= 1
+        if chunk.refs == 1:
+            self.shared -= chunk.length
+        elif chunk.refs == 0:
+            self.unseal(chunk)
+            self.physical -= chunk.length
+            if self.allocator is not None:
+                self.allocator.free(chunk.extents)
+            chunk.extents = []
+
+
+class MemoryData:
+    """Conteúdo de um arquivo mantido em memória, dividido em chunks.
+
+    Todos os armazenamentos de conteúdo expõem a mesma interface:
+    len(), read, write, truncate, replace e release. Os bytes ficam em
+    chunks de tamanho fixo, de modo que editar um trecho só toca os chunks
+    que ele cobre. Cópias (clone) compartilham os chunks, que só são
+    duplicados quando uma das cópias escreve neles.
+    """
+
+    __slots__ = ("store", "chunk_size", "chunks", "length")
+
+    def __init__(self, store: Optional[ChunkStore] = None, data: bytes = b"",
+                 chunk_size: int = CHUNK_SIZE):
+        self.store = store if store is not None else ChunkStore()
+        self.chunk_size = chunk_size
+        # Cada chunk tem min(chunk_size, resto do arquivo) bytes
+        self.chunks: List[Chunk] = []
+        self.length = 0
+        if data:
+            self.write(0, data)
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def extents(self) -> List[Extent]:
+        """Blocos do arquivo, com extents contíguos de chunks vizinhos fundidos."""
+        merged: List[Extent] = []
+        for chunk in self.chunks:
+            for start, count in chunk.extents:
+                if merged and merged[-1][0] + merged[-1][1] == start:
+                    merged[-1] = (merged[-1][0], merged[-1][1] + count)
+                else:
+                    merged.append((start, count))
+        return merged
+
+    @property
+    def shared(self) -> int:
+        """Bytes do arquivo que ainda são compartilhados com alguma cópia."""
+        return sum(chunk.length for chunk in self.chunks if chunk.refs > 1)
+
+    def _chunk_len(self, i: int) -> int:
+        return min(self.chunk_size, self.length - i * self.chunk_size)
+
+    def _after(self, i: int) -> Optional[Extent]:
+        """Último extent do chunk anterior, para o arquivo crescer contíguo."""
+        if i > 0 and self.chunks[i - 1].extents:
+            return self.chunks[i - 1].extents[-1]
+        return None
+
+    def _own(self, i: int) -> Chunk:
+        """Garante que o chunk i possa ser alterado no lugar (copy-on-write)."""
+        chunk = self.chunks[i]
+        if chunk.refs > 1:
+            buf = bytearray(chunk.buf) if chunk.buf is not None else bytearray(chunk.length)
+            self.chunks[i] = self.store.new(chunk.length, buf, self._after(i))
+            self.store.unref(chunk)
+        else:
+            self.store.unseal(chunk)
+        return self.chunks[i]
+
+    def _set_length(self, n: int):
+        """Ajusta os chunks para um arquivo de n bytes; trechos novos valem zero."""
+        count = -(-n // self.chunk_size)
+        for chunk in self.chunks[count:]:
+            self.store.unref(chunk)
+        del self.chunks[count:]
+        self.length = n
+        last = len(self.chunks) - 1
+        if last >= 0 and self.chunks[last].length != self._chunk_len(last):
+            chunk = self._own(last)
+            size = self._chunk_len(last)
+            if chunk.buf is not None:
+                if len(chunk.buf) > size:
+                    del chunk.buf[size:]
+                else:
+                    chunk.buf.extend(bytes(size - len(chunk.buf)))
+            self.store.resize(chunk, size)
+            self.chunks[last] = self.store.intern(chunk)
+        for i in range(len(self.chunks), count):
+            self.chunks.append(self.store.new(self._chunk_len(i), after=self._after(i)))
+
+    def read(self, offset: int, n: int) -> bytes:
+        n = min(n, self.length - offset)
+        if n <= 0:
+            return b""
+        cs = self.chunk_size
+        parts = []
+        while n:
+            i, inner = divmod(offset, cs)
+            take = min(cs - inner, n)
+            buf = self.chunks[i].buf
+            parts.append(bytes(take) if buf is None else bytes(buf[inner:inner + take]))
+            offset += take
+            n -= take
+        return b"".join(parts)
+
+    def write(self, offset: int, data: bytes):
+        end = offset + len(data)
+        if end > self.length:
+            self._set_length(end)
+        cs = self.chunk_size
+        view = memoryview(data)
+        touched = []
+        while view:
+            i, inner = divmod(offset, cs)
+            take = min(cs - inner, len(view))
+            piece = view[:take]
+            buf = self.chunks[i].buf
+            # Trechos idênticos não são regravados nem separados das cópias
+            current = buf[inner:inner + take] if buf is not None else bytes(take)
+            if current != piece:
+                chunk = self._own(i)
+                if chunk.buf is None:
+                    chunk.buf = bytearray(chunk.length)
+                chunk.buf[inner:inner + take] = piece
+                touched.append(i)
+            view = view[take:]
+            offset += take
+        for i in touched:
+            self.chunks[i] = self.store.intern(self.chunks[i])
+
+    def truncate(self, n: int):
+        self._set_length(n)
+
+    def replace(self, data: bytes):
+        self.release()
+        self.write(0, data)
+
+    def clone(self) -> "MemoryData":
+        """Cópia que compartilha todos os chunks com este arquivo."""
+        copy = MemoryData(self.store, chunk_size=self.chunk_size)
+        copy.chunks = list(self.chunks)
+        copy.length = self.length
+        for chunk in copy.chunks:
+            self.store.ref(chunk)
+        return copy
+
+    def release(self):
+        for chunk in self.chunks:
+            self.store.unref(chunk)
+        self.chunks = []
+        self.length = 0
@@ -0,0 +1,199 @@
+"""Notificação de alterações no sistema de arquivos (no estilo do inotify).
+
+Cada operação publica eventos tipados no EventBus do FileSystem. Dentro de
+um lote (uma operação, ou várias agrupadas com `batch()`), eventos do mesmo
+nó são combinados: escritas seguidas viram um único MODIFY com o intervalo
+alterado, e um nó criado e apagado no mesmo lote não gera evento algum. Ao
+fim do lote mais externo, cada inscrição recebe de uma vez a lista dos
+eventos que lhe interessam, filtrada por tipo e, opcionalmente, por
+subárvore.
+
+Cada thread tem os seus próprios lotes, e os eventos são entregues na
+thread que os emitiu.
+"""
+import contextlib
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+CREATE = "create"
+DELETE = "delete"
+MODIFY = "modify"
+MOVE = "move"
+TRASH = "trash"
+RESTORE = "restore"
+ATTRIB = "attrib"
+
+KINDS = (CREATE, DELETE, MODIFY, MOVE, TRASH, RESTORE, ATTRIB)
+
+
+def _ancestors(directory) -> Tuple[int, ...]:
+    """inos do diretório dado e de todos os seus ancestrais, de baixo para cima."""
+    chain = []
+    while directory is not None:
+        chain.append(directory.ino)
+        directory = directory.parent
+    return tuple(chain)
+
+
+def _hull(a: Optional[Tuple[int, int]], b: Optional[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+    """Menor intervalo que contém a e b; None (intervalo desconhecido) absorve o outro."""
+    if a is None or b is None:
+        return None
+    return min(a[0], b[0]), max(a[1], b[1])
+
+
+@dataclass
+class Event:
+    kind: str
+    ino: int
+    node: Any = field(repr=False)
+    name: str
+    # Diretório onde o nó está agora (None se apagado) e onde estava antes
+    parent: Optional[int] = None
+    old_parent: Optional[int] = None
+    old_name: Optional[str] = None
+    # Bytes alterados [início, fim) em eventos MODIFY e nas escritas absorvidas por um CREATE
+    range: Optional[Tuple[int, int]] = None
+    # inos de parent/old_parent e dos seus ancestrais, para os filtros por subárvore
+    ancestors: Tuple[int, ...] = field(default=(), repr=False)
+    old_ancestors: Tuple[int, ...] = field(default=(), repr=False)
+
+    def within(self, ino: int) -> bool:
+        """True se o evento atinge a subárvore do nó ino (antes ou depois da operação)."""
+        return ino == self.ino or ino in self.ancestors or ino in self.old_ancestors
+
+
+class Watch:
+    """Inscrição no EventBus; close() cancela o recebimento de eventos."""
+
+    __slots__ = ("bus", "callback", "root", "kinds")
+
+    def __init__(self, bus: "EventBus", callback: Callable[[List[Event]], None],
+                 root: Optional[int], kinds: Optional[frozenset]):
+        self.bus = bus
+        self.callback = callback
+        self.root = root
+        self.kinds = kinds
+
+    def wants(self, event: Event) -> bool:
+        if self.kinds is not None and event.kind not in self.kinds:
+            return False
+        return self.root is None or event.within(self.root)
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class _Batch(threading.local):
+    """Lote em aberto de uma thread."""
+
+    def __init__(self):
+        self.depth = 0
+        self.pending: List[Optional[Event]] = []
+        self.last: Dict[int, int] = {}  # ino -> posição do último evento do nó em pending
+
+
+class EventBus:
+    """Coleta, combina e entrega em lotes os eventos de um sistema de arquivos."""
+
+    def __init__(self):
+        # Substituída, nunca alterada: a entrega percorre a lista sem trava
+        self.watches: List[Watch] = []
+        self.lock = threading.Lock()
+        self.local = _Batch()
+        self.delivered = 0
+        self.coalesced = 0
+
+    def subscribe(self, callback: Callable[[List[Event]], None], root=None,
+                  kinds: Optional[Iterable[str]] = None) -> Watch:
+        """Inscreve callback para receber listas de eventos.
+
+        root (nó ou ino) limita a inscrição aos eventos da sua subárvore,
+        e kinds aos tipos dados.
+        """
+        if root is not None and not isinstance(root, int):
+            root = root.ino
+        watch = Watch(self, callback, root, frozenset(kinds) if kinds is not None else None)
+        with self.lock:
+            self.watches = self.watches + [watch]
+        return watch
+
+    def unsubscribe(self, watch: Watch):
+        with self.lock:
+            self.watches = [w for w in self.watches if w is not watch]
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Agrupa os eventos emitidos no bloco, entregues ao sair do lote mais externo."""
+        local = self.local
+        local.depth += 1
+        try:
+            yield self
+        finally:
+            local.depth -= 1
+            if local.depth == 0:
+                self.flush()
+
+    def emit(self, kind: str, node, parent=None, old_parent=None, old_name: Optional[str] = None,
+             range: Optional[Tuple[int, int]] = None):
+        """Publica um evento; parent e old_parent são os diretórios de destino e de origem."""
+        if not self.watches:
+            return
+        event = Event(kind, node.ino, node, node.name,
+                      parent.ino if parent is not None else None,
+                      old_parent.ino if old_parent is not None else None,
+                      old_name, range, _ancestors(parent), _ancestors(old_parent))
+        local = self.local
+        if not self._coalesce(local, event):
+            local.last[event.ino] = len(local.pending)
+            local.pending.append(event)
+        if local.depth == 0:
+            self.flush()
+
+    def _coalesce(self, local: _Batch, event: Event) -> bool:
+        """Combina o evento com o anterior do mesmo nó no lote; True se absorvido."""
+        i = local.last.get(event.ino)
+        if i is None:
+            return False
+        prev = local.pending[i]
+        if prev.kind == CREATE and event.kind in (MODIFY, ATTRIB):
+            # A criação já faz o consumidor ler o estado atual do nó
+            if event.kind == MODIFY:
+                prev.range = _hull(prev.range, event.range) if prev.range is not None else event.range
+            with self.lock:
+                self.coalesced += 1
+            return True
+        if prev.kind == CREATE and event.kind == DELETE:
+            local.pending[i] = None
+            del local.last[event.ino]
+            with self.lock:
+                self.coalesced += 2
+            return True
+        if prev.kind == event.kind == MODIFY:
+            prev.range = _hull(prev.range, event.range)
+            with self.lock:
+                self.coalesced += 1
+            return True
+        if prev.kind == event.kind == ATTRIB or (prev.kind in (MODIFY, ATTRIB) and event.kind == DELETE):
+            # Só o último estado interessa
+            local.pending[i] = event
+            with self.lock:
+                self.coalesced += 1
+            return True
+        return False
+
+    def flush(self):
+        """Entrega os eventos pendentes da thread atual às inscrições."""
+        local = self.local
+        events = [e for e in local.pending if e is not None]
+        local.pending = []
+        local.last = {}
+        if not events:
+            return
+        with self.lock:
+            self.delivered += len(events)
+        for watch in self.watches:
+            selected = [e for e in events if watch.wants(e)]
+            if selected:
+                watch.callback(selected)
@@ -1,220 +1,1625 @@
+import contextlib
+import functools
+import inspect
+import itertools
+import threading
 import time
+from collections import OrderedDict
 from dataclasses import dataclass, field
-from typing import List, Optional
+from typing import Callable, ClassVar, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from alocador import BlockAllocator, blocks_for, extent_blocks
+from conteudo import CHUNK_SIZE, ChunkStore, MemoryData
+from eventos import ATTRIB, CREATE, DELETE, MODIFY, MOVE, RESTORE, TRASH, EventBus
+from indices import ContentIndex, FileIndex, snippet
+from lixeira import Purger, TrashRecord, TrashStore
+import metricas
+from metricas import Metrics
+from tarefas import Cancelled
+from travas import RWLock, lock_nodes, while_idle
 
 
 # Configurações iniciais 
-MAX_CHILDREN = 10
+MAX_CHILDREN = 10  # None remove o limite de filhos por diretório
 MAX_DISK_SIZE = 1024 * 1024 
-current_disk_usage = 0
-file_index_table = {}
+DENTRY_CACHE_SIZE = 4096
+MAX_NAME = 128  # bytes do nome em UTF-8, o espaço do nome no inode da imagem
+REMOVE_BATCH = 1000  # nós apagados por transação em remove_tree
+CACHE_NODES = 100_000  # nós da imagem mantidos em memória; None não despeja
+TRASH_QUOTA = 0.5  # fração da capacidade que a lixeira pode ocupar; None sem limite
+_inode_counter = itertools.count(1)  # next() é atômico: seguro entre threads
+# Travas internas (folhas no protocolo de travas.py)
+_totals_lock = threading.Lock()
+_generation_lock = threading.Lock()
+_load_lock = threading.RLock()  # carga preguiçosa de filhos e cópias pendentes
+
+# Geração do espaço de nomes: incrementada sempre que caminhos já
+# calculados podem ter mudado (remoção, movimentação). Caches de caminho
+# guardam a geração em que foram preenchidos e são descartados ao divergir.
+_path_generation = 0
+
 
-# Nodes da árvore
-@dataclass
+def invalidate_paths():
+    """Invalida em O(1) todos os caminhos e dentries em cache."""
+    global _path_generation
+    with _generation_lock:
+        _path_generation += 1
+
+# Nodes da árvore. Identidade, não valor: nós iguais em tudo ainda são nós
+# distintos, e servem de chave em dicionários (listagem, janelas abertas).
+# Com __slots__ os nós não têm __dict__, o que conta em árvores de milhões
+# de nós (veja bench_memory em benchmark.py). O slot de weakref permite
+# à imagem em disco reconhecer um nó despejado que ainda está em uso.
+@dataclass(eq=False, slots=True, weakref_slot=True)
 class Node:
+    kind: ClassVar[str] = "node"
+
     name: str
     parent: Optional["DirectoryNode"] = field(default=None, repr=False)
     ctime: float = field(default_factory=time.time)
-    mtime: float = field(default_factory=time.time)
-    atime: float = field(default_factory=time.time)
+    # Omitidas, valem ctime: as três datas de um nó novo são o mesmo objeto float
+    mtime: Optional[float] = None
+    atime: Optional[float] = None
     original_parent: Optional["DirectoryNode"] = field(default=None, repr=False)
+    ino: int = field(default_factory=lambda: next(_inode_counter), compare=False)
+    _path: Optional[str] = field(default=None, init=False, repr=False, compare=False)
+    _path_gen: int = field(default=-1, init=False, repr=False, compare=False)
+    _lock: Optional[RWLock] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.mtime is None:
+            self.mtime = self.ctime
+        if self.atime is None:
+            self.atime = self.ctime
 
     @property
     def path(self) -> str:
-        if self.parent is None:
-            return "/"
-        parts = []
+        # Lida antes da subida: uma alteração no meio dela deixa o resultado já vencido
+        generation = _path_generation
+        if self._path_gen == generation:
+            return self._path
+        # Sobe até o primeiro ancestral com caminho válido e desce preenchendo o cache
+        pending = []
         node = self
-        while node.parent:
-            parts.append(node.name)
+        while node is not None and node._path_gen != generation:
+            pending.append(node)
             node = node.parent
-        return "/" + "/".join(reversed(parts))
+        base = node._path if node is not None else None
+        for n in reversed(pending):
+            if base is None:
+                base = "/"
+            else:
+                base = base + n.name if base == "/" else base + "/" + n.name
+            n._path = base
+            n._path_gen = generation
+        return base
 
     def touch(self):
         self.mtime = self.atime = time.time()
 
-@dataclass
+    def totals(self):
+        """Retorna (bytes, arquivos, diretórios) que o nó soma ao pai."""
+        return 0, 0, 0
+
+@dataclass(eq=False, slots=True)
 class FileNode(Node):
+    kind: ClassVar[str] = "file"
+
     size: int = 0
-    content: str = ""
+    # Armazenamento dos bytes do arquivo (memória ou blocos da imagem em disco)
+    data: MemoryData = field(default_factory=MemoryData, repr=False, compare=False)
+
+    @property
+    def content(self) -> str:
+        # Alterações passam por FileSystem.write/truncate, que cuidam da contabilidade
+        return self.data.read(0, len(self.data)).decode("utf-8", errors="replace")
+
+    def totals(self):
+        return self.size, 1, 0
 
-@dataclass
+@dataclass(eq=False, slots=True)
 class DirectoryNode(Node):
-    children: List[Node] = field(default_factory=list)
+    kind: ClassVar[str] = "dir"
 
-    def add_child(self, node: Node):
-        if len(self.children) >= MAX_CHILDREN:
-            raise MemoryError(f"Diretório {self.path} atingiu limite de filhos ({MAX_CHILDREN})")
-        for child in self.children:
-            if child.name == node.name:
-                raise FileExistsError(f"Nó '{node.name}' já existe em {self.path}")
-        node.parent = self
-        self.children.append(node)
+    # Mapa nome -> nó; o dict preserva a ordem de inserção usada na listagem.
+    # None indica filhos ainda não carregados da imagem em disco.
+    _children: Optional[Dict[str, Node]] = field(default_factory=dict, repr=False)
+    # Totais agregados da subárvore, mantidos incrementalmente
+    subtree_size: int = field(default=0, repr=False)
+    file_count: int = field(default=0, repr=False)
+    dir_count: int = field(default=0, repr=False)
+    _loader: Optional[Callable[["DirectoryNode"], Dict[str, Node]]] = field(
+        default=None, repr=False, compare=False)
+    # Cópias preguiçosas deste diretório que ainda não leram os seus filhos
+    _clones: Optional[List["DirectoryNode"]] = field(default=None, repr=False, compare=False)
+    # Último sufixo usado por (modelo, nome) ao resolver colisões; veja free_name
+    _suffixes: Optional[Dict[Tuple[str, str], int]] = field(default=None, init=False, repr=False,
+                                                            compare=False)
+
+    @property
+    def children(self) -> Dict[str, Node]:
+        if self._children is None:
+            with _load_lock:
+                if self._children is None:
+                    self._children = self._loader(self)
+        return self._children
+
+    @property
+    def loaded(self) -> bool:
+        return self._children is not None
+
+    def totals(self):
+        return self.subtree_size, self.file_count, self.dir_count + 1
+
+    def adjust_totals(self, size: int, files: int = 0, dirs: int = 0):
+        """Propaga uma variação dos totais por toda a cadeia de pais.
+
+        Diretórios diferentes compartilham ancestrais, então a propagação é
+        atômica em relação às demais threads.
+        """
+        with _totals_lock:
+            _propagate(self, size, files, dirs)
+
+    def detach_clones(self):
+        """Materializa as cópias preguiçosas pendentes, que passam a ter filhos próprios."""
+        clones, self._clones = self._clones, None
+        for clone in clones or ():
+            clone.children
+
+    def add_child(self, node: Node, limit: bool = True):
+        """Anexa o nó como filho; limit=False ignora MAX_CHILDREN (a lixeira tem a sua cota)."""
+        _materialize_clones(self)
+        if limit:
+            self.check_room()
+        if node.name in self.children:
+            raise FileExistsError(f"Nó '{node.name}' já existe em {self.path}")
+        if _is_under(self, node):
+            # Um ciclo de pais faria adjust_totals e path subirem para sempre
+            raise OSError(f"{node.path} não pode ficar dentro de si mesmo")
+        self.children[node.name] = node
+        node._path_gen = -1
+        if isinstance(node, DirectoryNode) and node._children:
+            # Subárvore já populada (cópia ou restauração): caminhos dos descendentes mudaram
+            invalidate_paths()
+        with _totals_lock:
+            # Uma escrita no nó só chega a estes ancestrais depois que os totais
+            # dele, já com ela, foram somados aqui (veja FileSystem._resized)
+            node.parent = self
+            _propagate(self, *node.totals())
         self.touch()
 
+    def check_room(self):
+        """Recusa mais um filho quando o diretório já tem MAX_CHILDREN.
+
+        Operações que tiram o nó de outro lugar antes de anexá-lo chamam
+        antes de alterar qualquer coisa.
+        """
+        if MAX_CHILDREN is not None and len(self.children) >= MAX_CHILDREN:
+            raise MemoryError(f"Diretório {self.path} atingiu limite de filhos ({MAX_CHILDREN})")
+
+    def free_name(self, name: str, template: str = "{name}_{n}") -> str:
+        """name, se estiver livre; senão o modelo preenchido com o próximo sufixo livre.
+
+        O diretório guarda o último sufixo usado por nome e modelo, então
+        colisões repetidas com o mesmo nome não voltam a testar os sufixos
+        já ocupados: O(1) amortizado. Um sufixo liberado depois não é
+        reaproveitado.
+        """
+        children = self.children
+        if name not in children:
+            return name
+        if self._suffixes is None:
+            self._suffixes = {}
+        key = (template, name)
+        n = self._suffixes.get(key, 0)
+        while True:
+            n += 1
+            candidate = template.format(name=name, n=n)
+            if candidate not in children:
+                break
+        self._suffixes[key] = n
+        return candidate
+
     def get_child(self, name: str) -> Node:
-        for child in self.children:
-            if child.name == name:
-                return child
-        raise FileNotFoundError(f"Nó '{name}' não encontrado em {self.path}")
+        try:
+            return self.children[name]
+        except KeyError:
+            raise FileNotFoundError(f"Nó '{name}' não encontrado em {self.path}") from None
 
     def remove_child(self, name: str):
-        for i, child in enumerate(self.children):
-            if child.name == name:
-                self.children.pop(i)
-                self.touch()
-                return
-        raise FileNotFoundError(f"Nó '{name}' não encontrado em {self.path}")
+        _materialize_clones(self)
+        node = self.children.pop(name, None)
+        if node is None:
+            raise FileNotFoundError(f"Nó '{name}' não encontrado em {self.path}")
+        invalidate_paths()
+        with _totals_lock:
+            # Totais lidos e nó sem pai num passo só, como em add_child
+            node.parent = None
+            size, files, dirs = node.totals()
+            _propagate(self, -size, -files, -dirs)
+        self.touch()
+
+
+def _propagate(node: Optional[DirectoryNode], size: int, files: int, dirs: int):
+    """Soma a variação aos totais do diretório e dos ancestrais; chamado com _totals_lock."""
+    while node is not None:
+        node.subtree_size += size
+        node.file_count += files
+        node.dir_count += dirs
+        node = node.parent
+
+
+def walk(node: Node) -> Iterator[Node]:
+    """Percorre a subárvore de um nó em pré-ordem, sem recursão."""
+    if metricas.active:
+        return metricas.count_walk(_walk(node))
+    return _walk(node)
+
+
+def _walk(node: Node) -> Iterator[Node]:
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        yield n
+        if isinstance(n, DirectoryNode):
+            stack.extend(n.children.values())
+
+
+def _is_under(node: Node, root: Node) -> bool:
+    while node is not None:
+        if node is root:
+            return True
+        node = node.parent
+    return False
+
+def _materialize_clones(node: Node):
+    """Antes de alterar um nó, materializa as cópias pendentes dele e dos ancestrais.
+
+    Percorre de cima para baixo para que as cópias criadas ao materializar
+    um ancestral também sejam materializadas ao longo do caminho, e assim
+    nenhuma cópia enxergue a alteração.
+    """
+    chain = []
+    while node is not None:
+        chain.append(node)
+        node = node.parent
+    with _load_lock:
+        for n in reversed(chain):
+            if n._clones:
+                n.detach_clones()
+
+
+class DentryCache:
+    """Cache LRU de caminho absoluto -> nó, validado pela geração de caminhos.
+
+    Não usa trava: cada operação no OrderedDict é atômica, e uma entrada
+    despejada por outra thread entre a consulta e a reordenação é apenas
+    ignorada. Os contadores de acertos e faltas são aproximados sob
+    concorrência.
+    """
+
+    def __init__(self, capacity: int = DENTRY_CACHE_SIZE):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: str) -> Optional[Node]:
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != _path_generation:
+            self.misses += 1
+            return None
+        try:
+            self.entries.move_to_end(path)
+        except KeyError:
+            pass
+        self.hits += 1
+        return entry[1]
+
+    def put(self, path: str, node: Node, generation: int):
+        """Guarda o nó com a geração lida antes de resolver o caminho, e não a atual."""
+        self.entries[path] = (generation, node)
+        try:
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        except KeyError:
+            pass
+
+    def clear(self):
+        self.entries.clear()
+
+
+def split_path(path: str, cwd: str = "/") -> List[str]:
+    """Normaliza um caminho absoluto ou relativo em uma lista de componentes."""
+    parts = [] if path.startswith("/") else [p for p in cwd.split("/") if p]
+    for part in path.split("/"):
+        if part in ("", "."):
+            continue
+        if part == "..":
+            if parts:
+                parts.pop()
+        else:
+            parts.append(part)
+    return parts
+
+
+def check_name(name: str):
+    """Recusa nomes que a resolução de caminhos não distingue (vazio, '.', '..' ou com '/')
+    e nomes com mais de MAX_NAME bytes."""
+    if name in ("", ".", ".."):
+        raise ValueError(f"Nome inválido: '{name}'")
+    if "/" in name:
+        raise ValueError(f"Nome '{name}' não pode conter '/'")
+    if len(name.encode("utf-8")) > MAX_NAME:
+        raise ValueError(f"Nome '{name}' excede {MAX_NAME} bytes")
+
+
+def _journaled(method):
+    """Executa uma operação do FileSystem como uma única transação da imagem.
+
+    Os eventos da operação formam um lote, entregue depois do commit.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.events.batch(), self._transaction():
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 # FileSystem 
 class FileSystem:
-    def _init_(self):
-        self.root = DirectoryNode(name="C:")
+    def __init__(self, image=None, cache_nodes: Optional[int] = CACHE_NODES):
+        """Cria um sistema de arquivos em memória ou sobre uma imagem em disco.
+
+        Com uma imagem (persistencia.DiskImage), apenas a raiz e a lixeira
+        são lidas; o restante da árvore é carregado sob demanda e toda
+        alteração é gravada na imagem. Passando de cache_nodes nós em
+        memória, os diretórios usados há mais tempo são despejados e lidos
+        de novo no próximo acesso.
+        """
+        self.image = image
+        self.cache_nodes = cache_nodes
+        # Diretórios da imagem com os filhos em memória, do usado há mais tempo ao mais recente
+        self._loaded_dirs: "OrderedDict[int, DirectoryNode]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._rename_lock = threading.Lock()
+        self.dentry_cache = DentryCache()
+        self.file_index = FileIndex()
+        self.content_index = ContentIndex()
+        self.events = EventBus()
+        self._metrics: Optional[Metrics] = None
+        # O índice de conteúdo acompanha as escritas pelos eventos
+        self.events.subscribe(self._on_modified, kinds=(CREATE, MODIFY))
+        if image is None:
+            self.max_size = MAX_DISK_SIZE
+            self._allocator = BlockAllocator(blocks_for(MAX_DISK_SIZE))
+            self._store = ChunkStore(self._allocator)
+            self.root = DirectoryNode(name="C:")
+            self.trash = DirectoryNode(name="Lixeira")
+            self.root.add_child(self.trash)
+        else:
+            self.max_size = image.capacity
+            image.on_load.append(self._on_load)
+            self.root = image.load_root()
+            self.trash = image.load_node(image.trash_ino, self.root)
         self.cwd = self.root
-        self.trash = DirectoryNode(name="Lixeira")
-        self.root.add_child(self.trash)
+        self.file_index.add(self.root)
+        self.file_index.add(self.trash)
+        # Bytes que a lixeira pode ocupar antes de apagar de vez os itens mais antigos
+        self.trash_quota = int(self.max_size * TRASH_QUOTA) if TRASH_QUOTA is not None else None
+        self.trash_store = TrashStore(image.trash_log() if image is not None else None)
+        if image is not None:
+            self._sync_trash_records()
+        self._purger = Purger(self.purge_trash)
+
+    def close(self):
+        """Para a remoção em segundo plano da lixeira e grava e fecha a imagem em disco, se houver."""
+        self._purger.close()
+        if self.image is not None:
+            self.image.close()
+
+    def get_node(self, ino: int) -> Node:
+        """Retorna o nó com o número de inode dado."""
+        if self.image is not None and ino not in self.file_index:
+            return self.image.node_by_ino(ino)
+        return self.file_index.get(ino)
+
+    def _index_content(self, node: Node):
+        """Agenda a indexação de todo o conteúdo de um arquivo que entrou na árvore."""
+        if isinstance(node, FileNode) and len(node.data):
+            self.content_index.update(node.ino, node.data)
+
+    def _on_modified(self, events):
+        for event in events:
+            node = event.node
+            if not isinstance(node, FileNode):
+                continue
+            if event.kind == CREATE and event.range is None:
+                continue  # arquivo novo sem escritas no lote; cópias são indexadas à parte
+            # Os eventos saem depois que a escrita soltou a trava: o conteúdo é
+            # lido com a trava de leitura, que _free_subtree espera antes de liberá-lo
+            with lock_nodes(node, write=False):
+                entry = self.file_index.entries.get(event.ino)
+                if entry is None or entry.node is not node:
+                    continue  # apagado no mesmo lote ou logo depois dele
+                start, end = event.range if event.range is not None else (0, len(node.data))
+                self.content_index.update(event.ino, node.data, start // CHUNK_SIZE,
+                                          max(start, end - 1) // CHUNK_SIZE)
+
+    def _set_trashed(self, node: Node, trashed: bool):
+        """Marca ou desmarca como na lixeira o nó e os descendentes já em memória.
+
+        Diretórios ainda não lidos da imagem e cópias ainda não
+        materializadas não são percorridos: os filhos herdam a marca do pai
+        ao entrar no índice.
+        """
+        nodes = []
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            nodes.append(n)
+            if isinstance(n, DirectoryNode) and n.loaded:
+                stack.extend(n._children.values())
+        self.file_index.set_trashed(nodes, trashed)
+
+    def _reindex(self, *nodes: Node):
+        for node in nodes:
+            self.file_index.update(node)
+
+    def _on_load(self, node: Node):
+        if isinstance(node, DirectoryNode) and not node.loaded:
+            node._loader = self._load_directory
+        self.file_index.add(node)
+        self._index_content(node)
+        if self.image.original_parents.get(node.ino):
+            self.file_index.set_trashed((node,), True)
+
+    # Cache de diretórios da imagem
+    def _load_directory(self, directory: DirectoryNode) -> Dict[str, Node]:
+        children = self.image.load_children(directory)
+        with self._cache_lock:
+            self._loaded_dirs[directory.ino] = directory
+        self._evict()
+        return children
+
+    def _used(self, directory: DirectoryNode):
+        """Marca o diretório como usado agora, afastando-o do despejo."""
+        if self.image is not None:
+            with self._cache_lock:
+                if directory.ino in self._loaded_dirs:
+                    self._loaded_dirs.move_to_end(directory.ino)
+
+    def _evict(self):
+        """Despeja diretórios, do usado há mais tempo ao mais recente, até caber em cache_nodes.
+
+        Todo nó carregado já está gravado na imagem, então qualquer diretório
+        pode sair, desde que ninguém o esteja usando: sem travas tomadas nele
+        ou nos filhos, sem subdiretórios carregados e fora do caminho do cwd
+        e da lixeira. Os filhos deixam os índices e voltam a ser lidos da
+        imagem no próximo acesso; find e a pesquisa só veem nós em memória.
+        """
+        if self.cache_nodes is None or len(self.image.nodes) <= self.cache_nodes:
+            return
+        pinned = {self.trash.ino}
+        node = self.cwd
+        while node is not None:
+            pinned.add(node.ino)
+            node = node.parent
+        with self._cache_lock:
+            candidates = list(self._loaded_dirs.values())
+        for directory in candidates:
+            if len(self.image.nodes) <= self.cache_nodes:
+                break
+            if directory.ino not in pinned:
+                self._evict_directory(directory)
+
+    def _evict_directory(self, directory: DirectoryNode):
+        with _load_lock:
+            children = directory._children
+            if children is None or directory._clones:
+                return
+            if any(isinstance(c, DirectoryNode) and c.loaded for c in children.values()):
+                return  # os subdiretórios saem antes
+            with while_idle(itertools.chain((directory,), children.values())) as idle:
+                if not idle:
+                    return
+                # O dict antigo fica intacto para quem ainda o percorre
+                directory._children = None
+                with self._cache_lock:
+                    self._loaded_dirs.pop(directory.ino, None)
+                for child in children.values():
+                    self.file_index.remove(child)
+                    self.content_index.remove(child.ino)
+                    self.image.forget(child)
+
+    # Persistência na imagem
+    def _new_ino(self) -> int:
+        return self.image.alloc_inode() if self.image is not None else next(_inode_counter)
+
+    @property
+    def allocator(self) -> BlockAllocator:
+        return self.image.allocator if self.image is not None else self._allocator
+
+    def _new_data(self, node: FileNode):
+        return self.image.new_data(node) if self.image is not None else MemoryData(self._store)
+
+    def _persist(self, *nodes: Node):
+        """Grava os nós dados e todos os seus ancestrais (totais e mtime mudaram)."""
+        if self.image is None:
+            return
+        seen = set()
+        for node in nodes:
+            while node is not None and node.ino not in seen:
+                seen.add(node.ino)
+                self.image.store(node)
+                node = node.parent
+
+    def _transaction(self):
+        return self.image.transaction() if self.image is not None else contextlib.nullcontext()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Agrupa várias operações em uma transação e em um único lote de eventos."""
+        with self.events.batch(), self._transaction():
+            yield self
+
+    def watch(self, callback, root=None, kinds=None):
+        """Inscreve callback nos eventos de alteração; veja EventBus.subscribe."""
+        if isinstance(root, str):
+            root = self.resolve(root)
+        return self.events.subscribe(callback, root, kinds)
+
+    def _discard(self, node: Node):
+        """Libera o inode e os blocos de um nó que não chegou a ser anexado."""
+        if self.image is not None:
+            self.image.free(node)
+
+    def _link(self, directory: DirectoryNode, node: Node):
+        if self.image is not None:
+            self.image.link(directory, node)
+            with self._cache_lock:
+                if isinstance(node, DirectoryNode) and node.loaded:
+                    self._loaded_dirs[node.ino] = node
+                if directory.ino in self._loaded_dirs:
+                    self._loaded_dirs.move_to_end(directory.ino)
+
+    def _unlink(self, directory: DirectoryNode, node: Node):
+        if self.image is not None:
+            self.image.unlink(directory, node)
+
+    def resolve(self, path: str) -> Node:
+        """Resolve um caminho absoluto ou relativo ao cwd, aceitando '.' e '..'."""
+        generation = _path_generation
+        if path.startswith("/") and "/." not in path and "//" not in path:
+            # Caminho absoluto já normalizado: serve de chave sem reprocessar
+            key = path.rstrip("/") or "/"
+            parts = None
+        else:
+            parts = split_path(path, self.cwd.path)
+            key = "/" + "/".join(parts)
+        node = self.dentry_cache.get(key)
+        if node is not None:
+            return node
+        if parts is None:
+            parts = key.split("/")[1:] if key != "/" else []
+        node = self.root
+        for part in parts:
+            if not isinstance(node, DirectoryNode):
+                raise NotADirectoryError(f"{node.path} não é diretório")
+            node = node.get_child(part)
+        if metricas.active:
+            metricas.note_walk(len(parts))
+        self.dentry_cache.put(key, node, generation)
+        if node.parent is not None:
+            self._used(node.parent)
+        return node
 
     # Comandos 
+    @_journaled
     def mkdir(self, name: str):
-        dir_node = DirectoryNode(name=name)
-        try:
-            self.cwd.add_child(dir_node)
-        except FileExistsError as e:
-            raise e
-        file_index_table[dir_node.path] = {
-            "type": "dir",
-            "node": dir_node,
-            "created": dir_node.ctime,
-            "modified": dir_node.mtime
-        }
+        check_name(name)
+        directory = self.cwd
+        self._check_outside_trash(directory)
+        dir_node = DirectoryNode(name=name, ino=self._new_ino())
+        with lock_nodes(directory):
+            try:
+                directory.add_child(dir_node)
+            except (FileExistsError, MemoryError) as e:
+                self._discard(dir_node)
+                raise e
+            self._link(directory, dir_node)
+            self._persist(dir_node)
+            self.file_index.add(dir_node)
+            self._reindex(directory)
+            self.events.emit(CREATE, dir_node, directory)
 
+    @_journaled
     def touch(self, name: str, size: int = 0):
-        global current_disk_usage
-        if current_disk_usage + size > MAX_DISK_SIZE:
+        return self._create_file(self.cwd, name, size)
+
+    def _create_file(self, directory: DirectoryNode, name: str, size: int = 0) -> FileNode:
+        check_name(name)
+        self._check_outside_trash(directory)
+        if self.get_disk_usage(physical=True) + size > self.max_size:
             raise MemoryError("Disco cheio")
-        file_node = FileNode(name=name, size=size)
-        try:
-            self.cwd.add_child(file_node)
-        except FileExistsError as e:
-            raise e
-        current_disk_usage += size
-        file_index_table[file_node.path] = {
-            "size": file_node.size,
-            "node": file_node,
-            "created": file_node.ctime,
-            "modified": file_node.mtime,
-            "trashed": False
-        }
+        file_node = FileNode(name=name, size=size, ino=self._new_ino())
+        file_node.data = self._new_data(file_node)
+        with lock_nodes(directory):
+            try:
+                file_node.data.truncate(size)
+                directory.add_child(file_node)
+            except (FileExistsError, MemoryError) as e:
+                self._discard(file_node)
+                raise e
+            self._link(directory, file_node)
+            self._persist(file_node)
+            self.file_index.add(file_node)
+            self._reindex(directory)
+            self.events.emit(CREATE, file_node, directory)
+        return file_node
 
     def update_file_size(self, node: FileNode, new_size: int):
         """Atualiza o tamanho do arquivo e o uso total do disco."""
-        global current_disk_usage
-        size_change = new_size - node.size
-        if current_disk_usage + size_change > MAX_DISK_SIZE:
+        self.truncate(node, new_size)
+
+    def _check_growth(self, node: FileNode, new_size: int):
+        if self.get_disk_usage(physical=True) + new_size - node.size > self.max_size:
             raise MemoryError("Espaço em disco insuficiente para salvar as alterações!")
-        current_disk_usage += size_change
-        node.size = new_size
+
+    def _resized(self, node: FileNode, new_size: int):
+        """Contabiliza a variação de tamanho do arquivo e grava o nó alterado."""
+        with _totals_lock:
+            # Junto com a leitura do pai: um nó sendo desanexado ou anexado
+            # (remove_child, add_child) leva os totais com esta variação ou sem ela
+            size_change = new_size - node.size
+            node.size = new_size
+            if size_change:
+                _propagate(node.parent, size_change, 0, 0)
         node.touch()
+        self._persist(node)
+        self._reindex(node)
 
-    def cd(self, name: str):
-        if name == "..":
-            if self.cwd.parent:
-                self.cwd = self.cwd.parent
-        else:
-            node = self.cwd.get_child(name)
-            if not isinstance(node, DirectoryNode):
-                raise NotADirectoryError(f"{node.path} não é diretório")
-            self.cwd = node
+    # Acesso ao conteúdo
+    def open(self, path: str, create: bool = False) -> FileNode:
+        """Retorna o arquivo no caminho dado, criando-o vazio se create=True."""
+        try:
+            node = self.resolve(path)
+        except FileNotFoundError:
+            if not create:
+                raise
+            parts = split_path(path, self.cwd.path)
+            directory = self.resolve("/" + "/".join(parts[:-1]))
+            if not isinstance(directory, DirectoryNode):
+                raise NotADirectoryError(f"{directory.path} não é diretório") from None
+            with self._transaction():
+                return self._create_file(directory, parts[-1])
+        if not isinstance(node, FileNode):
+            raise IsADirectoryError(f"{node.path} é um diretório")
+        return node
+
+    def read(self, node: FileNode, offset: int = 0, n: int = -1) -> bytes:
+        """Lê n bytes a partir de offset (n < 0 lê até o fim)."""
+        with lock_nodes(node, write=False):
+            if n < 0:
+                n = node.size - offset
+            node.atime = time.time()
+            return node.data.read(offset, n)
+
+    def _check_outside_trash(self, directory: DirectoryNode):
+        """Recusa pôr um nó novo na lixeira ou dentro de um item dela.
+
+        Itens da lixeira precisam de um registro (TrashRecord), que só o rm
+        cria; sem ele, nem a cota nem purge_trash os alcançam.
+        """
+        if _is_under(directory, self.trash):
+            raise PermissionError("Itens vão para a Lixeira só pelo rm")
+
+    def _check_linked(self, node: Node):
+        """Recusa alterar ou copiar um nó apagado de vez; chamado com a trava do nó.
+
+        Um nó sendo movido também fica sem pai por um instante, mas continua
+        no índice.
+        """
+        if node.parent is None and node is not self.root:
+            entry = self.file_index.entries.get(node.ino)
+            if entry is None or entry.node is not node:
+                raise FileNotFoundError(f"'{node.name}' foi apagado")
+
+    @_journaled
+    def write(self, node: FileNode, offset: int, data: bytes) -> int:
+        """Grava bytes a partir de offset, tocando só os chunks afetados."""
+        with lock_nodes(node):
+            self._check_linked(node)
+            new_size = max(node.size, offset + len(data))
+            self._check_growth(node, new_size)
+            _materialize_clones(node.parent)
+            node.data.write(offset, data)
+            self._resized(node, new_size)
+            if data:
+                self.events.emit(MODIFY, node, node.parent, range=(offset, offset + len(data)))
+        return len(data)
+
+    @_journaled
+    def truncate(self, node: FileNode, size: int = 0):
+        """Encurta ou estende (com zeros) o arquivo para size bytes."""
+        with lock_nodes(node):
+            self._check_linked(node)
+            self._check_growth(node, size)
+            _materialize_clones(node.parent)
+            old_size = len(node.data)
+            node.data.truncate(size)
+            self._resized(node, size)
+            self.events.emit(MODIFY, node, node.parent, range=(min(old_size, size), max(old_size, size)))
+
+    def append(self, node: FileNode, data: bytes) -> int:
+        return self.write(node, node.size, data)
+
+    @_journaled
+    def utime(self, node: Node, atime: Optional[float] = None, mtime: Optional[float] = None):
+        """Altera as datas de acesso e de modificação de um nó (agora, se omitidas)."""
+        now = time.time()
+        with lock_nodes(node):
+            node.atime = now if atime is None else atime
+            node.mtime = now if mtime is None else mtime
+            self._persist(node)
+            self._reindex(node)
+            self.events.emit(ATTRIB, node, node.parent)
+
+    def cd(self, path: str):
+        node = self.resolve(path)
+        if not isinstance(node, DirectoryNode):
+            raise NotADirectoryError(f"{node.path} não é diretório")
+        self.cwd = node
+        self._used(node)
 
     def ls(self):
-        return [child.name for child in self.cwd.children]
+        directory = self.cwd
+        self._used(directory)
+        with lock_nodes(directory, write=False):
+            return list(directory.children)
 
-    def rm(self, name: str, to_trash: bool = True):
-        global current_disk_usage
-        node = self.cwd.get_child(name)
-
-        def calc_size(n: Node) -> int:
-            if isinstance(n, FileNode):
-                return n.size
-            elif isinstance(n, DirectoryNode):
-                return sum(calc_size(c) for c in n.children)
-            return 0
-
-        size_to_free = calc_size(node)
-        self.cwd.remove_child(name)
-        full_path = node.path
-
-        if full_path in file_index_table:
-            if to_trash:
-                file_index_table[full_path]["trashed"] = True
-            else:
-                del file_index_table[full_path]
+    def _locate(self, path: str) -> Tuple[DirectoryNode, str]:
+        """Diretório pai e nome do último componente de um caminho; um nome simples fica no cwd."""
+        if "/" not in path and path not in (".", ".."):
+            return self.cwd, path
+        parts = split_path(path, self.cwd.path)
+        if not parts:
+            raise PermissionError("A raiz não pode ser removida nem movida")
+        directory = self.resolve("/" + "/".join(parts[:-1]))
+        if not isinstance(directory, DirectoryNode):
+            raise NotADirectoryError(f"{directory.path} não é diretório")
+        return directory, parts[-1]
 
-        if to_trash:
-            node.original_parent = self.cwd
-            node.parent = None
-            trash_name = name
-            counter = 1
-            while any(c.name == trash_name for c in self.trash.children):
-                trash_name = f"{name}_{counter}"
-                counter += 1
+    @_journaled
+    def rm(self, name: str, to_trash: bool = True):
+        """Remove o nó name (um nome no cwd ou um caminho), para a lixeira ou de vez."""
+        directory, name = self._locate(name)
+        with lock_nodes(directory, self.trash if to_trash else None):
+            node = directory.get_child(name)
+            if node is self.root or node is self.trash:
+                raise PermissionError(f"{node.path} não pode ser removido")
+            if not to_trash:
+                self._delete(directory, node)
+                return
+            if _is_under(directory, self.trash):
+                # Passaria a ser outro item, com um registro apontando para a própria lixeira
+                raise PermissionError(f"{node.path} já está na Lixeira")
+            # O sufixo de uma colisão na lixeira pode passar de MAX_NAME
+            trash_name = self.trash.free_name(name)
+            check_name(trash_name)
+            self._unlink(directory, node)
+            directory.remove_child(name)
+            node.original_parent = directory
             node.name = trash_name
-            self.trash.add_child(node)
+            self.trash.add_child(node, limit=False)
+            self._link(self.trash, node)
+            self._persist(node, directory)
+            original_path = directory.path.rstrip("/") + "/" + name
+            self.trash_store.add(node.ino, original_path, time.time(), node.totals()[0])
+            self._set_trashed(node, True)
+            self._reindex(node, directory, self.trash)
+            self.events.emit(TRASH, node, self.trash, directory, name)
+        if self.trash_quota is not None and self.trash.subtree_size > self.trash_quota:
+            self._purger.request()
+
+    def _delete(self, directory: DirectoryNode, node: Node):
+        """Apaga de vez um filho do diretório e a sua subárvore; chamado com a trava do diretório."""
+        name = node.name
+        if directory is self.trash:
+            self.trash_store.remove(node.ino)
+        self._unlink(directory, node)
+        directory.remove_child(name)
+        self._free_subtree(node)
+        self._persist(directory)
+        self._reindex(directory)
+        # Um único evento para a subárvore inteira, como no inotify
+        self.events.emit(DELETE, node, None, directory, name)
+
+    def _free_subtree(self, node: Node):
+        """Tira dos índices e libera o espaço de um nó já desanexado e da sua subárvore."""
+        removed = []
+        # O nó já foi desanexado: nenhuma thread chega mais à subárvore pelo caminho
+        for n in walk(node):
+            # Cópias pendentes precisam ler a subárvore antes de ela sumir
+            if isinstance(n, DirectoryNode) and n._clones:
+                with _load_lock:
+                    n.detach_clones()
+            removed.append(n)
+        if len(removed) > 1:
+            self.file_index.remove_many(removed)
         else:
-            if isinstance(node, DirectoryNode):
-                node.children.clear()
-            current_disk_usage -= size_to_free
+            self.file_index.remove(node)
+        for n in removed:
+            # Espera escritas e indexações em andamento no arquivo já desanexado; as
+            # seguintes encontram o nó fora do índice (veja _check_linked e _on_modified)
+            with lock_nodes(n if isinstance(n, FileNode) else None):
+                self.content_index.remove(n.ino)
+                n.parent = None
+                if self.image is not None:
+                    self.image.free(n)
+                elif isinstance(n, FileNode):
+                    n.data.release()
+        if isinstance(node, DirectoryNode):
+            node.children.clear()
+
+    def remove_tree(self, node: Node, job=None):
+        """Apaga de vez o nó e a sua subárvore, de baixo para cima, em lotes.
+
+        Cada lote de REMOVE_BATCH nós é uma transação que trava só os
+        diretórios envolvidos, então outras operações seguem durante a
+        remoção de subárvores grandes. Com um job (tarefas.Job), informa o
+        progresso e para se ele for cancelado; o que ainda não foi removido
+        continua na árvore, com os totais corretos.
+        """
+        order = list(walk(node))
+        order.reverse()  # filhos antes dos pais
+        total = len(order)
+        for start in range(0, total, REMOVE_BATCH):
+            if job is not None:
+                job.report(start, total)
+                job.check()
+            with self.batch():
+                for n in order[start:start + REMOVE_BATCH]:
+                    directory = n.parent
+                    if directory is None:
+                        continue
+                    with lock_nodes(directory):
+                        # Movido ou apagado por outra operação desde o início
+                        if directory.children.get(n.name) is n:
+                            self._delete(directory, n)
+        if job is not None:
+            job.report(total, total)
+
+    def bulk_create(self, paths: Iterable[str], parents: bool = True, exist_ok: bool = False) -> List[Node]:
+        """Cria de uma vez arquivos vazios e diretórios (caminhos terminados em '/').
+
+        Os caminhos são validados antes de qualquer alteração: um nome
+        repetido (no lote ou no disco, a menos que exist_ok aceite um nó
+        existente do mesmo tipo), um pai inexistente com parents=False ou
+        um limite de filhos estourado falham sem criar nada. Com parents, os
+        diretórios intermediários que faltarem são criados, como no mkdir -p.
+
+        Cada diretório pai é resolvido uma única vez, e cada grupo de filhos
+        do mesmo pai é uma transação que atualiza os totais dos ancestrais
+        uma vez só. Retorna os nós criados, pais antes dos filhos.
+        """
+        plan = self._plan_create(paths, parents, exist_ok)
+        created = []
+        nodes: Dict[Tuple[str, ...], DirectoryNode] = {}
+        for parent_parts, group in plan.items():
+            parent = nodes.get(parent_parts) or self.resolve("/" + "/".join(parent_parts))
+            batch = []
+            with self.batch(), lock_nodes(parent):
+                _materialize_clones(parent)
+                files = dirs = 0
+                for name, is_dir in group:
+                    if name in parent.children:
+                        raise FileExistsError(f"Nó '{name}' já existe em {parent.path}")
+                    if is_dir:
+                        node = DirectoryNode(name=name, ino=self._new_ino(), parent=parent)
+                        nodes[parent_parts + (name,)] = node
+                        dirs += 1
+                    else:
+                        node = FileNode(name=name, ino=self._new_ino(), parent=parent)
+                        node.data = self._new_data(node)
+                        files += 1
+                    parent.children[name] = node
+                    self._link(parent, node)
+                    batch.append(node)
+                parent.adjust_totals(0, files, dirs)
+                parent.touch()
+                self._persist(*batch)
+                for node in batch:
+                    self.file_index.add(node)
+                    self.events.emit(CREATE, node, parent)
+                self._reindex(parent)
+            created.extend(batch)
+        return created
+
+    def _plan_create(self, paths: Iterable[str], parents: bool, exist_ok: bool):
+        """Valida um lote de bulk_create; retorna os (nome, é diretório) a criar, agrupados pelo pai."""
+        plan: "OrderedDict[Tuple[str, ...], List[Tuple[str, bool]]]" = OrderedDict()
+        existing: Dict[Tuple[str, ...], Optional[Node]] = {(): self.root}
+        planned: Dict[Tuple[str, ...], bool] = {}
+
+        def lookup(parts):
+            """Nó existente no caminho dado, ou None; o pai já foi consultado."""
+            node = existing.get(parts)
+            if node is None and parts not in existing:
+                parent = existing.get(parts[:-1])
+                node = parent.children.get(parts[-1]) if parent is not None else None
+                existing[parts] = node
+            return node
 
+        cwd = self.cwd.path
+        for path in paths:
+            is_dir = path.endswith("/")
+            parts = tuple(split_path(path, cwd))
+            for i in range(1, len(parts) + 1):
+                prefix = parts[:i]
+                last = i == len(parts)
+                node = lookup(prefix) if prefix not in planned else None
+                if last:
+                    if prefix in planned or node is not None:
+                        same = planned[prefix] if prefix in planned else isinstance(node, DirectoryNode)
+                        if exist_ok and same == is_dir:
+                            break
+                        raise FileExistsError(f"'/{'/'.join(prefix)}' já existe")
+                elif prefix in planned:
+                    if not planned[prefix]:
+                        raise NotADirectoryError(f"'/{'/'.join(prefix)}' não é diretório")
+                    continue
+                elif node is not None:
+                    if not isinstance(node, DirectoryNode):
+                        raise NotADirectoryError(f"{node.path} não é diretório")
+                    continue
+                elif not parents:
+                    raise FileNotFoundError(f"Diretório '/{'/'.join(prefix)}' não encontrado")
+                if prefix[:-1] not in planned:
+                    # Primeiro nó novo do caminho: o pai já existe
+                    self._check_outside_trash(existing[prefix[:-1]])
+                check_name(prefix[-1])
+                planned[prefix] = is_dir if last else True
+                plan.setdefault(prefix[:-1], []).append((prefix[-1], planned[prefix]))
+            if not parts and not (exist_ok and is_dir):
+                raise FileExistsError("'/' já existe")
+        for parent_parts, group in plan.items():
+            parent = existing.get(parent_parts)
+            have = len(parent.children) if parent is not None else 0
+            if MAX_CHILDREN is not None and have + len(group) > MAX_CHILDREN:
+                raise MemoryError(f"Diretório /{'/'.join(parent_parts)} atingiria o limite de filhos ({MAX_CHILDREN})")
+        if self.image is not None and len(planned) > self.image.free_inodes:
+            raise MemoryError("Tabela de inodes cheia")
+        return plan
+
+    def bulk_remove(self, paths: Iterable[str], missing_ok: bool = False) -> List[Node]:
+        """Apaga de vez vários nós e as suas subárvores.
+
+        Todos os caminhos são resolvidos antes de qualquer remoção, e um
+        caminho inexistente falha sem apagar nada, a menos que missing_ok o
+        ignore. Nós dentro de outro nó do lote são apagados junto com ele.
+        Os nós são agrupados pelo pai: cada grupo é uma transação com uma
+        única atualização dos totais dos ancestrais. Retorna os nós apagados.
+        """
+        groups: "OrderedDict[int, List[Node]]" = OrderedDict()
+        selected = set()
+        nodes = []
+        for path in paths:
+            try:
+                node = self.resolve(path)
+            except FileNotFoundError:
+                if missing_ok:
+                    continue
+                raise
+            if node is self.root or node is self.trash:
+                raise PermissionError(f"{node.path} não pode ser removido")
+            if node.ino not in selected:
+                selected.add(node.ino)
+                nodes.append(node)
+        for node in nodes:
+            ancestor = node.parent
+            while ancestor is not None and ancestor.ino not in selected:
+                ancestor = ancestor.parent
+            if ancestor is None:
+                groups.setdefault(node.parent.ino, []).append(node)
+        removed = []
+        for group in groups.values():
+            directory = group[0].parent
+            with self.batch(), lock_nodes(directory):
+                _materialize_clones(directory)
+                # Removidos ou movidos por outra operação desde a resolução
+                batch = [n for n in group if n.parent is directory and directory.children.get(n.name) is n]
+                size = files = dirs = 0
+                for node in batch:
+                    if directory is self.trash:
+                        self.trash_store.remove(node.ino)
+                    self._unlink(directory, node)
+                    del directory.children[node.name]
+                if not batch:
+                    continue
+                invalidate_paths()
+                with _totals_lock:
+                    # Como em remove_child: totais lidos e nós sem pai num passo só
+                    for node in batch:
+                        node.parent = None
+                        s, f, d = node.totals()
+                        size, files, dirs = size + s, files + f, dirs + d
+                    _propagate(directory, -size, -files, -dirs)
+                directory.touch()
+                for node in batch:
+                    self._free_subtree(node)
+                self._persist(directory)
+                self._reindex(directory)
+                for node in batch:
+                    self.events.emit(DELETE, node, None, directory, node.name)
+            removed.extend(batch)
+        return removed
+
+    @_journaled
     def restore_from_trash(self, name: str, target_dir: Optional[DirectoryNode] = None):
+        """Devolve o item name da lixeira ao caminho de onde saiu, ou a target_dir.
+
+        Se o diretório de origem ainda está na árvore, o item volta para
+        ele, onde quer que esteja agora. Senão vale o caminho guardado no
+        registro do item, e os diretórios que não existem mais são
+        recriados, como no mkdir -p. Um nome já ocupado no destino ganha um
+        sufixo.
+        """
+        node = self.trash.get_child(name)
+        record = self.trash_store.get(node.ino)
+        if record is None:
+            raise FileNotFoundError(f"'{name}' está sendo apagado da Lixeira")
+        parent_path, _, original_name = record.original_path.rpartition("/")
+        parent = node.original_parent
+        entry = self.file_index.entries.get(parent.ino) if parent is not None else None
+        if target_dir is not None:
+            target = target_dir
+        elif entry is not None and entry.node is parent and not _is_under(parent, self.trash):
+            # O diretório de origem continua na árvore (mesmo que movido): dispensa resolver o caminho
+            target = parent
+        else:
+            target = self._restore_dir(parent_path or "/")
+        with lock_nodes(self.trash, target):
+            if self.trash.children.get(name) is not node or node.ino not in self.trash_store:
+                raise FileNotFoundError(f"Nó '{name}' não encontrado em {self.trash.path}")
+            self._check_outside_trash(target)
+            target.check_room()
+            new_name = target.free_name(original_name)
+            check_name(new_name)
+            self._unlink(self.trash, node)
+            self.trash.remove_child(name)
+            node.name = new_name
+            try:
+                target.add_child(node)
+                self._link(target, node)
+            except Exception:
+                # Como em rename: o item volta para a lixeira, com o registro intacto
+                if target.children.get(new_name) is node:
+                    target.remove_child(new_name)
+                node.name = name
+                self.trash.add_child(node, limit=False)
+                raise
+            node.original_parent = None
+            if self.image is not None:
+                self.image.original_parents.pop(node.ino, None)
+            self.trash_store.remove(node.ino)
+            self._persist(node, self.trash)
+            self._set_trashed(node, False)
+            self._reindex(node, self.trash, target)
+            self.events.emit(RESTORE, node, target, self.trash, name)
+        return node
+
+    def _restore_dir(self, path: str) -> DirectoryNode:
+        """Diretório no caminho dado, recriando os que faltarem."""
+        try:
+            directory = self.resolve(path)
+        except FileNotFoundError:
+            self.bulk_create([path.rstrip("/") + "/"], exist_ok=True)
+            directory = self.resolve(path)
+        if not isinstance(directory, DirectoryNode):
+            raise NotADirectoryError(f"{directory.path} não é diretório")
+        return directory
+
+    def purge_trash(self, quota: Optional[int] = None, job=None) -> int:
+        """Apaga de vez itens da lixeira, do mais antigo ao mais recente, até ela caber em quota bytes.
+
+        Sem quota, vale trash_quota; quota=0 esvazia a lixeira. Cada item é
+        apagado com remove_tree, em lotes que liberam o espaço aos poucos
+        sem travar o resto do sistema. Roda sozinho em segundo plano quando
+        um rm passa da cota. Retorna o número de itens apagados.
+        """
+        quota = self.trash_quota if quota is None else quota
+        purged = 0
+        # Com quota=0, itens vazios (0 bytes) também saem
+        while quota is not None and (self.trash.subtree_size > quota or quota == 0):
+            records = self.trash_store.oldest()
+            if not records:
+                break
+            self._purge_item(records[0], job)
+            purged += 1
+        return purged
+
+    def delete_from_trash(self, name: str, job=None):
+        """Apaga de vez o item name da lixeira, em lotes; veja remove_tree."""
         node = self.trash.get_child(name)
-        self.trash.remove_child(name)
-        target = target_dir if target_dir else node.original_parent or self.root
-        node.original_parent = None
-        original_name = node.name
-        counter = 1
-        while any(c.name == node.name for c in target.children):
-            node.name = f"{original_name}_{counter}"
-            counter += 1
-        target.add_child(node)
-        file_index_table[node.path]["trashed"] = False
-
-    def stat(self, name: str):
-        node = self.cwd.get_child(name)
+        record = self.trash_store.get(node.ino)
+        if record is None:
+            raise FileNotFoundError(f"'{name}' já está sendo apagado da Lixeira")
+        self._purge_item(record, job)
+
+    def _purge_item(self, record: TrashRecord, job=None):
+        with self.batch(), lock_nodes(self.trash):
+            # Sem o registro, o item não pode mais ser restaurado nem movido
+            if self.trash_store.remove(record.ino) is None:
+                return
+            try:
+                node = self.get_node(record.ino)
+            except FileNotFoundError:
+                return
+        if node.parent is not self.trash:
+            return
+        try:
+            self.remove_tree(node, job)
+        except Cancelled:
+            # O que sobrou continua na lixeira, e pode ser restaurado
+            with self.batch(), lock_nodes(self.trash):
+                if node.parent is self.trash:
+                    self.trash_store.add(record.ino, record.original_path, record.deleted_at, node.totals()[0])
+            raise
+
+    def wait_purge(self):
+        """Espera a remoção em segundo plano da lixeira terminar."""
+        self._purger.wait()
+
+    def _sync_trash_records(self):
+        """Acerta os registros da lixeira com os itens nela: imagens antigas não tinham registros."""
+        children = {c.ino: c for c in self.trash.children.values()}
+        for record in list(self.trash_store.records.values()):
+            if record.ino not in children:
+                self.trash_store.remove(record.ino)
+        for ino, child in children.items():
+            if ino not in self.trash_store:
+                parent = child.original_parent or self.image.original_parent_of(child)
+                base = parent.path.rstrip("/") if parent is not None else ""
+                self.trash_store.add(ino, f"{base}/{child.name}", child.mtime, child.totals()[0])
+
+    @_journaled
+    def rename(self, src, dst, name: Optional[str] = None) -> Node:
+        """Move ou renomeia um nó em O(1), qualquer que seja o tamanho da subárvore.
+
+        src é um nó ou um caminho. dst é um diretório (nó) ou um caminho:
+        um diretório existente recebe o nó com o mesmo nome, como no mv, e
+        qualquer outro caminho dá o diretório e o novo nome. name, se dado,
+        substitui o nome final. Um nome já ocupado no destino ganha um
+        sufixo (veja DirectoryNode.free_name). Retorna o nó movido.
+
+        Só o nó troca de diretório: os descendentes continuam ligados a
+        ele, os caminhos em cache são invalidados pela geração e os índices
+        são chaveados pelo ino, então nada abaixo do nó é percorrido. Um
+        item da lixeira movido para fora dela deixa de estar na lixeira.
+        """
+        node = self.resolve(src) if isinstance(src, str) else src
+        if node is self.root or node is self.trash:
+            raise PermissionError(f"{node.path} não pode ser movido")
+        if isinstance(dst, str):
+            try:
+                target = self.resolve(dst)
+            except FileNotFoundError:
+                target, new_name = self._locate(dst.rstrip("/"))
+            else:
+                if isinstance(target, DirectoryNode) and target is not node:
+                    new_name = node.name
+                else:
+                    # Caminho de um nó existente: o nome colide e ganha um sufixo
+                    target, new_name = target.parent, target.name
+        else:
+            target, new_name = dst, node.name
+        if name is not None:
+            new_name = name
+        check_name(new_name)
+        if not isinstance(target, DirectoryNode):
+            raise NotADirectoryError(f"{target.path} não é diretório")
+        source = node.parent
+        if source is None:
+            raise FileNotFoundError(f"Nó '{node.name}' não está na árvore")
+        # Como no Linux, uma movimentação por vez: os ancestrais do destino
+        # não mudam enquanto a operação verifica que ele não fica abaixo do nó
+        with self._rename_lock, lock_nodes(source, target):
+            old_name = node.name
+            if source.children.get(old_name) is not node:
+                raise FileNotFoundError(f"Nó '{old_name}' não encontrado em {source.path}")
+            if _is_under(target, node):
+                raise OSError(f"{node.path} não pode ser movido para dentro de si mesmo")
+            self._check_outside_trash(target)
+            if source is self.trash and node.ino not in self.trash_store:
+                raise FileNotFoundError(f"'{old_name}' está sendo apagado da Lixeira")
+            if target is source and new_name == old_name:
+                return node
+            if target is not source:
+                target.check_room()
+            new_name = target.free_name(new_name)
+            check_name(new_name)
+            self._unlink(source, node)
+            source.remove_child(old_name)
+            node.name = new_name
+            try:
+                target.add_child(node)
+                # Descarta caminhos calculados por outras threads com o nó fora da árvore
+                invalidate_paths()
+                self._link(target, node)
+            except Exception:
+                # A imagem volta pelo journal; a árvore em memória, aqui
+                if target.children.get(new_name) is node:
+                    target.remove_child(new_name)
+                node.name = old_name
+                source.add_child(node, limit=False)
+                raise
+            if source is self.trash:
+                self.trash_store.remove(node.ino)
+                node.original_parent = None
+                if self.image is not None:
+                    self.image.original_parents.pop(node.ino, None)
+                self._set_trashed(node, False)
+            self._persist(node, source)
+            self._reindex(node, source, target)
+            self.events.emit(MOVE, node, target, source, old_name)
+        return node
+
+    def find(self, pattern, root=None, type: Optional[str] = None, limit: Optional[int] = None) -> List[Node]:
+        """Busca nós pelo nome no índice, sem percorrer a árvore.
+
+        pattern é uma substring, um glob (com * ? ou [) ou uma expressão
+        regular compilada; veja NameIndex.match. root (nó ou caminho)
+        restringe a busca a uma subárvore, type a "file" ou "dir", e limit
+        encerra a busca ao atingir esse número de resultados. Só entram nós
+        já carregados: diretórios ainda não lidos da imagem ou cópias ainda
+        não materializadas não são examinados.
+        """
+        if isinstance(root, str):
+            root = self.resolve(root)
+        results = []
+        if limit is not None and limit <= 0:
+            return results
+        with self.file_index.lock:
+            for ino in self.file_index.names.match(pattern):
+                node = self.file_index.entries[ino].node
+                if type is not None and node.kind != type:
+                    continue
+                if root is not None and root is not self.root and not _is_under(node, root):
+                    continue
+                results.append(node)
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+    def search_content(self, query: str, limit: Optional[int] = 20, wait: bool = True) -> List[dict]:
+        """Busca no conteúdo dos arquivos, com resultados ordenados por relevância.
+
+        Todas as palavras precisam aparecer; trechos entre aspas precisam
+        aparecer em sequência. Cada resultado traz o nó, o caminho, a
+        pontuação e um trecho em volta da primeira ocorrência. Com
+        wait=False não espera a indexação em andamento terminar.
+        """
+        if wait:
+            self.content_index.wait()
+        results = []
+        for ino, score, offset in self.content_index.search(query, limit):
+            entry = self.file_index.entries.get(ino)
+            if entry is None:
+                continue
+            node = entry.node
+            with lock_nodes(node, write=False):
+                text = snippet(node.data, offset)
+            results.append({"node": node, "path": node.path, "score": score, "snippet": text})
+        return results
+
+    def stat(self, name):
+        """Informações de um nó, dado pelo nome no diretório atual ou pelo próprio nó."""
+        node = name if isinstance(name, Node) else self.cwd.get_child(name)
+        with lock_nodes(node, write=False):
+            return self._stat(node)
+
+    def _stat(self, node: Node) -> dict:
         info = {
             "name": node.name,
             "path": node.path,
             "ctime": node.ctime,
             "mtime": node.mtime,
             "atime": node.atime,
-            "type": "dir" if isinstance(node, DirectoryNode) else "file"
+            "ino": node.ino,
+            "type": node.kind
         }
         if isinstance(node, FileNode):
             info["size"] = node.size
+            info["shared"] = node.data.shared
         else:
-            info["children"] = [c.name for c in node.children]
+            info["children"] = list(node.children)
+            info["size"] = node.subtree_size
+            info["files"] = node.file_count
+            info["dirs"] = node.dir_count
         return info
 
-    def get_disk_usage(self):
-        global current_disk_usage
-        return current_disk_usage
+    def get_disk_usage(self, physical: bool = False):
+        """Uso lógico (soma dos tamanhos dos arquivos) ou físico do disco.
 
-    def copy_node(self, node: Node, target_dir: Optional[DirectoryNode] = None):
-        """Cria uma cópia de um nó (arquivo ou diretório) no target_dir ou cwd."""
-        import copy
-        target_dir = target_dir or self.cwd
-        new_node = copy.deepcopy(node)
+        No uso físico, chunks com o mesmo conteúdo, seja por cópia ou por
+        coincidência, contam uma única vez. Na imagem em disco não há
+        deduplicação e os dois valores coincidem.
+        """
+        # Itens na lixeira continuam ocupando espaço até a remoção definitiva
+        if physical and self.image is None:
+            return self._store.physical
+        return self.root.subtree_size
+
+    def get_disk_stats(self):
+        """Uso do disco em bytes e estado do alocador de blocos."""
+        stats = self.allocator.stats()
+        stats["used"] = self.get_disk_usage()
+        stats["capacity"] = self.max_size
+        stats["physical"] = self.get_disk_usage(physical=True)
+        stats["unique_chunks"] = len(self._store.by_key) if self.image is None else 0
+        stats["shared"] = self._store.shared if self.image is None else 0
+        stats["exclusive"] = stats["physical"] - stats["shared"]
+        stats["trash"] = self.trash.subtree_size
+        stats["trash_quota"] = self.trash_quota
+        return stats
+
+    def cache_stats(self) -> Optional[dict]:
+        """Acertos, faltas, despejos e páginas sujas do cache de páginas da imagem.
+
+        None no sistema em memória, em que o conteúdo já está todo residente.
+        """
+        return self.image.cache.stats() if self.image is not None else None
+
+    # Métricas
+    def enable_metrics(self) -> Metrics:
+        """Passa a registrar chamadas, erros, latências e percursos de cada método público.
+
+        Os métodos da instância são trocados por invólucros que medem cada
+        chamada; veja metricas.py. Ligar de novo mantém o que já foi medido.
+        """
+        if self._metrics is None:
+            metrics = Metrics()
+            for name in _INSTRUMENTED:
+                setattr(self, name, metrics.timed(name, getattr(self, name)))
+            self._metrics = metrics
+            metricas.activate(1)
+        return self._metrics
 
-        # Garante que o nome não exista no destino
-        original_name = new_node.name
-        counter = 1
-        while any(c.name == new_node.name for c in target_dir.children):
-            new_node.name = f"{original_name} - Cópia({counter})"
-            counter += 1
+    def disable_metrics(self):
+        """Remove os invólucros de enable_metrics e descarta o que foi medido."""
+        if self._metrics is None:
+            return
+        for name in _INSTRUMENTED:
+            self.__dict__.pop(name, None)
+        self._metrics = None
+        metricas.activate(-1)
 
-        target_dir.add_child(new_node)
+    def metrics(self, reset: bool = False) -> dict:
+        """Retrato das métricas: por operação (se ligadas), dos caches e da árvore em memória.
 
-        # Atualiza o uso do disco
-        self.add_disk_usage_for_node(new_node)
+        Cada operação traz chamadas, erros, latências em segundos (total,
+        média, p50, p99, máxima) e nós percorridos por chamada (p50, p99,
+        máximo). Com reset=True as contagens, inclusive as do cache de
+        dentries, recomeçam depois do retrato.
+        """
+        dentry = self.dentry_cache
+        lookups = dentry.hits + dentry.misses
+        snapshot = {
+            "enabled": self._metrics is not None,
+            "since": self._metrics.since if self._metrics is not None else None,
+            "operations": self._metrics.snapshot() if self._metrics is not None else {},
+            "caches": {
+                "dentry": {
+                    "entries": len(dentry.entries),
+                    "hits": dentry.hits,
+                    "misses": dentry.misses,
+                    "hit_rate": dentry.hits / lookups if lookups else 0.0,
+                },
+                "pages": self.cache_stats(),
+            },
+            "nodes": len(self.file_index),
+            "content_pending": self.content_index.pending(),
+        }
+        if reset:
+            dentry.hits = dentry.misses = 0
+            if self._metrics is not None:
+                self._metrics.reset()
+        return snapshot
+
+    def fsck(self, repair: bool = False):
+        """Recalcula os totais de cada diretório e relata divergências.
+
+        Também confere os blocos alocados e se cada item da lixeira tem o
+        seu registro (um item sendo apagado em segundo plano já não tem).
+        Retorna uma lista de dicionários com o caminho, o campo divergente,
+        o valor armazenado e o valor recalculado. Com repair=True os totais
+        armazenados são corrigidos.
+        """
+        drift = []
+        actual = {}
+        # Pós-ordem iterativa: evita estourar a pilha em árvores profundas
+        stack = [(self.root, False)]
+        while stack:
+            node, visited = stack.pop()
+            if not visited:
+                stack.append((node, True))
+                stack.extend((c, False) for c in node.children.values() if isinstance(c, DirectoryNode))
+                continue
+            size = files = dirs = 0
+            for child in node.children.values():
+                if isinstance(child, DirectoryNode):
+                    c_size, c_files, c_dirs = actual.pop(child.ino)
+                    size += c_size
+                    files += c_files
+                    dirs += c_dirs + 1
+                else:
+                    c_size, c_files, c_dirs = child.totals()
+                    size += c_size
+                    files += c_files
+                    dirs += c_dirs
+            actual[node.ino] = (size, files, dirs)
+            for field_name, value in zip(("subtree_size", "file_count", "dir_count"), (size, files, dirs)):
+                stored = getattr(node, field_name)
+                if stored != value:
+                    drift.append({"path": node.path, "field": field_name, "stored": stored, "actual": value})
+                    if repair:
+                        setattr(node, field_name, value)
+        referenced = self._referenced_blocks()
+        if referenced != self.allocator.used_blocks:
+            drift.append({"path": "/", "field": "allocated_blocks",
+                          "stored": self.allocator.used_blocks, "actual": referenced})
+        for problem in self.allocator.check():
+            drift.append({"path": "/", "field": "allocator", "stored": problem, "actual": None})
+        items = {c.ino for c in self.trash.children.values()}
+        records = set(self.trash_store.records)
+        if items != records:
+            drift.append({"path": self.trash.path, "field": "trash_records",
+                          "stored": sorted(records - items), "actual": sorted(items - records)})
+        return drift
+
+    def _referenced_blocks(self) -> int:
+        if self.image is not None:
+            # O registro da lixeira fica em um inode fora da árvore
+            return sum(self.image.blocks_of(n) for n in walk(self.root)) + \
+                self.image.blocks_of(self.image.trash_log_node)
+        # Chunks compartilhados entre cópias ocupam os mesmos blocos
+        chunks = {id(c): c for n in walk(self.root) if isinstance(n, FileNode) for c in n.data.chunks}
+        return sum(extent_blocks(c.extents) for c in chunks.values())
+
+    def _lazy_clone(self, node: Node) -> Node:
+        """Cópia copy-on-write de um nó, em O(1) para diretórios.
+
+        Arquivos compartilham os chunks do original. Diretórios copiam só os
+        totais e leem os filhos do original no primeiro acesso; até lá, o
+        original os mantém em _clones e os materializa antes de mudar.
+        """
+        if isinstance(node, FileNode):
+            return FileNode(name=node.name, size=node.size, ino=self._new_ino(), data=node.data.clone())
+        with _load_lock:
+            clone = DirectoryNode(name=node.name, ino=self._new_ino(), _children=None,
+                                  subtree_size=node.subtree_size, file_count=node.file_count,
+                                  dir_count=node.dir_count, _loader=functools.partial(self._load_clone, node))
+            if node._clones is None:
+                node._clones = []
+            node._clones.append(clone)
+        return clone
+
+    def _load_clone(self, source: DirectoryNode, clone: DirectoryNode) -> Dict[str, Node]:
+        if source._clones:
+            source._clones = [c for c in source._clones if c is not clone]
+        children = {}
+        for child in source.children.values():
+            new_child = self._lazy_clone(child)
+            new_child.parent = clone
+            children[new_child.name] = new_child
+            self.file_index.add(new_child)
+            self._index_content(new_child)
+        return children
+
+    def _clone(self, node: Node, job=None) -> Node:
+        """Cria uma cópia desanexada de um nó e de toda a sua subárvore.
+
+        Com um job, informa o progresso a cada diretório e, se ele for
+        cancelado, libera a cópia parcial.
+        """
+        def clone_one(n: Node) -> Node:
+            if isinstance(n, DirectoryNode):
+                return DirectoryNode(name=n.name, ino=self._new_ino())
+            new = FileNode(name=n.name, size=n.size, ino=self._new_ino())
+            new.data = self._new_data(new)
+            new.data.truncate(n.size)
+            for offset in range(0, len(n.data), CHUNK_SIZE):
+                new.data.write(offset, n.data.read(offset, CHUNK_SIZE))
+            return new
+
+        new_root = clone_one(node)
+        total = sum(node.totals()[1:]) or 1
+        done = 1
+        stack = [(node, new_root)]
+        try:
+            while stack:
+                src, dst = stack.pop()
+                if isinstance(src, DirectoryNode):
+                    if job is not None:
+                        job.report(done, total)
+                        job.check()
+                    for child in src.children.values():
+                        new_child = clone_one(child)
+                        dst.add_child(new_child)
+                        stack.append((child, new_child))
+                    done += len(src.children)
+        except Cancelled:
+            for n in walk(new_root):
+                self._discard(n)
+            raise
+        return new_root
+
+    def _discard_copy(self, source: Node, copy: Node):
+        """Desfaz uma cópia que não chegou a ser anexada."""
+        if self.image is not None:
+            for n in walk(copy):
+                self._discard(n)
+        elif isinstance(copy, FileNode):
+            copy.data.release()
+        else:
+            with _load_lock:
+                if source._clones:
+                    source._clones = [c for c in source._clones if c is not copy]
+
+    @_journaled
+    def copy_node(self, node: Node, target_dir: Optional[DirectoryNode] = None, job=None,
+                  name: Optional[str] = None):
+        """Cria uma cópia de um nó (arquivo ou diretório) no target_dir ou cwd, com o nome dado ou o do original.
+
+        Como um cp, a cópia de um diretório não é um instantâneo atômico em
+        relação a escritas concorrentes nos arquivos do original. Na imagem
+        em disco a cópia é integral e pode ser acompanhada e cancelada por
+        um job.
+        """
+        target_dir = target_dir or self.cwd
+        self._check_outside_trash(target_dir)
+        if name is not None:
+            check_name(name)
+        with lock_nodes(node if isinstance(node, FileNode) else None, write=False):
+            # A cópia de um nó apagado leria blocos e chunks já liberados
+            self._check_linked(node)
+            if self.image is None:
+                new_node = self._lazy_clone(node)
+        if self.image is not None:
+            # A imagem não conta referências por bloco: a cópia é feita por inteiro
+            if self.get_disk_usage(physical=True) + node.totals()[0] > self.max_size:
+                raise MemoryError("Disco cheio")
+            new_node = self._clone(node, job)
+
+        with lock_nodes(target_dir):
+            try:
+                # Garante que o nome não exista no destino
+                new_name = target_dir.free_name(name or node.name, "{name} - Cópia({n})")
+                check_name(new_name)
+                new_node.name = new_name
+                target_dir.add_child(new_node)
+            except (ValueError, FileExistsError, MemoryError):
+                self._discard_copy(node, new_node)
+                raise
+            if self.image is None:
+                self.file_index.add(new_node)
+                self._index_content(new_node)
+            else:
+                for n in walk(new_node):
+                    self._link(n.parent, n)
+                    self.file_index.add(n)
+                    self._index_content(n)
+                self._persist(*walk(new_node))
+            self._reindex(target_dir)
+            self.events.emit(CREATE, new_node, target_dir)
         return new_node
-    
+
+
+# Métodos públicos medidos por enable_metrics; batch só cria o contexto
+_INSTRUMENTED = tuple(name for name, value in vars(FileSystem).items()
+                      if inspect.isfunction(value) and not name.startswith("_")
+                      and name not in ("batch", "enable_metrics", "disable_metrics", "metrics"))
+
 fs = FileSystem()
\ No newline at end of file
@@ -0,0 +1,522 @@
+"""Índices auxiliares do sistema de arquivos."""
+import fnmatch
+import functools
+import itertools
+import math
+import queue
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+from typing import Collection, Dict, Hashable, Iterator, List, Optional, Set, Tuple, Union
+
+from conteudo import CHUNK_SIZE
+
+GLOB_CHARS = re.compile(r"[*?\[]")
+SMALL_BUCKET = 8  # chaves guardadas em tupla antes de o balde virar um set
+REBUILD_THRESHOLD = 64  # remoções em lote a partir das quais a lista por mtime é refeita de uma vez
+_GLOB_LITERALS = re.compile(r"\[[^\]]*\]|[*?]")
+
+
+def _grams(name: str) -> Set[str]:
+    """Trigramas do nome mais os n-gramas ancorados no início ("^a", "^ab")."""
+    grams = {name[i:i + 3] for i in range(len(name) - 2)}
+    grams.update("^" + name[:n] for n in (1, 2) if len(name) >= n)
+    return grams
+
+
+def _bucket_add(buckets: Dict, name, key):
+    """Acrescenta key ao balde de name.
+
+    A maioria dos baldes tem uma ou poucas chaves, e um set vazio já ocupa
+    mais de 200 bytes: baldes pequenos são tuplas e só viram set depois de
+    SMALL_BUCKET chaves.
+    """
+    bucket = buckets.get(name)
+    if bucket is None:
+        buckets[name] = (key,)
+    elif isinstance(bucket, tuple):
+        if key not in bucket:
+            bucket += (key,)
+            buckets[name] = bucket if len(bucket) <= SMALL_BUCKET else set(bucket)
+    else:
+        bucket.add(key)
+
+
+def _bucket_discard(buckets: Dict, name, key) -> bool:
+    """Tira key do balde de name, apagando o balde vazio; True se ele foi apagado."""
+    bucket = buckets.get(name)
+    if bucket is None:
+        return False
+    if isinstance(bucket, tuple):
+        bucket = tuple(k for k in bucket if k != key)
+        if bucket:
+            buckets[name] = bucket
+            return False
+    else:
+        bucket.discard(key)
+        if bucket:
+            return False
+    del buckets[name]
+    return True
+
+
+class NameIndex:
+    """Índice de nomes para busca por substring, prefixo, glob e regex.
+
+    Substrings são buscadas pelos trigramas do nome em minúsculas e
+    prefixos pelos n-gramas ancorados no início. A consulta parte da menor
+    lista de candidatos entre os gramas da busca e confere cada candidato,
+    então o custo depende de quantos nomes compartilham o grama mais raro,
+    e não do tamanho da árvore.
+    """
+
+    def __init__(self):
+        self.names: Dict[Hashable, str] = {}  # chave -> nome original
+        # Baldes de _bucket_add: tuplas ou sets
+        self.keys: Dict[str, Collection[Hashable]] = {}  # nome em minúsculas -> chaves
+        self.postings: Dict[str, Collection[str]] = {}  # grama -> nomes em minúsculas
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, key: Hashable, name: str):
+        if key in self.names:
+            self.remove(key)
+        self.names[key] = name
+        lower = name.lower()
+        if lower not in self.keys:
+            for gram in _grams(lower):
+                _bucket_add(self.postings, gram, lower)
+        _bucket_add(self.keys, lower, key)
+
+    def remove(self, key: Hashable):
+        name = self.names.pop(key, None)
+        if name is None:
+            return
+        lower = name.lower()
+        if _bucket_discard(self.keys, lower, key):
+            for gram in _grams(lower):
+                _bucket_discard(self.postings, gram, lower)
+
+    def rename(self, key: Hashable, name: str):
+        if self.names.get(key) != name:
+            self.add(key, name)
+
+    def match(self, pattern: Union[str, "re.Pattern"]) -> Iterator[Hashable]:
+        """Chaves cujo nome casa com o padrão, sem ordem definida.
+
+        Uma string com * ? ou [ é um glob sobre o nome inteiro; sem esses
+        caracteres, é uma substring. Ambos ignoram maiúsculas. Uma expressão
+        regular compilada é aplicada com search ao nome original. O
+        gerador deve ser consumido antes de o índice ser alterado.
+        """
+        if isinstance(pattern, re.Pattern):
+            for key, name in self.names.items():
+                if pattern.search(name):
+                    yield key
+            return
+        query = pattern.lower()
+        if GLOB_CHARS.search(query):
+            regex = re.compile(fnmatch.translate(query), re.DOTALL)
+            literals = [part for part in _GLOB_LITERALS.split(query) if part]
+            grams = set()
+            if literals and query.startswith(literals[0]):
+                grams.add("^" + literals[0][:2])
+            for part in literals:
+                grams.update(part[i:i + 3] for i in range(len(part) - 2))
+            test = regex.match
+        else:
+            grams = _grams(query) - {"^" + query[:1], "^" + query[:2]}
+            test = lambda name: query in name
+        if grams:
+            candidates = min((self.postings.get(g, ()) for g in grams), key=len)
+        else:
+            candidates = self.keys
+        for lower in candidates:
+            if test(lower):
+                yield from self.keys.get(lower, ())
+
+
+def _synchronized(method):
+    """Executa o método com a trava do índice."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class IndexEntry:
+    """Registro de um nó no FileIndex.
+
+    Guarda só o que precisa do valor antigo para ser desindexado (nome e
+    mtime); tipo e datas de criação vêm do próprio nó, e o estado na
+    lixeira do conjunto `trashed`.
+    """
+
+    __slots__ = ("node", "name", "modified")
+
+    def __init__(self, node):
+        self.node = node
+        self.name = node.name
+        self.modified = node.mtime
+
+
+class FileIndex:
+    """Tabela de índices de arquivos chaveada pelo número de inode.
+
+    Além da tabela principal (ino -> registro), mantém índices secundários
+    por nome, por tipo, por estado na lixeira e por data de modificação,
+    para que as consultas comuns não precisem percorrer a árvore. Estão na
+    lixeira os itens dela e todos os seus descendentes: um nó que entra no
+    índice abaixo de um nó na lixeira já entra marcado. Os métodos tomam a
+    trava do índice; quem percorre `names` diretamente precisa tomá-la
+    também.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.entries: Dict[int, IndexEntry] = {}
+        self.names = NameIndex()
+        self.by_name: Dict[str, Collection[int]] = {}  # baldes de _bucket_add
+        self.by_type: Dict[str, Set[int]] = {"file": set(), "dir": set()}
+        self.trashed: Set[int] = set()
+        self.by_mtime: List[tuple] = []  # (mtime, ino) ordenado
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, ino: int):
+        return ino in self.entries
+
+    @_synchronized
+    def add(self, node):
+        if node.ino in self.entries:
+            return
+        self.entries[node.ino] = IndexEntry(node)
+        _bucket_add(self.by_name, node.name, node.ino)
+        self.names.add(node.ino, node.name)
+        self.by_type[node.kind].add(node.ino)
+        insort(self.by_mtime, (node.mtime, node.ino))
+        if node.parent is not None and node.parent.ino in self.trashed:
+            self.trashed.add(node.ino)
+
+    @_synchronized
+    def remove(self, node):
+        entry = self.entries.pop(node.ino, None)
+        if entry is None:
+            return
+        self._unlink_name(entry.name, node.ino)
+        self.names.remove(node.ino)
+        self.by_type[node.kind].discard(node.ino)
+        self.trashed.discard(node.ino)
+        self._unlink_mtime(entry.modified, node.ino)
+
+    @_synchronized
+    def remove_many(self, nodes):
+        """Remove vários nós; a lista por mtime é refeita uma vez, e não desfeita item a item."""
+        gone = {}
+        for node in nodes:
+            entry = self.entries.pop(node.ino, None)
+            if entry is None:
+                continue
+            self._unlink_name(entry.name, node.ino)
+            self.names.remove(node.ino)
+            self.by_type[node.kind].discard(node.ino)
+            self.trashed.discard(node.ino)
+            gone[node.ino] = entry.modified
+        if len(gone) <= REBUILD_THRESHOLD:
+            for ino, modified in gone.items():
+                self._unlink_mtime(modified, ino)
+        else:
+            self.by_mtime = [item for item in self.by_mtime if item[1] not in gone]
+
+    @_synchronized
+    def update(self, node):
+        """Sincroniza nome e mtime do registro com o estado atual do nó."""
+        entry = self.entries.get(node.ino)
+        if entry is None:
+            return
+        if entry.name != node.name:
+            self._unlink_name(entry.name, node.ino)
+            _bucket_add(self.by_name, node.name, node.ino)
+            self.names.rename(node.ino, node.name)
+            entry.name = node.name
+        if entry.modified != node.mtime:
+            self._unlink_mtime(entry.modified, node.ino)
+            insort(self.by_mtime, (node.mtime, node.ino))
+            entry.modified = node.mtime
+
+    @_synchronized
+    def set_trashed(self, nodes, trashed: bool):
+        """Marca ou desmarca como na lixeira os nós dados que estão no índice."""
+        mark = self.trashed.add if trashed else self.trashed.discard
+        for node in nodes:
+            if node.ino in self.entries:
+                mark(node.ino)
+
+    # Consultas
+    @_synchronized
+    def get(self, ino: int):
+        entry = self.entries.get(ino)
+        if entry is None:
+            raise FileNotFoundError(f"Inode {ino} não encontrado")
+        return entry.node
+
+    @_synchronized
+    def find_by_name(self, name: str):
+        return [self.entries[ino].node for ino in self.by_name.get(name, ())]
+
+    @_synchronized
+    def of_type(self, kind: str):
+        return [self.entries[ino].node for ino in self.by_type[kind]]
+
+    @_synchronized
+    def trashed_nodes(self):
+        return [self.entries[ino].node for ino in self.trashed]
+
+    @_synchronized
+    def modified_since(self, since: float, until: float = float("inf")):
+        """Nós com mtime em [since, until], do mais antigo para o mais recente."""
+        lo = bisect_left(self.by_mtime, (since, -1))
+        hi = bisect_right(self.by_mtime, (until, float("inf")))
+        return [self.entries[ino].node for _, ino in self.by_mtime[lo:hi]]
+
+    def _unlink_name(self, name: str, ino: int):
+        _bucket_discard(self.by_name, name, ino)
+
+    def _unlink_mtime(self, mtime: float, ino: int):
+        i = bisect_left(self.by_mtime, (mtime, ino))
+        if i < len(self.by_mtime) and self.by_mtime[i] == (mtime, ino):
+            self.by_mtime.pop(i)
+
+
+# Palavra: letras e dígitos ASCII ou qualquer caractere UTF-8 de mais de um byte
+_WORD = re.compile(rb"(?:[0-9A-Za-z_]|[\xc2-\xf4][\x80-\xbf]+)+")
+_PHRASE = re.compile(r'"([^"]*)"')
+MAX_TOKEN = 256  # bytes lidos além das bordas do chunk para completar palavras
+SNIPPET_CONTEXT = 60
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+Position = Tuple[int, int]  # (chunk, ordem da palavra dentro do chunk)
+
+
+def normalize_term(raw: bytes) -> str:
+    """Minúsculas e sem acentos, para que "Ação" e "acao" sejam o mesmo termo."""
+    if raw.isascii():
+        return raw.decode("ascii").lower()
+    text = unicodedata.normalize("NFKD", raw.decode("utf-8", errors="ignore").lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    return [normalize_term(m.group()) for m in _WORD.finditer(text.encode("utf-8"))]
+
+
+def snippet(data, offset: int, context: int = SNIPPET_CONTEXT) -> str:
+    """Trecho do conteúdo em volta de offset, em uma linha."""
+    lo = max(0, offset - context)
+    text = data.read(lo, 2 * context).decode("utf-8", errors="ignore")
+    return " ".join("".join(c if c.isprintable() else " " for c in text).split())
+
+
+class ContentIndex:
+    """Índice invertido do conteúdo dos arquivos, com posições para frases.
+
+    Cada chunk de CHUNK_SIZE bytes é indexado separadamente e fica dono das
+    palavras que começam nele; as posições são (chunk, ordem no chunk).
+    Assim, editar um trecho só reindexa os chunks alterados e os vizinhos,
+    cujas palavras de borda podem ter mudado. Os bytes são copiados na
+    thread que chama update, e a tokenização roda em uma thread de fundo;
+    pending() e wait() informam e aguardam o fim da fila.
+    """
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        # termo -> arquivo -> chunk -> [(ordem, offset em bytes)]
+        self.postings: Dict[str, Dict[Hashable, Dict[int, List[Position]]]] = {}
+        # arquivo -> chunk -> (nº de palavras, termos do chunk)
+        self.chunks: Dict[Hashable, Dict[int, Tuple[int, Set[str]]]] = {}
+        self.lengths: Dict[Hashable, int] = {}
+        self.total_tokens = 0
+        self.lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._seq = itertools.count()
+        self._latest: Dict[Tuple[Hashable, int], int] = {}
+        self._generation: Dict[Hashable, int] = {}
+        self._high: Dict[Hashable, int] = {}  # maior chunk já enviado para indexação
+        self._worker: Optional[threading.Thread] = None
+
+    # Atualização
+    def update(self, key: Hashable, data, first: int = 0, last: Optional[int] = None):
+        """Agenda a reindexação dos chunks first..last (e vizinhos) de um arquivo.
+
+        Sem last, reindexa do chunk first até o fim. Chunks além do fim
+        atual do arquivo (após um truncate) são descartados.
+        """
+        cs = self.chunk_size
+        length = len(data)
+        count = -(-length // cs)
+        if last is None:
+            last = count - 1
+        with self.lock:
+            gen = self._generation.get(key, 0)
+            high = self._high.get(key, -1)
+            self._high[key] = count - 1
+            jobs = []
+            for i in range(max(first - 1, 0), max(last + 1, high) + 1):
+                if i >= count and i > high:
+                    break
+                seq = next(self._seq)
+                self._latest[(key, i)] = seq
+                jobs.append((i, seq))
+        for i, seq in jobs:
+            start = i * cs
+            payload = None
+            if start < length:
+                lo = max(0, start - MAX_TOKEN)
+                payload = (lo, data.read(lo, min(start + cs, length) + MAX_TOKEN - lo))
+            self._queue.put((key, gen, i, seq, payload))
+        if jobs and self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="content-indexer", daemon=True)
+            self._worker.start()
+
+    def remove(self, key: Hashable):
+        """Tira um arquivo do índice; trabalhos pendentes dele são ignorados."""
+        with self.lock:
+            self._generation[key] = self._generation.get(key, 0) + 1
+            for i in range(self._high.pop(key, -1) + 1):
+                self._latest.pop((key, i), None)
+            for i in list(self.chunks.get(key, ())):
+                self._apply(key, i, [])
+
+    def pending(self) -> bool:
+        return self._queue.unfinished_tasks > 0
+
+    def wait(self):
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            key, gen, i, seq, payload = self._queue.get()
+            try:
+                if self._latest.get((key, i)) != seq:
+                    continue  # já existe uma versão mais nova deste chunk na fila
+                tokens = self._tokenize(i, payload) if payload is not None else []
+                with self.lock:
+                    if self._generation.get(key, 0) == gen and self._latest.get((key, i)) == seq:
+                        del self._latest[(key, i)]
+                        self._apply(key, i, tokens)
+            finally:
+                self._queue.task_done()
+
+    def _tokenize(self, i: int, payload) -> List[Tuple[str, int]]:
+        lo, window = payload
+        start = i * self.chunk_size
+        end = start + self.chunk_size
+        tokens = []
+        for m in _WORD.finditer(window):
+            offset = lo + m.start()
+            if offset < start:
+                continue  # começa no chunk anterior, que é o dono
+            if offset >= end:
+                break
+            tokens.append((normalize_term(m.group()), offset))
+        return tokens
+
+    def _apply(self, key: Hashable, i: int, tokens: List[Tuple[str, int]]):
+        doc = self.chunks.setdefault(key, {})
+        old = doc.pop(i, None)
+        if old is not None:
+            count, terms = old
+            for term in terms:
+                files = self.postings[term]
+                del files[key][i]
+                if not files[key]:
+                    del files[key]
+                    if not files:
+                        del self.postings[term]
+            self.lengths[key] -= count
+            self.total_tokens -= count
+        if tokens:
+            terms = set()
+            for ordinal, (term, offset) in enumerate(tokens):
+                self.postings.setdefault(term, {}).setdefault(key, {}).setdefault(i, []).append((ordinal, offset))
+                terms.add(term)
+            doc[i] = (len(tokens), terms)
+            self.lengths[key] = self.lengths.get(key, 0) + len(tokens)
+            self.total_tokens += len(tokens)
+        if not doc:
+            del self.chunks[key]
+            self.lengths.pop(key, None)
+
+    # Consulta
+    def search(self, query: str, limit: Optional[int] = 20) -> List[Tuple[Hashable, float, int]]:
+        """Arquivos que contêm todas as palavras e frases ("entre aspas") da consulta.
+
+        Retorna (chave, pontuação BM25, offset da primeira ocorrência),
+        da maior pontuação para a menor.
+        """
+        groups = [tokenize(p) for p in _PHRASE.findall(query)]
+        groups = [g for g in groups if g] + [[t] for t in tokenize(_PHRASE.sub(" ", query))]
+        if not groups:
+            return []
+        with self.lock:
+            candidates = None
+            for term in {t for g in groups for t in g}:
+                files = self.postings.get(term)
+                if not files:
+                    return []
+                candidates = set(files) if candidates is None else candidates & files.keys()
+            n_docs = len(self.lengths)
+            avg_len = self.total_tokens / n_docs
+            idf = {t: math.log(1 + (n_docs - len(self.postings[t]) + 0.5) / (len(self.postings[t]) + 0.5))
+                   for g in groups for t in g}
+            results = []
+            for key in candidates:
+                score = 0.0
+                first = None
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[key] / avg_len)
+                for group in groups:
+                    offsets = self._occurrences(key, group)
+                    if not offsets:
+                        break
+                    tf = len(offsets)
+                    score += sum(idf[t] for t in group) * tf * (BM25_K1 + 1) / (tf + norm)
+                    first = offsets[0] if first is None else min(first, offsets[0])
+                else:
+                    results.append((key, score, first))
+        results.sort(key=lambda r: -r[1])
+        return results[:limit] if limit is not None else results
+
+    def _occurrences(self, key: Hashable, group: List[str]) -> List[int]:
+        """Offsets, em ordem, onde as palavras do grupo aparecem em sequência."""
+        starts = [(i, o, off) for i, positions in self.postings[group[0]][key].items()
+                  for o, off in positions]
+        if len(group) > 1:
+            following = [{(i, o) for i, positions in self.postings[t][key].items() for o, _ in positions}
+                         for t in group[1:]]
+            matched = []
+            for i, o, off in starts:
+                pos = (i, o)
+                for positions in following:
+                    pos = self._next(key, pos)
+                    if pos not in positions:
+                        break
+                else:
+                    matched.append((i, o, off))
+            starts = matched
+        return sorted(off for _, _, off in starts)
+
+    def _next(self, key: Hashable, pos: Position) -> Optional[Position]:
+        doc = self.chunks[key]
+        i, o = pos
+        if o + 1 < doc[i][0]:
+            return i, o + 1
+        last = max(doc)
+        i += 1
+        while i <= last and i not in doc:
+            i += 1
+        return (i, 0) if i <= last else None
@@ -1,172 +1,46 @@
+import os
+import sys
 import tkinter as tk
-from tkinter import simpledialog, messagebox, ttk
-import copy
-import re
-from filesystem import MAX_DISK_SIZE, fs
-
-class Node:
-    """Nó base para arquivos e diretórios."""
-    def __init__(self, name, parent=None):
-        self.name = name
-        self.parent = parent
-        self.size = 0  # Tamanho padrão para nós
-
-class FileNode(Node):
-    """Representa um arquivo."""
-    def __init__(self, name, size, parent=None, content=None):
-        super().__init__(name, parent)
-        self.size = size
-        self.content = content # Conteúdo do arquivo, pode ser string ou bytes
-
-class DirectoryNode(Node):
-    """Representa um diretório."""
-    def __init__(self, name, parent=None):
-        super().__init__(name, parent)
-        self.children = []
-
-    def get_child(self, name):
-        """Retorna um nó filho pelo nome, ou None se não existir."""
-        for child in self.children:
-            if child.name == name:
-                return child
-        return None
-
-    def get_size(self):
-        """Calcula o tamanho total do diretório (soma dos tamanhos dos arquivos)."""
-        total_size = 0
-        for child in self.children:
-            if isinstance(child, FileNode):
-                total_size += child.size
-            elif isinstance(child, DirectoryNode):
-                total_size += child.get_size()
-        return total_size
-
-class FileSystem:
-    def __init__(self, max_size):
-        self.root = None
-        self.cwd = None  
-        self.trash = None # Diretório da Lixeira
-        self.total_disk_usage = 0
-        self.max_size = max_size
-
-    def mkdir(self, name):
-        """Cria um novo diretório."""
-        if not name:
-            raise ValueError("Nome do diretório não pode ser vazio.")
-        if self.cwd.get_child(name):
-            raise FileExistsError(f"O diretório '{name}' já existe.")
-        
-        new_dir = DirectoryNode(name, self.cwd)
-        self.cwd.children.append(new_dir)
+from tkinter import filedialog, simpledialog, messagebox, ttk
+import time
+import filesystem
+import metricas
+from eventos import DELETE, MOVE, RESTORE, TRASH
+from filesystem import DirectoryNode, FileNode, FileSystem, fs
+from listagem import VirtualListing
+from persistencia import DiskImage
+from tarefas import Scheduler
+from travas import lock_nodes
 
-    def touch(self, name, size, content=None):
-        """Cria um novo arquivo."""
-        if not name:
-            raise ValueError("Nome do arquivo não pode ser vazio.")
-        if self.cwd.get_child(name):
-            raise FileExistsError(f"O arquivo '{name}' já existe.")
-        if self.total_disk_usage + size > self.max_size:
-            raise MemoryError("Espaço em disco insuficiente.")
-        
-        new_file = FileNode(name, size, self.cwd, content)
-        self.cwd.children.append(new_file)
-        self.total_disk_usage += size
+# A listagem virtualizada dá conta de pastas grandes: a interface não
+# impõe o limite didático de filhos por diretório
+filesystem.MAX_CHILDREN = None
 
-    def rm(self, name, to_trash=True):
-        """Remove um arquivo ou diretório, movendo para a Lixeira se to_trash for True."""
-        node = self.cwd.get_child(name)
-        if not node:
-            raise FileNotFoundError(f"'{name}' não encontrado.")
-
-        if to_trash and self.cwd != self.trash:
-            # Move para a lixeira
-            self.cwd.children.remove(node)
-            node.parent = self.trash
-            self.trash.children.append(node)
-            messagebox.showinfo("Sucesso", f"'{name}' movido para a Lixeira.")
-        else:
-            # Remove permanentemente
-            self.cwd.children.remove(node)
-            if isinstance(node, FileNode):
-                self.total_disk_usage -= node.size
-            elif isinstance(node, DirectoryNode):
-                self.total_disk_usage -= node.get_size()
-            messagebox.showinfo("Sucesso", f"'{name}' removido permanentemente.")
-
-    def cd(self, name):
-        """Muda o diretório atual."""
-        if name == "..":
-            if self.cwd.parent:
-                self.cwd = self.cwd.parent
-            return
-        
-        node = self.cwd.get_child(name)
-        if not isinstance(node, DirectoryNode):
-            raise NotADirectoryError(f"'{name}' não é um diretório.")
-        self.cwd = node
-
-    def stat(self, name):
-        """Retorna informações sobre um arquivo ou diretório."""
-        node = self.cwd.get_child(name)
-        if not node:
-            raise FileNotFoundError(f"'{name}' não encontrado.")
-        
-        info = {
-            "Nome": node.name,
-            "Tipo": "Diretório" if isinstance(node, DirectoryNode) else "Arquivo",
-            "Caminho": self.get_path(node),
-            "Tamanho": f"{node.size} bytes" if isinstance(node, FileNode) else "Variável"
-        }
-        return info
+TEXT_PROBE = 4096  # bytes examinados para decidir se um arquivo é texto
 
-    def get_disk_usage(self):
-        """Retorna o uso total do disco."""
-        return self.total_disk_usage
 
-    def restore_from_trash(self, name):
-        """Restaura um item da Lixeira para seu local original."""
-        node = self.trash.get_child(name)
-        if not node:
-            raise FileNotFoundError(f"'{name}' não encontrado na Lixeira.")
+def open_backend(path=None):
+    """Sistema de arquivos da interface: em memória, ou sobre a imagem em disco dada (criada se não existir)."""
+    if path is None:
+        return fs
+    image = DiskImage(path) if os.path.exists(path) else DiskImage.create(path)
+    return FileSystem(image)
 
-        original_parent = node.parent if hasattr(node, "parent") and node.parent != self.trash else self.root
 
-        # Verifica se o nó já existe no diretório de destino
-        if original_parent.get_child(node.name):
-            raise FileExistsError(f"Já existe um item com o nome '{node.name}' no diretório raiz. Renomeie o item antes de restaurá-lo.")
+def display_path(node):
+    """Caminho exibido na interface, a partir da unidade C:."""
+    return "C:" + node.path
 
-        # Remove da lixeira
-        self.trash.children.remove(node)
-        
-        # Restaura para o diretório pai original
-        node.parent = original_parent
-        original_parent.children.append(node)
-
-    def update_file_size(self, file_node, new_size):
-        """Atualiza o tamanho de um arquivo e do uso total do disco."""
-        size_difference = new_size - file_node.size
-        if self.total_disk_usage + size_difference > self.max_size:
-            raise MemoryError("Espaço em disco insuficiente para salvar o arquivo com o novo tamanho.")
-        self.total_disk_usage += size_difference
-        file_node.size = new_size
-
-    def get_path(self, node):
-        """Obtém o caminho completo de um nó."""
-        path_nodes = []
-        current = node
-        while current and current.name != "C:":
-            path_nodes.insert(0, current.name)
-            current = current.parent
-        full_path = "C:/" + "/".join(path_nodes)
-        return full_path
-
-fs = FileSystem(MAX_DISK_SIZE)
-if not fs.root:
-    fs.root = DirectoryNode("C:")
-    fs.cwd = fs.root
-    
-    fs.mkdir("Lixeira")
-    fs.trash = fs.root.get_child("Lixeira")
+
+def is_text(node):
+    """Arquivos sem bytes nulos no início são exibidos e editados como texto."""
+    return b"\0" not in fs.read(node, 0, min(node.size, TEXT_PROBE))
+
+
+SEARCH_PAGE_SIZE = 200
+POLL_INTERVAL = 50  # ms entre as verificações das tarefas em segundo plano
+METRICS_INTERVAL = 1000  # ms entre as atualizações do painel de métricas
+PROFILE_SECONDS = 10  # janela de amostragem do perfil gravado pelo painel
 
 class FileExplorer(tk.Tk):
     def __init__(self):
@@ -204,6 +78,8 @@ class FileExplorer(tk.Tk):
         tk.Button(left_frame, text="📝 Criar Arquivo", command=self.touch, **btn_style).pack(side="left", padx=3)
         tk.Button(left_frame, text="🗑️ Remover", command=self.rm, **btn_style).pack(side="left", padx=3)
         tk.Button(left_frame, text="⬆️ Voltar", command=self.cd_up, **btn_style).pack(side="left", padx=3)
+        tk.Button(left_frame, text="🧹 Esvaziar", command=self.empty_trash, **btn_style).pack(side="left", padx=3)
+        tk.Button(left_frame, text="📊 Métricas", command=self.show_metrics, **btn_style).pack(side="left", padx=3)
 
         self.paste_btn = tk.Button(left_frame, text="📋 Colar", command=self.paste_node, **self.paste_btn_style_disabled, state="disabled")
         self.paste_btn.pack(side="left", padx=3)
@@ -211,6 +87,10 @@ class FileExplorer(tk.Tk):
         right_frame = tk.Frame(self.top_frame, bg="#2f3640")
         right_frame.pack(side="right", padx=10)
 
+        self.search_mode = tk.StringVar(value="Nome")
+        ttk.Combobox(right_frame, textvariable=self.search_mode, values=("Nome", "Conteúdo"),
+                     state="readonly", width=9).pack(side="left", padx=(0, 5))
+
         self.search_var = tk.StringVar()
         search_entry = tk.Entry(right_frame, textvariable=self.search_var, width=25,
                                  font=("Segoe UI", 10), relief="flat", bg="#f1f2f6")
@@ -235,8 +115,17 @@ class FileExplorer(tk.Tk):
         self.main_frame = tk.Frame(self, bg="#e6e6e6")
         self.main_frame.pack(fill="both", expand=True, padx=10, pady=5)
 
-        self.canvas = tk.Canvas(self.main_frame, bg="#e6e6e6", highlightthickness=0)
-        self.scrollbar = tk.Scrollbar(self.main_frame, orient="vertical", command=self.canvas.yview)
+        # Listagem do diretório atual: só as linhas visíveis existem na tela
+        self.listing = VirtualListing(self.main_frame, on_activate=self.activate,
+                                      is_dir=lambda n: isinstance(n, DirectoryNode))
+        self.listing.pack(fill="both", expand=True)
+        self.listed_dir = None
+        self.info_windows = {}  # nó -> rótulo da janela de informações aberta
+
+        # Resultados de pesquisa, exibidos no lugar da listagem
+        self.results_frame = tk.Frame(self.main_frame, bg="#e6e6e6")
+        self.canvas = tk.Canvas(self.results_frame, bg="#e6e6e6", highlightthickness=0)
+        self.scrollbar = tk.Scrollbar(self.results_frame, orient="vertical", command=self.canvas.yview)
         self.scrollable_frame = tk.Frame(self.canvas, bg="#e6e6e6")
 
         self.scrollable_frame.bind(
@@ -249,57 +138,252 @@ class FileExplorer(tk.Tk):
 
         self.canvas.pack(side="left", fill="both", expand=True)
         self.scrollbar.pack(side="right", fill="y")
-
+        self.result_rows = {}  # nó -> rótulo da linha de resultado
+        self.describe_result = None
+
+        # Tarefas em segundo plano (remoção, colagem, pesquisa), com progresso e cancelamento
+        self.jobs_frame = tk.Frame(self, bg="#e6e6e6")
+        self.jobs_frame.pack(fill="x", side="bottom", padx=10, pady=(0, 5))
+        self.scheduler = Scheduler()
+        self.job_rows = {}  # job -> (linha, barra de progresso)
+        self.busy = {}  # nó sendo removido -> job
+        self.protocol("WM_DELETE_WINDOW", self.close)
+
+        # A tela acompanha as alterações pelos eventos do sistema de arquivos;
+        # os emitidos pelas tarefas são aplicados na thread do Tk
+        self.watch = fs.events.subscribe(lambda events: self.scheduler.call_soon(self.on_events, events))
         self.refresh()
+        self.after(POLL_INTERVAL, self.poll_jobs)
 
     #  Funções de interface 
     def refresh(self):
-        """Atualiza a exibição do explorador de arquivos."""
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
+        """Exibe o diretório atual, refazendo a listagem só se ele mudou.
 
-        full_path = fs.get_path(fs.cwd)
-        self.path_label.config(text=full_path)
+        Alterações dentro do diretório chegam por on_events, que aplica à
+        listagem apenas os nós afetados.
+        """
+        if not self.listing.winfo_ismapped():
+            self.results_frame.pack_forget()
+            self.listing.pack(fill="both", expand=True)
+            self.result_rows = {}
 
-        uso_atual = fs.get_disk_usage()
-        self.disk_label.config(text=f"Uso de disco: {uso_atual}/{MAX_DISK_SIZE} bytes")
-        self.disk_progress['value'] = (uso_atual / MAX_DISK_SIZE) * 100
+        full_path = display_path(fs.cwd)
+        self.path_label.config(text=full_path)
 
-        for node in fs.cwd.children:
-            frame = tk.Frame(self.scrollable_frame, bg="#ffffff", bd=0, relief="flat")
-            frame.pack(fill="x", pady=2, padx=2)
+        if self.listed_dir is not fs.cwd:
+            self.listed_dir = fs.cwd
+            with lock_nodes(fs.cwd, write=False):
+                self.listing.set_items(list(fs.cwd.children.values()))
+        self.update_status()
+
+    def update_status(self):
+        """Atualiza a barra de uso do disco e o botão Colar."""
+        stats = fs.get_disk_stats()
+        # A barra mostra o espaço físico; o lógico conta cada cópia por inteiro
+        uso_atual = stats["physical"]
+        self.disk_label.config(text=f"Uso de disco: {uso_atual}/{stats['capacity']} bytes "
+                                    f"(lógico: {stats['used']} bytes) | "
+                                    f"lixeira: {stats['trash']}/{stats['trash_quota'] if stats['trash_quota'] is not None else '∞'} bytes | "
+                                    f"maior região livre: {stats['largest_free']} bytes | "
+                                    f"fragmentação: {stats['fragmentation']:.0%}")
+        self.disk_progress['value'] = (uso_atual / stats['capacity']) * 100
 
-            if isinstance(node, DirectoryNode):
-                b = tk.Button(frame, text=f"📁 {node.name}", anchor="w", font=("Consolas", 11, "bold"),
-                                 bg="#cce5ff", fg="#003366", relief="flat",
-                                 activebackground="#99ccff", command=lambda n=node: self.open_dir(n))
-                b.pack(fill="x", padx=5, pady=2)
-            else:
-                b = tk.Button(frame, text=f"{node.name} ({node.size} bytes)", anchor="w", font=("Consolas", 11),
-                                 bg="#e6ffe6", fg="#004d00", relief="flat",
-                                 activebackground="#ccffcc", command=lambda n=node: self.show_info(n))
-                b.pack(fill="x", padx=5, pady=2)
-        
         if self.copied_node is None:
             self.paste_btn.config(state="disabled", **self.paste_btn_style_disabled)
         else:
             self.paste_btn.config(state="normal", **self.paste_btn_style_active)
 
+    def on_events(self, events):
+        """Aplica à listagem, aos resultados e às janelas abertas só o que mudou."""
+        self._apply_events(events)
+        self.update_status()
+
+    def _apply_events(self, events):
+        # Um lote grande (bulk_create, remoção em lotes) redesenha a listagem uma vez só
+        with self.listing.batch():
+            self._apply_to_listing(events)
+
+    def _apply_to_listing(self, events):
+        cwd = self.listed_dir
+        below = set()  # pastas do diretório atual cujo total mudou
+        moved = False
+        for event in events:
+            node = event.node
+            if cwd is not None:
+                if event.parent == cwd.ino:
+                    if node in self.listing:
+                        self.listing.update(node)
+                    else:
+                        self.listing.insert(node)
+                elif event.old_parent == cwd.ino:
+                    self.listing.remove(node)
+                for chain in (event.ancestors, event.old_ancestors):
+                    if cwd.ino in chain[1:]:
+                        below.add(chain[chain.index(cwd.ino) - 1])
+            moved = moved or event.kind in (DELETE, TRASH, RESTORE, MOVE)
+            label = self.info_windows.get(node)
+            if label is not None and event.kind != DELETE:
+                label.config(text=self.info_text(node))
+            if node in self.result_rows and self.describe_result is not None:
+                self.result_rows[node].config(text=self.describe_result(node))
+        for ino in below:
+            entry = fs.file_index.entries.get(ino)
+            node = entry.node if entry is not None else None
+            if node in self.listing:
+                self.listing.update(node)
+        if moved:
+            self.update_results()
+            for node, label in list(self.info_windows.items()):
+                if node.ino not in fs.file_index:
+                    label.winfo_toplevel().destroy()
+
+    # Tarefas em segundo plano
+    def start_job(self, title, fn, on_done=None):
+        """Roda fn(job) em segundo plano, com uma linha de progresso e um botão Cancelar."""
+        job = self.scheduler.submit(title, fn, on_done=on_done,
+                                    on_error=lambda e: messagebox.showerror("Erro", f"{title}: {e}"))
+        row = tk.Frame(self.jobs_frame, bg="#dfe4ea")
+        row.pack(fill="x", pady=1)
+        tk.Label(row, text=title, font=("Consolas", 10), bg="#dfe4ea").pack(side="left", padx=5)
+        bar = ttk.Progressbar(row, orient="horizontal", length=250, mode="determinate")
+        bar.pack(side="left", padx=5)
+        tk.Button(row, text="Cancelar", command=job.cancel, bg="#f5c6cb", relief="flat").pack(side="right", padx=5)
+        self.job_rows[job] = (row, bar)
+        return job
+
+    def poll_jobs(self):
+        """Entrega na thread do Tk os resultados e eventos das tarefas e atualiza o progresso."""
+        self.scheduler.poll()
+        for job, (row, bar) in list(self.job_rows.items()):
+            if job not in self.scheduler.jobs:
+                row.destroy()
+                del self.job_rows[job]
+            elif job.fraction is None:
+                bar.config(mode="indeterminate")
+                bar.step(5)
+            else:
+                bar.config(mode="determinate", value=job.fraction * 100)
+        self.after(POLL_INTERVAL, self.poll_jobs)
+
+    def is_busy(self, node):
+        job = self.busy.get(node)
+        return job is not None and job in self.scheduler.jobs
+
+    def close(self):
+        self.scheduler.shutdown(cancel=True)
+        fs.close()
+        self.destroy()
+
+    # Painel de métricas
+    def show_metrics(self):
+        """Janela de depuração com as métricas por operação e dos caches, atualizada periodicamente."""
+        win = tk.Toplevel(self)
+        win.title("Métricas")
+        win.geometry("760x420")
+
+        controls = tk.Frame(win)
+        controls.pack(fill="x", padx=10, pady=5)
+        enabled = tk.BooleanVar(value=fs.metrics()["enabled"])
+
+        def toggle():
+            if enabled.get():
+                fs.enable_metrics()
+            else:
+                fs.disable_metrics()
+            update()
+
+        tk.Checkbutton(controls, text="Registrar métricas", variable=enabled, command=toggle).pack(side="left")
+        tk.Button(controls, text="Zerar", command=lambda: (fs.metrics(reset=True), update()),
+                  bg="#f1f2f6", relief="flat").pack(side="left", padx=5)
+        tk.Button(controls, text=f"Gravar perfil ({PROFILE_SECONDS} s)", command=self.record_profile,
+                  bg="#f1f2f6", relief="flat").pack(side="left", padx=5)
+
+        columns = {"calls": ("Chamadas", 80), "errors": ("Erros", 60), "p50": ("p50 (ms)", 90),
+                   "p99": ("p99 (ms)", 90), "max": ("Máx. (ms)", 90), "walk": ("Nós p99", 80)}
+        table = ttk.Treeview(win, columns=list(columns))
+        table.heading("#0", text="Operação")
+        table.column("#0", width=160)
+        for column, (title, width) in columns.items():
+            table.heading(column, text=title)
+            table.column(column, width=width, anchor="e")
+        table.pack(fill="both", expand=True, padx=10)
+        caches = tk.Label(win, font=("Consolas", 10), justify="left", anchor="w")
+        caches.pack(fill="x", padx=10, pady=5)
+
+        def update():
+            if not win.winfo_exists():
+                return
+            snapshot = fs.metrics()
+            table.delete(*table.get_children())
+            for name, op in snapshot["operations"].items():
+                table.insert("", "end", text=name, values=(
+                    op["calls"], op["errors"], f"{op['p50_s'] * 1000:.3f}", f"{op['p99_s'] * 1000:.3f}",
+                    f"{op['max_s'] * 1000:.3f}", f"{op['walk_p99']:.0f}"))
+            dentry = snapshot["caches"]["dentry"]
+            lines = [f"Dentries: {dentry['entries']} em cache, acertos {dentry['hit_rate']:.1%} "
+                     f"({dentry['hits']}/{dentry['hits'] + dentry['misses']})",
+                     f"Nós em memória: {snapshot['nodes']}"
+                     f"{' | indexando conteúdo' if snapshot['content_pending'] else ''}"]
+            pages = snapshot["caches"]["pages"]
+            if pages is not None:
+                lines.append(f"Páginas ({pages['policy']}): {pages['pages']}/{pages['capacity']}, "
+                             f"acertos {pages['hit_rate']:.1%}, despejos {pages['evictions']}, "
+                             f"sujas {pages['dirty']}")
+            caches.config(text="\n".join(lines))
+
+        def tick():
+            if win.winfo_exists():
+                update()
+                win.after(METRICS_INTERVAL, tick)
+
+        tick()
+
+    def record_profile(self):
+        """Amostra as pilhas de todas as threads em segundo plano e grava no formato do flamegraph."""
+        path = filedialog.asksaveasfilename(title="Gravar perfil", defaultextension=".folded",
+                                            filetypes=[("Pilhas para flamegraph", "*.folded")])
+        if not path:
+            return
+        self.start_job(f"Gravando perfil ({PROFILE_SECONDS} s)",
+                       lambda job: metricas.sample_stacks(path, PROFILE_SECONDS, job=job),
+                       on_done=lambda samples: messagebox.showinfo(
+                           "Perfil", f"{samples} amostras gravadas em {path}"))
+
+    def activate(self, node):
+        """Abre a pasta ou exibe as informações do arquivo clicado na listagem."""
+        if isinstance(node, DirectoryNode):
+            self.open_dir(node)
+        else:
+            self.show_info(node)
+
     def open_dir(self, node):
         """Muda o diretório atual para o nó selecionado."""
         fs.cwd = node
         self.refresh()
 
+    def info_text(self, node):
+        info = fs.stat(node)
+        lines = [
+            f"Nome: {info['name']}",
+            f"Tipo: {'Diretório' if info['type'] == 'dir' else 'Arquivo'}",
+            f"Caminho: {display_path(node)}",
+            f"Tamanho: {info['size']} bytes",
+            f"Modificado: {time.strftime('%d/%m/%Y %H:%M:%S', time.localtime(info['mtime']))}",
+        ]
+        if info["type"] == "dir":
+            lines.append(f"Conteúdo: {info['files']} arquivos, {info['dirs']} pastas")
+        return "\n".join(lines)
+
     def show_info(self, node):
-        """Exibe uma janela com informações sobre o arquivo ou pasta."""
-        info = fs.stat(node.name)
-        text = "\n".join(f"{k}: {v}" for k, v in info.items())
+        """Exibe uma janela com informações sobre o arquivo ou pasta, mantida atualizada."""
         info_win = tk.Toplevel(self)
         info_win.title(f"Informações: {node.name}")
-        info_label = tk.Label(info_win, text=text, justify="left", font=("Consolas", 10))
+        info_label = tk.Label(info_win, text=self.info_text(node), justify="left", font=("Consolas", 10))
         info_label.pack(padx=10, pady=10)
+        self.info_windows[node] = info_label
+        info_label.bind("<Destroy>", lambda e: self.info_windows.pop(node, None))
 
-        if isinstance(node, FileNode) and isinstance(getattr(node, "content", None), str):
+        if isinstance(node, FileNode) and is_text(node):
             def open_text():
                 text_win = tk.Toplevel(self)
                 text_win.title(f"Conteúdo: {node.name}")
@@ -324,14 +408,14 @@ class FileExplorer(tk.Tk):
                     text_box.insert("1.0", node.content)
 
                     def save_edit():
-                        new_content = text_box.get("1.0", tk.END).rstrip("\n")
-                        new_size = len(new_content.encode("utf-8"))
+                        new_data = text_box.get("1.0", tk.END).rstrip("\n").encode("utf-8")
 
                         try:
-                            fs.update_file_size(node, new_size)
-                            node.content = new_content
+                            # Chunks sem alteração não são regravados; um único evento MODIFY
+                            with fs.batch():
+                                fs.write(node, 0, new_data)
+                                fs.truncate(node, len(new_data))
                             edit_win.destroy()
-                            self.refresh()
                             messagebox.showinfo("Sucesso", f"Arquivo '{node.name}' atualizado com sucesso!")
                         except Exception as e:
                             messagebox.showerror("Erro", str(e))
@@ -345,21 +429,37 @@ class FileExplorer(tk.Tk):
 
         if fs.cwd == fs.trash:
             def restore_node():
+                if self.is_busy(node):
+                    messagebox.showerror("Erro", f"'{node.name}' está sendo removido.")
+                    return
                 try:
                     fs.restore_from_trash(node.name)
                     messagebox.showinfo("Sucesso", f"'{node.name}' foi restaurado!")
                     info_win.destroy()
-                    self.refresh()
                 except Exception as e:
                     messagebox.showerror("Erro", str(e))
             restore_btn = tk.Button(info_win, text="♻️ Restaurar", command=restore_node, bg="#cce5ff")
             restore_btn.pack(pady=5)
         
+        if fs.cwd != fs.trash:
+            def rename_node():
+                new_name = simpledialog.askstring("Renomear", "Novo nome:", initialvalue=node.name, parent=info_win)
+                if not new_name or new_name == node.name:
+                    return
+                try:
+                    # Nome já usado na pasta: o rename escolhe "<nome>_n"
+                    fs.rename(node, node.parent, name=new_name)
+                    info_win.title(f"Informações: {node.name}")
+                except Exception as e:
+                    messagebox.showerror("Erro", str(e))
+            rename_btn = tk.Button(info_win, text="🏷️ Renomear", command=rename_node, bg="#fff3cd")
+            rename_btn.pack(pady=5)
+
         def copy_node():
             self.copied_node = node
             messagebox.showinfo("Copiado", f"'{node.name}' foi copiado. Vá para a pasta de destino e clique em 'Colar'.")
             info_win.destroy()
-            self.refresh()
+            self.update_status()
             
         copy_btn = tk.Button(info_win, text="📄 Copiar", command=copy_node, bg="#e5e5ff", fg="black")
         copy_btn.pack(pady=5)
@@ -387,7 +487,6 @@ class FileExplorer(tk.Tk):
             fs.mkdir(name)
         except Exception as e:
             messagebox.showerror("Erro", str(e))
-        self.refresh()
 
     # Criar arquivo
     def touch(self):
@@ -433,12 +532,12 @@ class FileExplorer(tk.Tk):
             text_box.pack(padx=10, pady=5, fill="both", expand=True)
 
             def save_text():
-                content = text_box.get("1.0", tk.END).rstrip("\n")
-                size = len(content.encode("utf-8"))
+                data = text_box.get("1.0", tk.END).rstrip("\n").encode("utf-8")
                 try:
-                    fs.touch(name, size, content)
+                    # Criado já com o tamanho final, para checar o espaço antes de gravar
+                    with fs.batch():
+                        fs.write(fs.touch(name, len(data)), 0, data)
                     text_win.destroy()
-                    self.refresh()
                 except Exception as e:
                     messagebox.showerror("Erro", str(e))
 
@@ -463,7 +562,6 @@ class FileExplorer(tk.Tk):
                 fs.touch(name, size)
             except Exception as e:
                 messagebox.showerror("Erro", str(e))
-            self.refresh()
 
     # Remover 
     def rm(self):
@@ -472,23 +570,39 @@ class FileExplorer(tk.Tk):
         if not selected:
             return
         
-        node = fs.cwd.get_child(selected)
+        node = fs.cwd.children.get(selected)
         if not node:
-            messagebox.showerror("Erro", f"Nó '{selected}' não encontrado em {fs.get_path(fs.cwd)}")
+            messagebox.showerror("Erro", f"Nó '{selected}' não encontrado em {display_path(fs.cwd)}")
             return
         
         confirmar = messagebox.askyesno("Confirmação", f"Você deseja realmente apagar '{selected}'?")
         if not confirmar:
             return
             
+        if fs.cwd == fs.trash:
+            # A remoção definitiva percorre a subárvore inteira: roda em segundo plano
+            if self.is_busy(node):
+                messagebox.showinfo("Remover", f"'{selected}' já está sendo removido.")
+                return
+            self.busy[node] = self.start_job(
+                f"Removendo '{selected}'", lambda job: fs.delete_from_trash(node.name, job),
+                on_done=lambda _: messagebox.showinfo("Sucesso", f"'{selected}' removido permanentemente."))
+            return
         try:
-            if fs.cwd == fs.trash:
-                fs.rm(node.name, to_trash=False)
-            else:
-                fs.rm(node.name, to_trash=True)
+            fs.rm(node.name, to_trash=True)
+            messagebox.showinfo("Sucesso", f"'{selected}' movido para a Lixeira.")
         except Exception as e:
             messagebox.showerror("Erro", str(e))
-        self.refresh()
+
+    def empty_trash(self):
+        """Apaga de vez todos os itens da Lixeira, em segundo plano."""
+        if not fs.trash.children:
+            messagebox.showinfo("Lixeira", "A Lixeira já está vazia.")
+            return
+        if not messagebox.askyesno("Confirmação", "Apagar permanentemente todos os itens da Lixeira?"):
+            return
+        self.start_job("Esvaziando a Lixeira", lambda job: fs.purge_trash(0, job),
+                       on_done=lambda count: messagebox.showinfo("Sucesso", f"{count} itens apagados da Lixeira."))
 
     # Voltar 
     def cd_up(self):
@@ -506,34 +620,53 @@ class FileExplorer(tk.Tk):
         if not query:
             messagebox.showwarning("Pesquisa", "Digite um nome para pesquisar!")
             return
-        results = []
-
-        def recursive_search(node, path=""):
-            # Adiciona o próprio nó se ele corresponder à consulta
-            current_path = path + "/" + node.name if path else "/" + node.name
-            if query.lower() in node.name.lower():
-                results.append((node, current_path))
-            
-            # Se for um diretório, continua a busca nos filhos
-            if isinstance(node, DirectoryNode):
-                for child in node.children:
-                    recursive_search(child, current_path)
-
-        recursive_search(fs.root, path="C:")
-
+        if self.search_mode.get() == "Conteúdo":
+            self.search_content(query)
+            return
+        # Consulta o índice de nomes; só a primeira página é exibida
+        def find(job):
+            nodes = fs.find(query, limit=SEARCH_PAGE_SIZE)
+            nodes.sort(key=lambda node: node.path)
+            return nodes
+
+        self.start_job(f"Pesquisando '{query}'", find, on_done=lambda nodes: self.show_results(
+            query, nodes, lambda node: f"{node.name} - {display_path(node)}"))
+
+    def search_content(self, query):
+        """Pesquisa no conteúdo dos arquivos, esperando a indexação sem travar a janela."""
+        def search(job):
+            while fs.content_index.pending():
+                job.check()
+                time.sleep(POLL_INTERVAL / 1000)
+            return fs.search_content(query, limit=SEARCH_PAGE_SIZE, wait=False)
+
+        def show(results):
+            snippets = {r["node"]: r["snippet"] for r in results}
+            self.show_results(query, [r["node"] for r in results],
+                              lambda node: f"{display_path(node)} - {snippets[node]}")
+
+        self.start_job(f"Pesquisando '{query}' no conteúdo", search, on_done=show)
+
+    def show_results(self, query, results, describe):
+        """Exibe os nós encontrados por uma pesquisa; describe(nó) dá o texto de cada linha."""
         if not results:
             messagebox.showinfo("Pesquisa", f"Nenhum resultado encontrado para '{query}'")
             return
         
-        # Limpa e exibe os resultados
+        # Limpa e exibe os resultados no lugar da listagem
+        self.listing.pack_forget()
+        self.results_frame.pack(fill="both", expand=True)
         for widget in self.scrollable_frame.winfo_children():
             widget.destroy()
+        self.result_rows = {}
+        self.describe_result = describe
 
-        for node, full_path in results:
+        for node in results:
             frame = tk.Frame(self.scrollable_frame, bg="#ffffcc", bd=1, relief="solid")
             frame.pack(fill="x", pady=2, padx=2)
-            label = tk.Label(frame, text=f"{node.name} - {full_path}", anchor="w", bg="#ffffcc")
+            label = tk.Label(frame, text=describe(node), anchor="w", bg="#ffffcc")
             label.pack(side="left", padx=5, pady=2, fill="x", expand=True)
+            self.result_rows[node] = label
 
             def go_to(n=node):
                 if n.parent:
@@ -545,6 +678,15 @@ class FileExplorer(tk.Tk):
 
             btn = tk.Button(frame, text="Ir para o local do arquivo", command=go_to, bg="#cce5ff")
             btn.pack(side="right", padx=5, pady=2)
+
+    def update_results(self):
+        """Tira dos resultados os nós apagados e atualiza o caminho dos que mudaram de lugar."""
+        for node, label in list(self.result_rows.items()):
+            if node.ino not in fs.file_index:
+                label.master.destroy()
+                del self.result_rows[node]
+            else:
+                label.config(text=self.describe_result(node))
     
     #  Colar 
     def paste_node(self):
@@ -565,38 +707,17 @@ class FileExplorer(tk.Tk):
             messagebox.showerror("Erro", "Não é permitido colar itens na Lixeira!")
             return
 
-        try:
-            new_node = copy.deepcopy(self.copied_node)
-        except Exception as e:
-            messagebox.showerror("Erro", f"Erro ao copiar o nó: {e}")
-            return
-
-        original_name = new_node.name
-        counter = 1
-        new_name_attempt = original_name
-        
-        if fs.cwd.get_child(new_name_attempt):
-            new_name_attempt = f"{original_name} - Cópia"
-            if fs.cwd.get_child(new_name_attempt):
-                while fs.cwd.get_child(f"{original_name} - Cópia({counter})"):
-                    counter += 1
-                new_name_attempt = f"{original_name} - Cópia({counter})"
-        
-        new_node.name = new_name_attempt
-        
-        new_node.parent = fs.cwd
-        fs.cwd.children.append(new_node)
-        
-        if isinstance(new_node, FileNode):
-            fs.total_disk_usage += new_node.size
-        elif isinstance(new_node, DirectoryNode):
-            total_size = new_node.get_size()
-            fs.total_disk_usage += total_size
-
+        # Cópias de subárvores grandes rodam em segundo plano; a navegação continua.
+        # Em caso de conflito, copy_node escolhe o nome "<nome> - Cópia(n)"
+        source, target = self.copied_node, fs.cwd
+        self.start_job(f"Colando '{source.name}'",
+                       lambda job: fs.copy_node(source, target, job),
+                       on_done=lambda new_node: messagebox.showinfo("Sucesso", f"'{new_node.name}' colado com sucesso!"))
         self.copied_node = None
-        self.refresh()
-        messagebox.showinfo("Sucesso", f"'{new_node.name}' colado com sucesso!")
+        self.update_status()
         
 if __name__ == "__main__":
+    # python interface.py [disco.img]: sem argumento, o sistema de arquivos fica em memória
+    fs = open_backend(sys.argv[1] if len(sys.argv) > 1 else None)
     app = FileExplorer()
     app.mainloop()
@@ -0,0 +1,333 @@
+"""Journal de metadados (write-ahead log) da imagem de disco.
+
+Cada operação do FileSystem é uma transação. As escritas de metadados
+(superbloco, bitmaps, tabela de inodes e entradas de diretório) não vão
+direto para a imagem: ficam em cópias dos blocos afetados em memória e,
+no commit, as imagens completas desses blocos são acrescentadas ao
+journal. Várias transações são gravadas juntas com um único fsync
+(group commit) ao fim de uma janela configurável. No checkpoint os blocos
+são copiados para a imagem, a imagem é sincronizada e o journal é
+truncado. Ao abrir uma imagem, as transações completas do journal são
+reaplicadas; como o journal guarda blocos inteiros, reaplicar é idempotente.
+
+Uma transação interrompida por uma exceção não é gravada: os blocos que
+ela alterou voltam ao estado anterior, e a imagem continua com o último
+estado completo. Transações aninhadas funcionam como savepoints: uma
+exceção na de dentro desfaz só o que ela alterou, e a de fora pode seguir.
+Quem guarda cópias em memória desses metadados (persistencia.DiskImage)
+é avisado por on_rollback, com os blocos desfeitos, para relê-las.
+
+Formato do journal:
+
+    cabeçalho   JOURNAL_MAGIC, tamanho do bloco
+    transação   TX_MAGIC, seq, nº de blocos, nº de revogações
+                (nº do bloco, bytes do bloco) por bloco
+                nº do bloco por revogação
+                COMMIT_MAGIC, seq, crc32 da transação
+"""
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+JOURNAL_MAGIC = b"SOFSJNL1"
+TX_MAGIC = 0x54584E31
+COMMIT_MAGIC = 0x434D5431
+GROUP_COMMIT_WINDOW = 0.005
+CHECKPOINT_BYTES = 4 * 1024 * 1024
+
+HEADER = struct.Struct("<8sI")
+TX_HEADER = struct.Struct("<IQII")
+BLOCK_NO = struct.Struct("<I")
+COMMIT = struct.Struct("<IQI")
+
+
+class Journal:
+    """Journal de blocos de metadados com group commit."""
+
+    def __init__(self, path: str, mm, window: float = GROUP_COMMIT_WINDOW,
+                 checkpoint_bytes: int = CHECKPOINT_BYTES):
+        self.path = path
+        self.mm = mm
+        self.window = window
+        self.checkpoint_bytes = checkpoint_bytes
+        self.block_size = 0
+        self.overlay: Dict[int, bytearray] = {}
+        self.logged: Set[int] = set()
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.seq = 0
+        self.tx_blocks: Set[int] = set()
+        self.tx_revoked: List[int] = []
+        # Por transação aberta: estado de cada bloco antes da primeira alteração
+        # nela (imagem no overlay, se estava na transação, se já estava no
+        # journal) e quantas revogações já havia, para desfazê-la
+        self.savepoints: List[Tuple[Dict[int, Tuple[Optional[bytes], bool, bool]], int]] = []
+        # Chamados com os blocos desfeitos por uma transação ou savepoint
+        self.on_rollback: List[Callable[[Set[int]], None]] = []
+        self.pending: List[bytes] = []
+        self.pending_since = 0.0
+        self.size = 0
+        self.commits = 0
+        self.fsyncs = 0
+        self.replayed = 0
+        self.file = open(path, "a+b")
+        self._closing = False
+        self._wakeup = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="journal-flusher", daemon=True)
+
+    def start(self, block_size: int):
+        """Reaplica o journal existente e passa a aceitar transações."""
+        self.block_size = block_size
+        self.replay()
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(HEADER.pack(JOURNAL_MAGIC, block_size))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.size = HEADER.size
+        self._flusher.start()
+
+    # Leitura e escrita de metadados
+    def read(self, offset: int, n: int) -> bytes:
+        bs = self.block_size
+        first, last = offset // bs, (offset + n - 1) // bs
+        if not self.overlay or all(b not in self.overlay for b in range(first, last + 1)):
+            return self.mm[offset:offset + n]
+        parts = []
+        pos, end = offset, offset + n
+        while pos < end:
+            block = pos // bs
+            stop = min(end, (block + 1) * bs)
+            buf = self.overlay.get(block)
+            if buf is None:
+                parts.append(self.mm[pos:stop])
+            else:
+                parts.append(bytes(buf[pos - block * bs:stop - block * bs]))
+            pos = stop
+        return b"".join(parts)
+
+    def write(self, offset: int, data: bytes):
+        with self.lock:
+            if self.depth:
+                self._write(offset, data)
+            else:
+                with self.transaction():
+                    self._write(offset, data)
+
+    def _write(self, offset: int, data: bytes):
+        bs = self.block_size
+        view = memoryview(data)
+        pos = offset
+        while view:
+            block = pos // bs
+            inner = pos - block * bs
+            take = min(bs - inner, len(view))
+            self._save(block)
+            buf = self.overlay.get(block)
+            if buf is None:
+                buf = self.overlay[block] = bytearray(self.mm[block * bs:(block + 1) * bs])
+            buf[inner:inner + take] = view[:take]
+            self.tx_blocks.add(block)
+            view = view[take:]
+            pos += take
+
+    def _save(self, block: int):
+        """Guarda o estado do bloco antes da primeira alteração na transação mais interna."""
+        if not self.savepoints:
+            return
+        saved = self.savepoints[-1][0]
+        if block not in saved:
+            buf = self.overlay.get(block)
+            saved[block] = (bytes(buf) if buf is not None else None, block in self.tx_blocks,
+                            block in self.logged)
+
+    def revoke(self, blocks):
+        """Impede que imagens antigas destes blocos sejam reaplicadas.
+
+        Usado quando um bloco que já guardou metadados é realocado para
+        dados de arquivo, que são escritos direto na imagem.
+        """
+        with self.lock:
+            for block in blocks:
+                if block in self.logged:
+                    self._save(block)
+                    self.overlay.pop(block, None)
+                    self.tx_blocks.discard(block)
+                    self.logged.discard(block)
+                    self.tx_revoked.append(block)
+
+    # Transações
+    def transaction(self):
+        return _Transaction(self)
+
+    def _begin(self):
+        self.lock.acquire()
+        self.depth += 1
+        self.savepoints.append(({}, len(self.tx_revoked)))
+
+    def _end(self, failed: bool = False):
+        try:
+            saved, revoked = self.savepoints.pop()
+            if failed:
+                self._rollback(saved, revoked)
+            elif self.savepoints:
+                # O que não foi desfeito aqui ainda pode ser desfeito pela transação de fora
+                outer = self.savepoints[-1][0]
+                for block, state in saved.items():
+                    outer.setdefault(block, state)
+            self.depth -= 1
+            if self.depth == 0 and (self.tx_blocks or self.tx_revoked):
+                self._commit()
+        finally:
+            self.lock.release()
+
+    def _rollback(self, saved: Dict[int, Tuple[Optional[bytes], bool, bool]], revoked: int):
+        """Devolve os blocos alterados por uma transação ao estado de antes dela."""
+        for block, (image, in_tx, logged) in saved.items():
+            if image is None:
+                self.overlay.pop(block, None)
+            else:
+                self.overlay[block] = bytearray(image)
+            if in_tx:
+                self.tx_blocks.add(block)
+            else:
+                self.tx_blocks.discard(block)
+            if logged:
+                self.logged.add(block)
+            else:
+                self.logged.discard(block)
+        del self.tx_revoked[revoked:]
+        if saved:
+            for callback in self.on_rollback:
+                callback(set(saved))
+
+    def _commit(self):
+        self.seq += 1
+        blocks = sorted(self.tx_blocks)
+        parts = [TX_HEADER.pack(TX_MAGIC, self.seq, len(blocks), len(self.tx_revoked))]
+        for block in blocks:
+            parts.append(BLOCK_NO.pack(block))
+            parts.append(bytes(self.overlay[block]))
+        parts.extend(BLOCK_NO.pack(block) for block in self.tx_revoked)
+        body = b"".join(parts)
+        record = body + COMMIT.pack(COMMIT_MAGIC, self.seq, zlib.crc32(body))
+        self.logged.update(blocks)
+        self.tx_blocks.clear()
+        self.tx_revoked.clear()
+        if not self.pending:
+            self.pending_since = time.monotonic()
+        self.pending.append(record)
+        self.commits += 1
+        if time.monotonic() - self.pending_since >= self.window:
+            self.flush()
+        else:
+            self._wakeup.set()
+        if self.size >= self.checkpoint_bytes:
+            self.checkpoint()
+
+    def flush(self):
+        """Grava as transações pendentes no journal com um único fsync."""
+        with self.lock:
+            if not self.pending:
+                return
+            data = b"".join(self.pending)
+            self.pending.clear()
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.size += len(data)
+            self.fsyncs += 1
+
+    def checkpoint(self):
+        """Aplica os blocos do journal na imagem e trunca o journal."""
+        with self.lock:
+            if self.depth:
+                return
+            self.flush()
+            bs = self.block_size
+            for block, buf in self.overlay.items():
+                self.mm[block * bs:(block + 1) * bs] = buf
+            self.mm.flush()
+            self.overlay.clear()
+            self.logged.clear()
+            self.file.seek(HEADER.size)
+            self.file.truncate()
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.size = HEADER.size
+
+    def replay(self):
+        """Reaplica na imagem as transações completas encontradas no journal."""
+        self.file.seek(0)
+        raw = self.file.read()
+        if len(raw) < HEADER.size:
+            return
+        magic, block_size = HEADER.unpack_from(raw, 0)
+        if magic != JOURNAL_MAGIC:
+            return
+        transactions = []
+        pos = HEADER.size
+        while pos + TX_HEADER.size <= len(raw):
+            tx_magic, seq, nblocks, nrevoked = TX_HEADER.unpack_from(raw, pos)
+            end = pos + TX_HEADER.size + nblocks * (BLOCK_NO.size + block_size) + nrevoked * BLOCK_NO.size
+            if tx_magic != TX_MAGIC or end + COMMIT.size > len(raw):
+                break
+            commit_magic, commit_seq, crc = COMMIT.unpack_from(raw, end)
+            if commit_magic != COMMIT_MAGIC or commit_seq != seq or zlib.crc32(raw[pos:end]) != crc:
+                break
+            blocks = []
+            p = pos + TX_HEADER.size
+            for _ in range(nblocks):
+                (block,) = BLOCK_NO.unpack_from(raw, p)
+                blocks.append((block, raw[p + BLOCK_NO.size:p + BLOCK_NO.size + block_size]))
+                p += BLOCK_NO.size + block_size
+            revoked = [BLOCK_NO.unpack_from(raw, p + i * BLOCK_NO.size)[0] for i in range(nrevoked)]
+            transactions.append((seq, blocks, revoked))
+            pos = end + COMMIT.size
+        last_revoke = {}
+        for seq, _, revoked in transactions:
+            for block in revoked:
+                last_revoke[block] = seq
+        for seq, blocks, _ in transactions:
+            for block, image in blocks:
+                if last_revoke.get(block, 0) < seq:
+                    self.mm[block * block_size:(block + 1) * block_size] = image
+        if transactions:
+            self.mm.flush()
+            self.seq = transactions[-1][0]
+        self.replayed = len(transactions)
+
+    def close(self):
+        self.checkpoint()
+        self._closing = True
+        self._wakeup.set()
+        if self._flusher.is_alive():
+            self._flusher.join()
+        self.file.close()
+
+    def _flush_loop(self):
+        while not self._closing:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            if self._closing:
+                return
+            delay = self.pending_since + self.window - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.flush()
+
+
+class _Transaction:
+    def __init__(self, journal: Journal):
+        self.journal = journal
+
+    def __enter__(self):
+        self.journal._begin()
+        return self
+
+    def __exit__(self, *exc):
+        # Com uma exceção em andamento, a transação é descartada
+        self.journal._end(failed=exc[0] is not None)
@@ -0,0 +1,204 @@
+"""Listagem virtualizada de diretórios para o explorador de arquivos."""
+import contextlib
+import time
+from bisect import bisect_left
+from tkinter import ttk
+
+ROW_HEIGHT = 22
+
+COLUMNS = {
+    "name": ("Nome", 420),
+    "size": ("Tamanho", 140),
+    "mtime": ("Modificado", 170),
+}
+
+
+def node_size(node):
+    """Tamanho exibido: bytes do arquivo ou total da subárvore do diretório."""
+    return getattr(node, "subtree_size", node.size)
+
+
+class VirtualListing(ttk.Frame):
+    """Lista de um diretório que só cria as linhas visíveis.
+
+    Os nós ficam em uma lista ordenada pela coluna escolhida, com as chaves
+    em uma lista paralela para busca binária. Inserir, remover ou atualizar
+    um nó acha a posição em O(log n), mas desloca o resto das listas, O(n)
+    (uma cópia de ponteiros, rápida até centenas de milhares de linhas),
+    e redesenha as linhas visíveis; dentro de batch() o redesenho é feito
+    uma vez só, no fim. O Treeview tem um item por linha visível,
+    reaproveitado a cada rolagem, e a barra de rolagem é controlada pela
+    posição na lista ordenada.
+    """
+
+    def __init__(self, master, on_activate, is_dir):
+        super().__init__(master)
+        self.on_activate = on_activate
+        self.is_dir = is_dir
+        self.sort_column = "name"
+        self.descending = False
+        self.rows = []   # nós em ordem crescente da chave
+        self.keys = []   # chaves, paralelas a rows
+        self.key_of = {}  # nó -> chave atual
+        self.top = 0
+        self.visible = 1
+        self._batching = 0  # blocos batch() abertos
+        self._stale = False  # redesenho adiado até o fim do batch
+
+        style = ttk.Style(self)
+        style.configure("Listing.Treeview", rowheight=ROW_HEIGHT, font=("Consolas", 11))
+        self.tree = ttk.Treeview(self, columns=tuple(COLUMNS), show="headings",
+                                 style="Listing.Treeview", selectmode="browse")
+        for column, (title, width) in COLUMNS.items():
+            self.tree.heading(column, text=title, command=lambda c=column: self.sort_by(c))
+            self.tree.column(column, width=width, anchor="w" if column == "name" else "e")
+        self.tree.tag_configure("dir", background="#cce5ff", foreground="#003366")
+        self.tree.tag_configure("file", background="#e6ffe6", foreground="#004d00")
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<ButtonRelease-1>", self._on_click)
+        self.tree.bind("<Return>", lambda e: self._activate(self.tree.focus()))
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1, "units"))
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-1, "units"))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(1, "units"))
+
+    # Ordenação
+    def _key(self, node):
+        name = node.name.lower()
+        if self.sort_column == "size":
+            value = node_size(node)
+        elif self.sort_column == "mtime":
+            value = node.mtime
+        else:
+            value = name
+        # Diretórios primeiro; o nome desempata e torna as chaves únicas
+        return (not self.is_dir(node), value, name, node.name)
+
+    def sort_by(self, column):
+        if column == self.sort_column:
+            self.descending = not self.descending
+        else:
+            self.sort_column = column
+            self.descending = False
+        self.set_items(self.rows)
+
+    def _index(self, i):
+        """Posição exibida -> posição na lista crescente."""
+        return len(self.rows) - 1 - i if self.descending else i
+
+    # Conteúdo
+    def set_items(self, nodes):
+        """Substitui todo o conteúdo (ao entrar em outro diretório)."""
+        pairs = sorted(((self._key(n), n) for n in nodes), key=lambda p: p[0])
+        self.keys = [k for k, _ in pairs]
+        self.rows = [n for _, n in pairs]
+        self.key_of = dict(zip(self.rows, self.keys))
+        self.top = 0
+        self.redraw()
+
+    def insert(self, node):
+        key = self._key(node)
+        i = bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.rows.insert(i, node)
+        self.key_of[node] = key
+        self.redraw()
+
+    def remove(self, node):
+        key = self.key_of.pop(node, None)
+        if key is None:
+            return
+        i = bisect_left(self.keys, key)
+        del self.keys[i]
+        del self.rows[i]
+        self.redraw()
+
+    def update(self, node):
+        """Reposiciona e redesenha um nó cujo nome, tamanho ou data mudou."""
+        if node not in self.key_of:
+            return
+        if self._key(node) != self.key_of[node]:
+            self.remove(node)
+            self.insert(node)
+        else:
+            self.redraw()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Adia os redesenhos do bloco para um só no fim, como em um lote de eventos CREATE."""
+        self._batching += 1
+        try:
+            yield self
+        finally:
+            self._batching -= 1
+            if not self._batching and self._stale:
+                self.redraw()
+
+    def __contains__(self, node):
+        return node in self.key_of
+
+    def __len__(self):
+        return len(self.rows)
+
+    # Exibição
+    def redraw(self):
+        if self._batching:
+            self._stale = True
+            return
+        self._stale = False
+        total = len(self.rows)
+        self.top = max(0, min(self.top, total - self.visible))
+        items = self.tree.get_children()
+        wanted = min(self.visible, total - self.top)
+        if len(items) > wanted:
+            self.tree.delete(*items[wanted:])
+            items = items[:wanted]
+        for _ in range(wanted - len(items)):
+            self.tree.insert("", "end")
+        for iid, i in zip(self.tree.get_children(), range(self.top, self.top + wanted)):
+            node = self.rows[self._index(i)]
+            is_dir = self.is_dir(node)
+            name = f"📁 {node.name}" if is_dir else node.name
+            mtime = time.strftime("%d/%m/%Y %H:%M", time.localtime(node.mtime))
+            self.tree.item(iid, values=(name, f"{node_size(node)} bytes", mtime),
+                           tags=("dir" if is_dir else "file",))
+        if total:
+            self.scrollbar.set(self.top / total, (self.top + wanted) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def node_at(self, iid):
+        items = self.tree.get_children()
+        if iid not in items:
+            return None
+        return self.rows[self._index(self.top + items.index(iid))]
+
+    def scroll(self, amount, what="units"):
+        step = self.visible if what == "pages" else 1
+        self.top += int(amount) * step
+        self.redraw()
+
+    def _on_scrollbar(self, action, amount, what=None):
+        if action == "moveto":
+            self.top = int(float(amount) * len(self.rows))
+            self.redraw()
+        else:
+            self.scroll(amount, what)
+
+    def _on_resize(self, event):
+        visible = max(1, event.height // ROW_HEIGHT - 1)  # descontando o cabeçalho
+        if visible != self.visible:
+            self.visible = visible
+            self.redraw()
+
+    def _on_click(self, event):
+        if self.tree.identify_region(event.x, event.y) != "heading":
+            self._activate(self.tree.identify_row(event.y))
+
+    def _activate(self, iid):
+        node = self.node_at(iid) if iid else None
+        if node is not None:
+            self.on_activate(node)
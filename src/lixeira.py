@@ -0,0 +1,213 @@
+"""Registros da lixeira e remoção definitiva em segundo plano.
+
+Cada item no topo da Lixeira tem um TrashRecord com o caminho de onde
+saiu, a data da exclusão e o tamanho. O TrashStore indexa os registros
+pelo ino do item, pela data (para apagar do mais antigo ao mais recente
+quando a lixeira passa da cota) e pelo tamanho. Restaurar não depende do
+diretório de origem ainda existir: o caminho original basta para
+recriá-lo.
+
+Na imagem em disco os registros ficam em um log de operações (ADD e
+REMOVE) guardado nos dados de um inode fora da árvore, escrito dentro da
+transação da operação que alterou a lixeira e compactado quando mais da
+metade das entradas ficou obsoleta. Na memória não há log.
+
+O Purger roda a remoção definitiva dos itens excedentes em uma thread
+própria, para que o rm que estourou a cota não espere apagar subárvores
+grandes.
+"""
+import struct
+import threading
+from bisect import bisect_left, insort
+from typing import Callable, Dict, List, Optional, Tuple
+
+ADD, REMOVE = 1, 2
+# operação, ino, data da exclusão, tamanho, bytes do caminho original (UTF-8, em seguida)
+RECORD = struct.Struct("<BIdQH")
+COMPACT_MIN = 64  # entradas no log antes de considerar a compactação
+
+
+class TrashRecord:
+    """Item no topo da lixeira: de onde saiu, quando e com quantos bytes."""
+
+    __slots__ = ("ino", "original_path", "deleted_at", "size")
+
+    def __init__(self, ino: int, original_path: str, deleted_at: float, size: int):
+        self.ino = ino
+        self.original_path = original_path
+        self.deleted_at = deleted_at
+        self.size = size
+
+    def __repr__(self):
+        return f"TrashRecord({self.ino}, {self.original_path!r}, {self.deleted_at}, {self.size})"
+
+
+def _remove_sorted(items: List[tuple], item: tuple):
+    i = bisect_left(items, item)
+    if i < len(items) and items[i] == item:
+        items.pop(i)
+
+
+class TrashStore:
+    """Registros dos itens da lixeira, por ino, por data de exclusão e por tamanho.
+
+    log, se dado, é o armazenamento dos registros (os dados de um inode da
+    imagem, com read/write/replace e len); os registros são lidos dele na
+    criação e cada alteração é acrescentada a ele.
+    """
+
+    def __init__(self, log=None):
+        self.lock = threading.RLock()
+        self.records: Dict[int, TrashRecord] = {}
+        self.by_time: List[Tuple[float, int]] = []  # (deleted_at, ino) ordenado
+        self.by_size: List[Tuple[int, int]] = []  # (size, ino) ordenado
+        self.size = 0  # soma dos tamanhos registrados
+        self.log = log
+        self.log_entries = 0
+        if log is not None and len(log):
+            self._replay()
+
+    def __len__(self):
+        return len(self.records)
+
+    def __contains__(self, ino: int):
+        return ino in self.records
+
+    def get(self, ino: int) -> Optional[TrashRecord]:
+        return self.records.get(ino)
+
+    def add(self, ino: int, original_path: str, deleted_at: float, size: int) -> TrashRecord:
+        record = TrashRecord(ino, original_path, deleted_at, size)
+        with self.lock:
+            self._remove(ino)
+            self._insert(record)
+            self._append(ADD, record)
+        return record
+
+    def remove(self, ino: int) -> Optional[TrashRecord]:
+        with self.lock:
+            record = self._remove(ino)
+            if record is not None:
+                self._append(REMOVE, record)
+            return record
+
+    # Consultas
+    def oldest(self, n: int = 1) -> List[TrashRecord]:
+        """Os n registros mais antigos, do mais antigo ao mais recente."""
+        with self.lock:
+            return [self.records[ino] for _, ino in self.by_time[:n]]
+
+    def largest(self, n: int = 1) -> List[TrashRecord]:
+        """Os n maiores registros, do maior ao menor."""
+        with self.lock:
+            return [self.records[ino] for _, ino in reversed(self.by_size[-n:])] if n > 0 else []
+
+    def deleted_between(self, since: float, until: float = float("inf")) -> List[TrashRecord]:
+        """Registros com data de exclusão em [since, until], do mais antigo ao mais recente."""
+        with self.lock:
+            lo = bisect_left(self.by_time, (since, -1))
+            hi = bisect_left(self.by_time, (until, float("inf")))
+            return [self.records[ino] for _, ino in self.by_time[lo:hi]]
+
+    # Índices e log
+    def _insert(self, record: TrashRecord):
+        self.records[record.ino] = record
+        insort(self.by_time, (record.deleted_at, record.ino))
+        insort(self.by_size, (record.size, record.ino))
+        self.size += record.size
+
+    def _remove(self, ino: int) -> Optional[TrashRecord]:
+        record = self.records.pop(ino, None)
+        if record is not None:
+            _remove_sorted(self.by_time, (record.deleted_at, ino))
+            _remove_sorted(self.by_size, (record.size, ino))
+            self.size -= record.size
+        return record
+
+    @staticmethod
+    def _encode(op: int, record: TrashRecord) -> bytes:
+        path = record.original_path.encode("utf-8") if op == ADD else b""
+        return RECORD.pack(op, record.ino, record.deleted_at, record.size, len(path)) + path
+
+    def _append(self, op: int, record: TrashRecord):
+        if self.log is None:
+            return
+        self.log_entries += 1
+        if self.log_entries > COMPACT_MIN and self.log_entries > 2 * len(self.records):
+            # Reescreve só os registros vivos, na ordem de exclusão
+            self.log.replace(b"".join(self._encode(ADD, self.records[ino]) for _, ino in self.by_time))
+            self.log_entries = len(self.records)
+        else:
+            self.log.write(len(self.log), self._encode(op, record))
+
+    def _replay(self):
+        raw = self.log.read(0, len(self.log))
+        pos = 0
+        while pos + RECORD.size <= len(raw):
+            op, ino, deleted_at, size, path_len = RECORD.unpack_from(raw, pos)
+            pos += RECORD.size
+            path = raw[pos:pos + path_len].decode("utf-8")
+            pos += path_len
+            self._remove(ino)
+            if op == ADD:
+                self._insert(TrashRecord(ino, path, deleted_at, size))
+            self.log_entries += 1
+
+
+class Purger:
+    """Thread que roda purge() sempre que pedida; pedidos durante uma rodada geram só mais uma."""
+
+    def __init__(self, purge: Callable[[], object]):
+        self.purge = purge
+        self.error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+        self._pending = False
+        self._running = False
+        self._closing = False
+        self._thread: Optional[threading.Thread] = None
+
+    def request(self):
+        with self._cond:
+            if self._closing:
+                return
+            self._pending = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="lixeira-purga", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def wait(self):
+        """Espera a rodada pedida ou em andamento terminar."""
+        with self._cond:
+            while self._pending or self._running:
+                self._cond.wait()
+
+    def close(self):
+        """Termina a rodada em andamento e para a thread; pedidos pendentes são descartados."""
+        with self._cond:
+            self._closing = True
+            self._pending = False
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closing:
+                    self._cond.wait()
+                if self._closing:
+                    return
+                self._pending = False
+                self._running = True
+            try:
+                self.purge()
+                self.error = None
+            except Exception as e:
+                # A próxima rodada tenta de novo; o erro fica para quem consultar
+                self.error = e
+            finally:
+                with self._cond:
+                    self._running = False
+                    self._cond.notify_all()
@@ -0,0 +1,233 @@
+"""Métricas de operação do FileSystem: contadores, latências e perfis.
+
+Desligadas, não custam nada: FileSystem.enable_metrics() instala na
+própria instância um invólucro para cada método público, que conta as
+chamadas e os erros e registra a latência e o número de nós percorridos
+em histogramas; disable_metrics() remove os invólucros e o método volta a
+ser o da classe. O percurso conta os nós visitados por walk() e os
+componentes lidos pela resolução de caminhos que não acertou o cache,
+atribuídos à operação em andamento na mesma thread.
+
+Os histogramas têm baldes logarítmicos (SUB_BUCKETS por potência de 2):
+memória constante e percentis com erro relativo de até 1/(2*SUB_BUCKETS).
+
+Para saber onde o tempo vai dentro das operações há dois perfis:
+`profile()` grava um perfil do cProfile da thread atual (pstats, para o
+snakeviz ou o gprof2dot) e `sample_stacks()` amostra as pilhas de todas
+as threads durante uma janela de tempo e grava no formato "folded" do
+flamegraph.pl e do speedscope.
+"""
+import contextlib
+import cProfile
+import functools
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterator, Optional
+
+SUB_BUCKETS = 8
+SAMPLE_INTERVAL = 0.005  # segundos entre amostras de sample_stacks
+
+# Instâncias com métricas ligadas; walk() e resolve() só contam nós se houver alguma
+active = 0
+_active_lock = threading.Lock()
+# Nós percorridos pela operação em andamento em cada thread (None fora de operações)
+_local = threading.local()
+
+
+class Histogram:
+    """Histograma de valores não negativos em baldes logarítmicos."""
+
+    __slots__ = ("buckets", "count", "total", "max")
+
+    def __init__(self):
+        self.buckets: Dict[Optional[int], int] = {}  # None guarda os zeros
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float):
+        if value > 0:
+            mantissa, exponent = math.frexp(value)
+            key = exponent * SUB_BUCKETS + int((mantissa - 0.5) * 2 * SUB_BUCKETS)
+        else:
+            key = None
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Limite superior do balde que contém o quantil q (0 a 1), sem passar do máximo."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = self.buckets.get(None, 0)
+        if seen >= rank:
+            return 0.0
+        for key in sorted(k for k in self.buckets if k is not None):
+            seen += self.buckets[key]
+            if seen >= rank:
+                exponent, sub = divmod(key, SUB_BUCKETS)
+                return min(self.max, math.ldexp(0.5 + (sub + 1) / (2 * SUB_BUCKETS), exponent))
+        return self.max
+
+
+class OperationStats:
+    """Chamadas, erros, latências (segundos) e nós percorridos de uma operação."""
+
+    __slots__ = ("calls", "errors", "latency", "walked")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self.walked = Histogram()
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_s": self.latency.total,
+            "mean_s": self.latency.total / self.calls if self.calls else 0.0,
+            "p50_s": self.latency.quantile(0.5),
+            "p99_s": self.latency.quantile(0.99),
+            "max_s": self.latency.max,
+            "walk_p50": self.walked.quantile(0.5),
+            "walk_p99": self.walked.quantile(0.99),
+            "walk_max": self.walked.max,
+        }
+
+
+class Metrics:
+    """Estatísticas por operação de um FileSystem, desde a criação ou o último reset()."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations: Dict[str, OperationStats] = {}
+        self.since = time.time()
+
+    def record(self, name: str, elapsed: float, walked: int, error: bool):
+        with self.lock:
+            stats = self.operations.get(name)
+            if stats is None:
+                stats = self.operations[name] = OperationStats()
+            stats.calls += 1
+            stats.errors += error
+            stats.latency.record(elapsed)
+            stats.walked.record(walked)
+
+    def reset(self):
+        with self.lock:
+            self.operations = {}
+            self.since = time.time()
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self.lock:
+            return {name: stats.snapshot() for name, stats in sorted(self.operations.items())}
+
+    def timed(self, name: str, method):
+        """Invólucro de um método ligado que registra cada chamada com o nome dado."""
+        record = self.record
+        clock = time.perf_counter
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            outer = getattr(_local, "walked", None)
+            _local.walked = 0
+            error = True
+            start = clock()
+            try:
+                result = method(*args, **kwargs)
+                error = False
+                return result
+            finally:
+                elapsed = clock() - start
+                walked = _local.walked
+                # Operações aninhadas (append chama write) também contam para a de fora
+                _local.walked = None if outer is None else outer + walked
+                record(name, elapsed, walked, error)
+        return wrapper
+
+
+def activate(delta: int):
+    """Registra uma instância que ligou (+1) ou desligou (-1) as métricas."""
+    global active
+    with _active_lock:
+        active += delta
+
+
+def note_walk(nodes: int):
+    """Soma nós percorridos à operação em andamento na thread, se houver."""
+    walked = getattr(_local, "walked", None)
+    if walked is not None:
+        _local.walked = walked + nodes
+
+
+def count_walk(nodes: Iterator) -> Iterator:
+    """Repassa um percurso da árvore contando os nós visitados."""
+    count = 0
+    try:
+        for node in nodes:
+            count += 1
+            yield node
+    finally:
+        note_walk(count)
+
+
+@contextlib.contextmanager
+def profile(path: str):
+    """Grava em path um perfil do cProfile do que a thread atual executar no bloco."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(path: str, seconds: float, interval: float = SAMPLE_INTERVAL, job=None) -> int:
+    """Amostra as pilhas de todas as threads por seconds segundos e grava em path.
+
+    Cada linha do arquivo é uma pilha, da base ao topo, com os quadros
+    separados por ';' e seguida do número de amostras, o formato aceito
+    pelo flamegraph.pl e pelo speedscope. A thread que amostra fica de
+    fora. Com um job (tarefas.Job), informa o progresso e para se ele for
+    cancelado, gravando o que já foi amostrado. Retorna o número de amostras.
+    """
+    me = threading.get_ident()
+    stacks: Counter = Counter()
+    start = time.perf_counter()
+    end = start + seconds
+    try:
+        while True:
+            now = time.perf_counter()
+            if now >= end:
+                break
+            if job is not None:
+                job.report(int((now - start) * 1000), int(seconds * 1000))
+                job.check()
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(_frame_name(frame))
+                    frame = frame.f_back
+                stacks[";".join(reversed(names))] += 1
+            time.sleep(interval)
+    finally:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+    return sum(stacks.values())
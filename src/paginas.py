@@ -0,0 +1,335 @@
+"""Cache de páginas dos blocos de dados da imagem de disco.
+
+As leituras e escritas de conteúdo de arquivos passam por um cache
+compartilhado de páginas de um bloco, indexadas pelo número do bloco na
+imagem. Uma página lida fica no cache até ser escolhida pela política de
+despejo (LRU, CLOCK ou ARC); uma página escrita fica suja até o flusher em
+segundo plano, um sync ou o seu despejo a gravar na imagem.
+
+Leituras sequenciais de um arquivo disparam leitura antecipada: a janela
+começa em READ_AHEAD_MIN páginas e dobra a cada leitura que continua de
+onde a anterior parou, até READ_AHEAD_MAX.
+
+Os metadados (inodes, bitmaps, entradas de diretório) não passam por aqui,
+e sim pelo journal.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+CACHE_PAGES = 1024
+WRITE_BACK_INTERVAL = 0.5  # segundos entre duas passadas do flusher
+READ_AHEAD_MIN = 4
+READ_AHEAD_MAX = 64
+READ_AHEAD_STREAMS = 32  # arquivos acompanhados ao mesmo tempo pela leitura antecipada
+
+
+class LRUPolicy:
+    """Despeja a página usada há mais tempo."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.order: "OrderedDict[int, None]" = OrderedDict()
+
+    def touch(self, key: int):
+        self.order.move_to_end(key)
+
+    def admit(self, key: int) -> List[int]:
+        """Inclui uma página nova; retorna as páginas a despejar."""
+        self.order[key] = None
+        evicted = []
+        while len(self.order) > self.capacity:
+            evicted.append(self.order.popitem(last=False)[0])
+        return evicted
+
+    def discard(self, key: int):
+        self.order.pop(key, None)
+
+
+class ClockPolicy:
+    """Aproximação do LRU com um bit de referência por página e um ponteiro circular."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.ring: List[Optional[int]] = []
+        self.referenced: List[bool] = []
+        self.slots: Dict[int, int] = {}
+        self.free: List[int] = []
+        self.hand = 0
+
+    def touch(self, key: int):
+        self.referenced[self.slots[key]] = True
+
+    def admit(self, key: int) -> List[int]:
+        if self.free:
+            slot = self.free.pop()
+        elif len(self.ring) < self.capacity:
+            slot = len(self.ring)
+            self.ring.append(None)
+            self.referenced.append(False)
+        else:
+            # Segunda chance: páginas referenciadas perdem o bit e ficam
+            while self.referenced[self.hand]:
+                self.referenced[self.hand] = False
+                self.hand = (self.hand + 1) % len(self.ring)
+            slot = self.hand
+            self.hand = (self.hand + 1) % len(self.ring)
+        victim = self.ring[slot]
+        if victim is not None:
+            del self.slots[victim]
+        self.ring[slot] = key
+        self.referenced[slot] = False
+        self.slots[key] = slot
+        return [victim] if victim is not None else []
+
+    def discard(self, key: int):
+        slot = self.slots.pop(key, None)
+        if slot is not None:
+            self.ring[slot] = None
+            self.referenced[slot] = False
+            self.free.append(slot)
+
+
+class ARCPolicy:
+    """Adaptive Replacement Cache (Megiddo e Modha).
+
+    t1 guarda as páginas vistas uma vez e t2 as vistas mais de uma vez;
+    b1 e b2 lembram as chaves despejadas de cada uma. Um acerto em b1 (ou
+    b2) mostra que t1 (ou t2) devia ser maior e desloca o alvo p, o
+    tamanho desejado de t1.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.p = 0.0
+        self.t1: "OrderedDict[int, None]" = OrderedDict()
+        self.t2: "OrderedDict[int, None]" = OrderedDict()
+        self.b1: "OrderedDict[int, None]" = OrderedDict()
+        self.b2: "OrderedDict[int, None]" = OrderedDict()
+
+    def touch(self, key: int):
+        self.t1.pop(key, None)
+        self.t2[key] = None
+        self.t2.move_to_end(key)
+
+    def admit(self, key: int) -> List[int]:
+        c = self.capacity
+        if key in self.b1:
+            self.p = min(c, self.p + max(len(self.b2) / len(self.b1), 1))
+            evicted = self._replace(in_b2=False)
+            del self.b1[key]
+            self.t2[key] = None
+            return evicted
+        if key in self.b2:
+            self.p = max(0.0, self.p - max(len(self.b1) / len(self.b2), 1))
+            evicted = self._replace(in_b2=True)
+            del self.b2[key]
+            self.t2[key] = None
+            return evicted
+        evicted = []
+        l1 = len(self.t1) + len(self.b1)
+        total = l1 + len(self.t2) + len(self.b2)
+        if l1 >= c:
+            if len(self.t1) < c:
+                self.b1.popitem(last=False)
+                evicted = self._replace(in_b2=False)
+            else:
+                evicted = [self.t1.popitem(last=False)[0]]
+        elif total >= c:
+            if total >= 2 * c:
+                self.b2.popitem(last=False)
+            evicted = self._replace(in_b2=False)
+        self.t1[key] = None
+        return evicted
+
+    def _replace(self, in_b2: bool) -> List[int]:
+        if len(self.t1) + len(self.t2) < self.capacity:
+            return []
+        if self.t1 and (len(self.t1) > self.p or (in_b2 and len(self.t1) == self.p)):
+            key = self.t1.popitem(last=False)[0]
+            self.b1[key] = None
+        else:
+            key = self.t2.popitem(last=False)[0]
+            self.b2[key] = None
+        return [key]
+
+    def discard(self, key: int):
+        for keys in (self.t1, self.t2, self.b1, self.b2):
+            keys.pop(key, None)
+
+
+POLICIES = {"lru": LRUPolicy, "clock": ClockPolicy, "arc": ARCPolicy}
+
+
+class PageCache:
+    """Cache de páginas de blocos de dados com escrita adiada (write-back).
+
+    read e write recebem intervalos absolutos no arquivo da imagem, como
+    DiskImage.data_read e data_write. A trava do cache é interna (folha no
+    protocolo de travas.py).
+    """
+
+    def __init__(self, mm, block_size: int, capacity: int = CACHE_PAGES, policy: str = "lru",
+                 interval: Optional[float] = WRITE_BACK_INTERVAL):
+        if policy not in POLICIES:
+            raise ValueError(f"Política de cache desconhecida: '{policy}'")
+        self.mm = mm
+        self.block_size = block_size
+        self.capacity = capacity
+        self.policy_name = policy
+        self.policy = POLICIES[policy](capacity)
+        self.pages: Dict[int, bytearray] = {}
+        self.dirty: Set[int] = set()
+        self.ahead: Set[int] = set()  # lidas antecipadamente e ainda não usadas
+        self.streams: "OrderedDict[int, tuple]" = OrderedDict()  # ino -> (próximo offset, janela)
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+        self.read_ahead = self.read_ahead_hits = 0
+        self.writebacks = 0
+        self.interval = interval
+        self._closing = False
+        self._wakeup = threading.Event()
+        self._flusher = None
+        if interval is not None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="page-flusher", daemon=True)
+            self._flusher.start()
+
+    # Páginas
+    def _page(self, block: int, whole: bool = False) -> bytearray:
+        """Página do bloco, lida da imagem se faltar; whole=True dispensa a leitura."""
+        page = self.pages.get(block)
+        if page is not None:
+            self.hits += 1
+            if block in self.ahead:
+                self.ahead.discard(block)
+                self.read_ahead_hits += 1
+            self.policy.touch(block)
+            return page
+        self.misses += 1
+        return self._load(block, whole)
+
+    def _load(self, block: int, whole: bool = False) -> bytearray:
+        bs = self.block_size
+        page = bytearray(bs) if whole else bytearray(self.mm[block * bs:(block + 1) * bs])
+        self.pages[block] = page
+        for victim in self.policy.admit(block):
+            self._drop(victim, write_back=True)
+            self.evictions += 1
+        return page
+
+    def _drop(self, block: int, write_back: bool):
+        page = self.pages.pop(block)
+        self.ahead.discard(block)
+        if block in self.dirty:
+            self.dirty.discard(block)
+            if write_back:
+                bs = self.block_size
+                self.mm[block * bs:(block + 1) * bs] = page
+                self.writebacks += 1
+
+    def _blocks(self, offset: int, n: int):
+        """Divide um intervalo absoluto em (bloco, início na página, fim na página)."""
+        bs = self.block_size
+        end = offset + n
+        while offset < end:
+            block, inner = divmod(offset, bs)
+            stop = min(bs, inner + end - offset)
+            yield block, inner, stop
+            offset += stop - inner
+
+    # Acesso
+    def read(self, offset: int, n: int) -> bytes:
+        with self.lock:
+            return b"".join(bytes(self._page(block)[inner:stop]) for block, inner, stop in self._blocks(offset, n))
+
+    def write(self, offset: int, data):
+        view = memoryview(data)
+        with self.lock:
+            for block, inner, stop in self._blocks(offset, len(view)):
+                page = self._page(block, whole=(stop - inner == self.block_size))
+                page[inner:stop] = view[:stop - inner]
+                view = view[stop - inner:]
+                self.dirty.add(block)
+            if len(self.dirty) * 2 > self.capacity:
+                self._wakeup.set()
+
+    def advise(self, data, offset: int, n: int):
+        """Registra a leitura de [offset, offset + n) de data (um ImageData) e lê adiante se ela for sequencial."""
+        with self.lock:
+            ino = data.node.ino
+            state = self.streams.pop(ino, None)
+            if state is not None and state[0] == offset:
+                window = min(state[1] * 2, READ_AHEAD_MAX)
+            elif offset == 0:
+                window = READ_AHEAD_MIN
+            else:
+                window = 0
+            end = offset + n
+            self.streams[ino] = (end, window or READ_AHEAD_MIN // 2)
+            if len(self.streams) > READ_AHEAD_STREAMS:
+                self.streams.popitem(last=False)
+            for pos, size in data._segments(end, min(window * self.block_size, data.length - end)):
+                for block, _, _ in self._blocks(pos, size):
+                    if block not in self.pages:
+                        self._load(block)
+                        self.ahead.add(block)
+                        self.read_ahead += 1
+
+    def discard(self, blocks):
+        """Esquece as páginas de blocos liberados, sem gravá-las."""
+        with self.lock:
+            for block in blocks:
+                if block in self.pages:
+                    self._drop(block, write_back=False)
+                    self.policy.discard(block)
+
+    # Escrita adiada
+    def flush(self):
+        """Grava na imagem todas as páginas sujas."""
+        with self.lock:
+            bs = self.block_size
+            for block in sorted(self.dirty):
+                self.mm[block * bs:(block + 1) * bs] = self.pages[block]
+                self.writebacks += 1
+            self.dirty.clear()
+
+    def drop(self):
+        """Grava as páginas sujas e esvazia o cache, como o drop_caches do Linux."""
+        self.flush()
+        with self.lock:
+            self.pages.clear()
+            self.ahead.clear()
+            self.streams.clear()
+            self.policy = POLICIES[self.policy_name](self.capacity)
+
+    def close(self):
+        self._closing = True
+        self._wakeup.set()
+        if self._flusher is not None and self._flusher.is_alive():
+            self._flusher.join()
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._closing:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._closing:
+                return
+            self.flush()
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "policy": self.policy_name,
+                "capacity": self.capacity,
+                "pages": len(self.pages),
+                "dirty": len(self.dirty),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "read_ahead": self.read_ahead,
+                "read_ahead_hits": self.read_ahead_hits,
+                "writebacks": self.writebacks,
+            }
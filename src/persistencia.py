@@ -0,0 +1,679 @@
+"""Imagem de disco persistente do sistema de arquivos.
+
+A imagem é um único arquivo mapeado em memória (mmap) com o layout:
+
+    bloco 0            superbloco
+    bitmap de inodes   1 bit por inode (1 = em uso)
+    bitmap de blocos   1 bit por bloco de dados (1 = em uso)
+    tabela de inodes   registros de INODE_SIZE bytes, indexados pelo ino
+    blocos de dados    blocos de block_size bytes
+
+Arquivos guardam seus bytes em extents (bloco inicial, quantidade) nos
+blocos de dados. Diretórios guardam nos blocos de dados a lista dos inos
+dos filhos (0 marca uma entrada removida). Ao abrir a imagem apenas o
+superbloco e os inodes da raiz e da lixeira são lidos; os demais nós são
+carregados sob demanda quando um diretório é acessado. Os registros da
+lixeira (lixeira.py) ficam nos dados de um inode fora da árvore, indicado
+no superbloco.
+
+As escritas de metadados passam pelo journal (journal.py), que as agrupa
+em transações e só as aplica na imagem no checkpoint. O conteúdo dos
+arquivos passa pelo cache de páginas (paginas.py), que adia as escritas.
+Quando o journal desfaz uma transação, as cópias em memória de
+metadados (contadores do superbloco, alocador de blocos, extents e
+tamanhos dos dados e posições das entradas de diretório) são relidas da
+imagem, para não gravarem de volta o que foi desfeito.
+"""
+import mmap
+import os
+import struct
+import weakref
+from contextlib import nullcontext
+from typing import Callable, Dict, List, Optional, Set
+
+from alocador import BLOCK_SIZE, BlockAllocator, Extent, blocks_for, extent_blocks
+from filesystem import MAX_DISK_SIZE, MAX_NAME, DirectoryNode, FileNode, Node
+from journal import CHECKPOINT_BYTES, GROUP_COMMIT_WINDOW, Journal
+from paginas import CACHE_PAGES, PageCache
+
+MAGIC = b"SOFSIMG1"
+VERSION = 1
+BYTES_PER_INODE = 4096
+INODE_SIZE = 256
+INLINE_EXTENTS = 7
+TRASH_LOG_NAME = ".lixeira"
+
+KIND_FREE, KIND_FILE, KIND_DIR = 0, 1, 2
+ROOT_INO = 1
+
+# magic, versão, block_size, blocos de dados, inodes, início do bitmap de
+# inodes, início do bitmap de blocos, início da tabela de inodes, início dos
+# dados, ino da lixeira, blocos livres, inodes livres, ino do registro da
+# lixeira (acrescentado depois: imagens antigas têm 0, o resto do bloco)
+SUPERBLOCK = struct.Struct("<8sIIIIIIIIIIII")
+# tipo, flags, tamanho do nome, pai, pai original, nº de extents, bloco de
+# extents indireto, tamanho, comprimento dos dados, ctime, mtime, atime,
+# arquivos e diretórios da subárvore
+INODE_HEADER = struct.Struct("<BBHIIIIQQdddII")
+EXTENT = struct.Struct("<II")
+ENTRY = struct.Struct("<I")
+
+class ImageData:
+    """Bytes de um nó guardados em extents nos blocos de dados da imagem."""
+
+    __slots__ = ("image", "node", "extents", "length", "meta")
+
+    def __init__(self, image: "DiskImage", node: Node, extents: Optional[List[Extent]] = None,
+                 length: int = 0, meta: bool = False):
+        self.image = image
+        self.node = node
+        self.extents = extents or []
+        self.length = length
+        # Dados de diretório são metadados e passam pela escrita de metadados
+        self.meta = meta
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def capacity(self) -> int:
+        return extent_blocks(self.extents) * self.image.block_size
+
+    @property
+    def shared(self) -> int:
+        # Os blocos da imagem sempre pertencem a um único arquivo
+        return 0
+
+    def _segments(self, offset: int, n: int):
+        """Converte um intervalo lógico em intervalos absolutos no arquivo."""
+        bs = self.image.block_size
+        pos = 0
+        for start, count in self.extents:
+            ext_len = count * bs
+            if n <= 0:
+                return
+            if offset < pos + ext_len:
+                inner = offset - pos
+                take = min(ext_len - inner, n)
+                yield self.image.block_offset(start) + inner, take
+                offset += take
+                n -= take
+            pos += ext_len
+
+    def read(self, offset: int, n: int) -> bytes:
+        n = min(n, self.length - offset)
+        if n <= 0:
+            return b""
+        if self.meta:
+            return b"".join(self.image.meta_read(pos, size) for pos, size in self._segments(offset, n))
+        data = b"".join(self.image.data_read(pos, size) for pos, size in self._segments(offset, n))
+        self.image.cache.advise(self, offset, n)
+        return data
+
+    def write(self, offset: int, data: bytes):
+        if offset > self.length:
+            data = bytes(offset - self.length) + data
+            offset = self.length
+        end = offset + len(data)
+        if end > self.capacity:
+            self._resize(blocks_for(end, self.image.block_size))
+        write = self.image.meta_write if self.meta else self.image.data_write
+        view = memoryview(data)
+        for pos, size in self._segments(offset, len(data)):
+            write(pos, view[:size])
+            view = view[size:]
+        self.length = max(self.length, end)
+        self.image.store(self.node)
+
+    def truncate(self, n: int):
+        if n > self.length:
+            self.write(self.length, bytes(n - self.length))
+        else:
+            self.length = n
+            self.reserve(n)
+
+    def replace(self, data: bytes):
+        self.length = 0
+        self.reserve(len(data))
+        self.write(0, data)
+
+    def reserve(self, n: int):
+        """Ajusta os blocos alocados para comportar n bytes (nunca abaixo do conteúdo)."""
+        needed = blocks_for(max(n, self.length), self.image.block_size)
+        if needed != extent_blocks(self.extents):
+            self._resize(needed)
+        self.image.store(self.node)
+
+    def release(self):
+        self.image.free_extents(self.extents)
+        self.extents = []
+        self.length = 0
+
+    def _resize(self, blocks: int):
+        had = extent_blocks(self.extents)
+        self.extents = self.image.resize_extents(self.extents, blocks)
+        if not self.meta and blocks > had:
+            self.image.revoke(_skip_blocks(self.extents, had))
+        if len(self.extents) > self.image.max_extents:
+            raise OSError(f"Arquivo '{self.node.name}' fragmentado demais")
+
+
+def _skip_blocks(extents: List[Extent], skip: int) -> List[Extent]:
+    """Extents que sobram depois de descartar os `skip` primeiros blocos."""
+    rest = []
+    for start, count in extents:
+        if skip >= count:
+            skip -= count
+            continue
+        rest.append((start + skip, count - skip))
+        skip = 0
+    return rest
+
+
+class DiskImage:
+    """Imagem de disco mapeada em memória."""
+
+    def __init__(self, path: str, journal: bool = True, window: float = GROUP_COMMIT_WINDOW,
+                 checkpoint_bytes: int = CHECKPOINT_BYTES, cache_pages: int = CACHE_PAGES,
+                 cache_policy: str = "lru"):
+        self.path = path
+        self.file = open(path, "r+b")
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        self.journal = None
+        if journal and self.mm[:len(MAGIC)] == MAGIC:
+            # Reaplica o journal antes de ler o superbloco, que também é journalado
+            self.journal = Journal(path + ".journal", self.mm, window, checkpoint_bytes)
+            self.journal.start(SUPERBLOCK.unpack_from(self.mm, 0)[2])
+        (magic, version, self.block_size, self.total_blocks, self.inode_count,
+         self.inode_bitmap_start, self.block_bitmap_start, self.inode_table_start,
+         self.data_start, self.trash_ino, self.free_blocks, self.free_inodes, self.trash_log_ino) = \
+            SUPERBLOCK.unpack_from(self.mm, 0)
+        self.cache = PageCache(self.mm, self.block_size or BLOCK_SIZE, cache_pages, cache_policy)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"'{path}' não é uma imagem de disco válida")
+        self.max_extents = INLINE_EXTENTS + self.block_size // EXTENT.size
+        # Mapa de identidade ino -> nó já carregado
+        self.nodes: Dict[int, Node] = {}
+        # Nós despejados da memória (forget) que ainda estão em uso fora da árvore
+        self.evicted: "weakref.WeakValueDictionary[int, Node]" = weakref.WeakValueDictionary()
+        self.dir_entries: Dict[int, ImageData] = {}
+        self.dir_slots: Dict[int, Dict[int, int]] = {}
+        self.original_parents: Dict[int, int] = {}
+        self.trash_log_node: Optional[FileNode] = None
+        self.on_load: List[Callable[[Node], None]] = []
+        self._allocator: Optional[BlockAllocator] = None
+        self._inode_hint = 0
+        if self.journal is not None:
+            self.journal.on_rollback.append(self._rolled_back)
+
+    @classmethod
+    def create(cls, path: str, size: int = MAX_DISK_SIZE, block_size: int = BLOCK_SIZE,
+               inode_count: Optional[int] = None) -> "DiskImage":
+        """Cria uma imagem vazia com `size` bytes de dados e a abre."""
+        total_blocks = blocks_for(size, block_size)
+        inode_count = inode_count or max(64, size // BYTES_PER_INODE)
+        inode_bitmap_start = 1
+        block_bitmap_start = inode_bitmap_start + blocks_for(-(-(inode_count + 1) // 8), block_size)
+        inode_table_start = block_bitmap_start + blocks_for(-(-total_blocks // 8), block_size)
+        data_start = inode_table_start + blocks_for((inode_count + 1) * INODE_SIZE, block_size)
+        if os.path.exists(path + ".journal"):
+            os.remove(path + ".journal")
+        with open(path, "wb") as f:
+            # Arquivo esparso: as regiões zeradas não ocupam disco real
+            f.truncate((data_start + total_blocks) * block_size)
+            f.write(SUPERBLOCK.pack(MAGIC, VERSION, block_size, total_blocks, inode_count,
+                                    inode_bitmap_start, block_bitmap_start, inode_table_start,
+                                    data_start, 0, total_blocks, inode_count, 0))
+        image = cls(path)
+        # O ino 0 significa "nenhum" e nunca é alocado
+        image._set_bit(inode_bitmap_start, 0, True)
+        root = DirectoryNode(name="C:", ino=image.alloc_inode())
+        image.store(root)
+        trash = DirectoryNode(name="Lixeira", ino=image.alloc_inode())
+        root.add_child(trash)
+        image.store(trash)
+        image.link(root, trash)
+        image.store(root)
+        image.trash_ino = trash.ino
+        image.write_superblock()
+        image.nodes.clear()
+        image.dir_entries.clear()
+        image.dir_slots.clear()
+        return image
+
+    @property
+    def capacity(self) -> int:
+        return self.total_blocks * self.block_size
+
+    # Acesso bruto
+    def block_offset(self, block: int) -> int:
+        return (self.data_start + block) * self.block_size
+
+    def meta_read(self, offset: int, n: int) -> bytes:
+        if self.journal is not None:
+            return self.journal.read(offset, n)
+        return self.mm[offset:offset + n]
+
+    def meta_write(self, offset: int, data: bytes):
+        if self.journal is not None:
+            self.journal.write(offset, data)
+        else:
+            self.mm[offset:offset + len(data)] = data
+
+    def data_read(self, offset: int, n: int) -> bytes:
+        return self.cache.read(offset, n)
+
+    def data_write(self, offset: int, data: bytes):
+        self.cache.write(offset, data)
+
+    def write_superblock(self):
+        self.meta_write(0, SUPERBLOCK.pack(
+            MAGIC, VERSION, self.block_size, self.total_blocks, self.inode_count,
+            self.inode_bitmap_start, self.block_bitmap_start, self.inode_table_start,
+            self.data_start, self.trash_ino, self.free_blocks, self.free_inodes, self.trash_log_ino))
+
+    def transaction(self):
+        """Agrupa as escritas de metadados seguintes em uma única transação."""
+        return self.journal.transaction() if self.journal is not None else nullcontext()
+
+    def revoke(self, extents: List[Extent]):
+        if self.journal is not None:
+            self.journal.revoke(b + self.data_start for start, count in extents
+                                for b in range(start, start + count))
+
+    def sync(self):
+        """Torna duráveis as alterações feitas até agora."""
+        self.cache.flush()
+        if self.journal is not None:
+            self.journal.flush()
+        else:
+            self.mm.flush()
+
+    def close(self):
+        if not self.mm.closed:
+            self.cache.close()
+            if self.mm[:len(MAGIC)] == MAGIC:
+                self.write_superblock()
+            if self.journal is not None:
+                self.journal.close()
+            self.mm.flush()
+            self.mm.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Bitmaps
+    def _bit(self, start_block: int, index: int) -> bool:
+        byte = self.meta_read(start_block * self.block_size + index // 8, 1)[0]
+        return bool(byte & (1 << (index % 8)))
+
+    def _set_bit(self, start_block: int, index: int, value: bool):
+        offset = start_block * self.block_size + index // 8
+        byte = self.meta_read(offset, 1)[0]
+        byte = byte | (1 << (index % 8)) if value else byte & ~(1 << (index % 8))
+        self.meta_write(offset, bytes((byte,)))
+
+    def _find_free(self, start_block: int, count: int, hint: int) -> Optional[int]:
+        """Procura o primeiro bit livre a partir de hint, dando a volta no bitmap."""
+        base = start_block * self.block_size
+        nbytes = -(-count // 8)
+        for lo, hi in ((hint // 8, nbytes), (0, hint // 8)):
+            chunk = self.meta_read(base + lo, hi - lo)
+            for i, byte in enumerate(chunk):
+                if byte != 0xFF:
+                    for bit in range(8):
+                        index = (lo + i) * 8 + bit
+                        if index < count and not byte & (1 << bit):
+                            return index
+        return None
+
+    def _rolled_back(self, blocks: Set[int]):
+        """Relê da imagem as cópias em memória dos metadados desfeitos pelo journal."""
+        if 0 in blocks:
+            fields = SUPERBLOCK.unpack_from(self.meta_read(0, SUPERBLOCK.size))
+            self.trash_ino, self.free_blocks, self.free_inodes, trash_log_ino = fields[9:]
+            if trash_log_ino != self.trash_log_ino:
+                self.trash_log_ino, self.trash_log_node = trash_log_ino, None
+        if self._allocator is not None and any(
+                self.block_bitmap_start <= b < self.inode_table_start for b in blocks):
+            self._reload_allocator()
+        per_block = self.block_size // INODE_SIZE
+        inos = set()
+        for block in blocks:
+            if self.inode_table_start <= block < self.data_start:
+                first = (block - self.inode_table_start) * per_block
+                inos.update(range(first, min(first + per_block, self.inode_count + 1)))
+            elif self.inode_bitmap_start <= block < self.block_bitmap_start:
+                # Inodes alocados na transação desfeita que nem chegaram a ser gravados
+                lo = (block - self.inode_bitmap_start) * self.block_size * 8
+                hi = lo + self.block_size * 8
+                inos.update(ino for ino in (*self.nodes, *self.dir_entries) if lo <= ino < hi)
+        for ino in inos:
+            self._reload_inode(ino)
+
+    def _reload_allocator(self):
+        nbytes = -(-self.total_blocks // 8)
+        bitmap = self.meta_read(self.block_bitmap_start * self.block_size, nbytes)
+        # Blocos alocados na transação desfeita: páginas sujas deles não podem chegar ao disco
+        dropped = []
+        for i, (was, now) in enumerate(zip(self._allocator.bitmap, bitmap)):
+            gone = was & ~now
+            if gone:
+                dropped.extend(i * 8 + bit for bit in range(8) if gone & (1 << bit))
+        self._allocator.reload(bitmap)
+        self.free_blocks = self._allocator.free_blocks
+        self._discard_pages([(block, 1) for block in dropped])
+
+    def _reload_inode(self, ino: int):
+        """Volta os dados de um nó em memória ao registro do inode na imagem."""
+        node = self.nodes.get(ino) or self.evicted.get(ino)
+        if node is None and self.trash_log_node is not None and self.trash_log_node.ino == ino:
+            node = self.trash_log_node
+        if node is None and ino not in self.dir_entries:
+            return
+        raw = self.meta_read(self._inode_offset(ino), INODE_SIZE)
+        header = INODE_HEADER.unpack_from(raw)
+        if header[0] == KIND_FREE or not self._bit(self.inode_bitmap_start, ino):
+            # Alocado na transação desfeita: o ino voltou a ficar livre
+            self.nodes.pop(ino, None)
+            self.dir_entries.pop(ino, None)
+            self.dir_slots.pop(ino, None)
+            return
+        data = self.dir_entries.get(ino)
+        if data is None and isinstance(node, FileNode) and isinstance(node.data, ImageData):
+            data = node.data
+        if data is None:
+            return
+        data.extents = self._read_extents(raw, header[5], header[6])
+        data.length = header[8]
+        if ino in self.dir_slots:
+            # Posições das entradas, como em load_children
+            entries = ENTRY.iter_unpack(data.read(0, data.length))
+            self.dir_slots[ino] = {child: slot for slot, (child,) in enumerate(entries) if child}
+
+    # Inodes
+    def alloc_inode(self) -> int:
+        index = self._find_free(self.inode_bitmap_start, self.inode_count + 1, self._inode_hint)
+        if index is None:
+            raise MemoryError("Tabela de inodes cheia")
+        self._set_bit(self.inode_bitmap_start, index, True)
+        self._inode_hint = index + 1
+        self.free_inodes -= 1
+        self.write_superblock()
+        return index
+
+    def free_inode(self, ino: int):
+        self._set_bit(self.inode_bitmap_start, ino, False)
+        self.meta_write(self._inode_offset(ino), bytes(INODE_SIZE))
+        self.free_inodes += 1
+        self._inode_hint = min(self._inode_hint, ino)
+        self.write_superblock()
+
+    def _inode_offset(self, ino: int) -> int:
+        return self.inode_table_start * self.block_size + ino * INODE_SIZE
+
+    def _read_extents(self, raw: bytes, count: int, indirect: int) -> List[Extent]:
+        base = INODE_HEADER.size
+        inline = [EXTENT.unpack_from(raw, base + i * EXTENT.size) for i in range(min(count, INLINE_EXTENTS))]
+        if count > INLINE_EXTENTS:
+            extra = self.meta_read(self.block_offset(indirect), (count - INLINE_EXTENTS) * EXTENT.size)
+            inline.extend(EXTENT.iter_unpack(extra))
+        return inline
+
+    def store(self, node: Node):
+        """Grava o registro de inode de um nó."""
+        if isinstance(node, DirectoryNode):
+            kind, size, data = KIND_DIR, node.subtree_size, self._entries(node)
+            files, dirs = node.file_count, node.dir_count
+        else:
+            kind, size, data = KIND_FILE, node.size, node.data if isinstance(node.data, ImageData) else None
+            files = dirs = 0
+        extents = data.extents if data is not None else []
+        length = data.length if data is not None else 0
+        name = node.name.encode("utf-8")
+        if len(name) > MAX_NAME:
+            raise ValueError(f"Nome '{node.name}' excede {MAX_NAME} bytes")
+        parent = node.parent.ino if node.parent is not None else 0
+        if node.original_parent is not None:
+            original = node.original_parent.ino
+        else:
+            original = self.original_parents.get(node.ino, 0)
+
+        indirect = self._indirect_block(node.ino, len(extents))
+        raw = bytearray(INODE_SIZE)
+        INODE_HEADER.pack_into(raw, 0, kind, 0, len(name), parent, original, len(extents), indirect,
+                               size, length, node.ctime, node.mtime, node.atime, files, dirs)
+        for i, extent in enumerate(extents[:INLINE_EXTENTS]):
+            EXTENT.pack_into(raw, INODE_HEADER.size + i * EXTENT.size, *extent)
+        raw[INODE_SIZE - MAX_NAME:INODE_SIZE - MAX_NAME + len(name)] = name
+        if len(extents) > INLINE_EXTENTS:
+            self.meta_write(self.block_offset(indirect),
+                            b"".join(EXTENT.pack(*e) for e in extents[INLINE_EXTENTS:]))
+        self.meta_write(self._inode_offset(node.ino), bytes(raw))
+
+    def _indirect_block(self, ino: int, extent_count: int) -> int:
+        """Aloca ou libera o bloco de extents indireto conforme a necessidade."""
+        header = INODE_HEADER.unpack_from(self.meta_read(self._inode_offset(ino), INODE_HEADER.size))
+        current = header[6]
+        if extent_count > INLINE_EXTENTS and not current:
+            return self.alloc_blocks(1)[0][0]
+        if extent_count <= INLINE_EXTENTS and current:
+            self.free_extents([(current, 1)])
+            return 0
+        return current
+
+    def blocks_of(self, node: Node) -> int:
+        """Blocos de dados ocupados por um nó, incluindo o bloco de extents indireto."""
+        if isinstance(node, DirectoryNode):
+            data = self._entries(node)
+        else:
+            data = node.data if isinstance(node.data, ImageData) else None
+        if data is None:
+            return 0
+        return extent_blocks(data.extents) + (1 if len(data.extents) > INLINE_EXTENTS else 0)
+
+    def free(self, node: Node):
+        """Libera o inode e os blocos de um nó removido definitivamente."""
+        if isinstance(node, DirectoryNode):
+            data = self._entries(node)
+            self.dir_entries.pop(node.ino, None)
+            self.dir_slots.pop(node.ino, None)
+        else:
+            data = node.data if isinstance(node.data, ImageData) else None
+        if data is not None:
+            data.release()
+        self._indirect_block(node.ino, 0)
+        self.free_inode(node.ino)
+        self.nodes.pop(node.ino, None)
+        self.original_parents.pop(node.ino, None)
+
+    # Carga sob demanda
+    def load_root(self) -> DirectoryNode:
+        return self.load_node(ROOT_INO, None)
+
+    def load_node(self, ino: int, parent: Optional[DirectoryNode]) -> Node:
+        node = self.nodes.get(ino)
+        if node is not None:
+            return node
+        raw = self.meta_read(self._inode_offset(ino), INODE_SIZE)
+        (kind, _, name_len, _, original, extent_count, indirect, size, length,
+         ctime, mtime, atime, files, dirs) = INODE_HEADER.unpack_from(raw)
+        if kind == KIND_FREE:
+            raise FileNotFoundError(f"Inode {ino} não está em uso")
+        name = bytes(raw[INODE_SIZE - MAX_NAME:INODE_SIZE - MAX_NAME + name_len]).decode("utf-8")
+        extents = self._read_extents(raw, extent_count, indirect)
+        node = self.evicted.pop(ino, None)
+        if node is not None:
+            # Despejado, mas alguém ainda o usa: volta o mesmo objeto, e não uma
+            # segunda cópia do nó. As alterações nele já foram gravadas na imagem.
+            if isinstance(node, DirectoryNode) and ino not in self.dir_entries:
+                self.dir_entries[ino] = ImageData(self, node, extents, length, meta=True)
+        elif kind == KIND_DIR:
+            node = DirectoryNode(name=name, ino=ino, ctime=ctime, mtime=mtime, atime=atime,
+                                 subtree_size=size, file_count=files, dir_count=dirs,
+                                 _children=None, _loader=self.load_children)
+            self.dir_entries[ino] = ImageData(self, node, extents, length, meta=True)
+        else:
+            node = FileNode(name=name, ino=ino, ctime=ctime, mtime=mtime, atime=atime, size=size)
+            node.data = ImageData(self, node, extents, length)
+        node.parent = parent
+        if original:
+            self.original_parents[ino] = original
+        self.nodes[ino] = node
+        for callback in self.on_load:
+            callback(node)
+        return node
+
+    def load_children(self, directory: DirectoryNode) -> Dict[str, Node]:
+        """Lê as entradas do diretório e carrega os seus filhos."""
+        entries = self._entries(directory)
+        raw = entries.read(0, entries.length)
+        children, slots = {}, {}
+        for slot, (ino,) in enumerate(ENTRY.iter_unpack(raw)):
+            if ino:
+                child = self.load_node(ino, directory)
+                children[child.name] = child
+                slots[ino] = slot
+        self.dir_slots[directory.ino] = slots
+        return children
+
+    def node_by_ino(self, ino: int) -> Node:
+        """Materializa um nó pelo ino, carregando a cadeia de ancestrais."""
+        node = self.nodes.get(ino)
+        if node is not None:
+            return node
+        header = INODE_HEADER.unpack_from(self.meta_read(self._inode_offset(ino), INODE_HEADER.size))
+        kind, parent_ino = header[0], header[3]
+        if kind == KIND_FREE or not parent_ino:
+            raise FileNotFoundError(f"Inode {ino} não encontrado")
+        parent = self.node_by_ino(parent_ino)
+        parent.children  # carrega o diretório, registrando o nó no mapa de identidade
+        return self.nodes[ino]
+
+    def forget(self, node: Node):
+        """Tira da memória um nó carregado e limpo; o próximo acesso o lê de novo da imagem.
+
+        Só vale para nós já gravados e sem filhos carregados. Se o objeto
+        continuar referenciado fora da árvore, load_node o reaproveita.
+        """
+        self.nodes.pop(node.ino, None)
+        if isinstance(node, DirectoryNode):
+            self.dir_entries.pop(node.ino, None)
+            self.dir_slots.pop(node.ino, None)
+        self.evicted[node.ino] = node
+
+    def _entries(self, directory: DirectoryNode) -> ImageData:
+        """Entradas do diretório, lidas de novo do inode se ele foi despejado."""
+        data = self.dir_entries.get(directory.ino)
+        if data is None:
+            raw = self.meta_read(self._inode_offset(directory.ino), INODE_SIZE)
+            header = INODE_HEADER.unpack_from(raw)
+            extents = self._read_extents(raw, header[5], header[6])
+            data = self.dir_entries[directory.ino] = ImageData(self, directory, extents, header[8], meta=True)
+        return data
+
+    def original_parent_of(self, node: Node) -> Optional[DirectoryNode]:
+        ino = self.original_parents.get(node.ino)
+        if not ino:
+            return None
+        try:
+            return self.node_by_ino(ino)
+        except FileNotFoundError:
+            return None
+
+    def trash_log(self) -> ImageData:
+        """Dados do registro da lixeira (lixeira.TrashStore), em um inode fora da árvore.
+
+        O ino fica no superbloco; imagens que ainda não o têm ganham o
+        inode na primeira chamada.
+        """
+        if self.trash_log_node is None:
+            if self.trash_log_ino:
+                raw = self.meta_read(self._inode_offset(self.trash_log_ino), INODE_SIZE)
+                header = INODE_HEADER.unpack_from(raw)
+                node = FileNode(name=TRASH_LOG_NAME, ino=self.trash_log_ino)
+                node.data = ImageData(self, node, self._read_extents(raw, header[5], header[6]),
+                                      header[8], meta=True)
+            else:
+                with self.transaction():
+                    node = FileNode(name=TRASH_LOG_NAME, ino=self.alloc_inode())
+                    node.data = ImageData(self, node, meta=True)
+                    self.store(node)
+                    self.trash_log_ino = node.ino
+                    self.write_superblock()
+            self.trash_log_node = node
+        return self.trash_log_node.data
+
+    # Entradas de diretório
+    def link(self, directory: DirectoryNode, node: Node):
+        """Acrescenta o ino de um nó às entradas do diretório."""
+        if isinstance(node, DirectoryNode):
+            self.dir_entries.setdefault(node.ino, ImageData(self, node, meta=True))
+            self.dir_slots.setdefault(node.ino, {})
+        self.nodes[node.ino] = node
+        entries = self._entries(directory)
+        slots = self.dir_slots.setdefault(directory.ino, {})
+        slots[node.ino] = entries.length // ENTRY.size
+        entries.write(entries.length, ENTRY.pack(node.ino))
+
+    def unlink(self, directory: DirectoryNode, node: Node):
+        """Marca a entrada do nó como removida, compactando quando metade está vazia."""
+        entries = self._entries(directory)
+        slots = self.dir_slots[directory.ino]
+        slot = slots.pop(node.ino)
+        if (slot + 1) * ENTRY.size == entries.length:
+            entries.truncate(slot * ENTRY.size)
+        else:
+            entries.write(slot * ENTRY.size, ENTRY.pack(0))
+        if len(slots) * 2 < entries.length // ENTRY.size:
+            ordered = sorted(slots.items(), key=lambda item: item[1])
+            entries.replace(b"".join(ENTRY.pack(ino) for ino, _ in ordered))
+            for new_slot, (ino, _) in enumerate(ordered):
+                slots[ino] = new_slot
+
+    # Blocos de dados
+    @property
+    def allocator(self) -> BlockAllocator:
+        """Alocador dos blocos de dados, montado a partir do bitmap no primeiro uso."""
+        if self._allocator is None:
+            nbytes = -(-self.total_blocks // 8)
+            bitmap = self.meta_read(self.block_bitmap_start * self.block_size, nbytes)
+            self._allocator = BlockAllocator(self.total_blocks, self.block_size, bitmap,
+                                             on_change=self._write_block_bitmap)
+        return self._allocator
+
+    def _write_block_bitmap(self, first_byte: int, last_byte: int):
+        self.meta_write(self.block_bitmap_start * self.block_size + first_byte,
+                        bytes(self._allocator.bitmap[first_byte:last_byte + 1]))
+
+    def alloc_blocks(self, count: int, after: Optional[Extent] = None) -> List[Extent]:
+        """Aloca `count` blocos, preferindo continuar logo após o extent `after`."""
+        extents = self.allocator.alloc(count, after)
+        self.free_blocks = self.allocator.free_blocks
+        self.write_superblock()
+        return extents
+
+    def free_extents(self, extents: List[Extent]):
+        self._discard_pages(extents)
+        self.allocator.free(extents)
+        self.free_blocks = self.allocator.free_blocks
+        self.write_superblock()
+
+    def resize_extents(self, extents: List[Extent], blocks: int) -> List[Extent]:
+        self._discard_pages(_skip_blocks(extents, blocks))
+        extents = self.allocator.resize(extents, blocks)
+        self.free_blocks = self.allocator.free_blocks
+        self.write_superblock()
+        return extents
+
+    def _discard_pages(self, extents: List[Extent]):
+        """Tira do cache os blocos liberados: uma página suja antiga não pode sobrescrever o novo dono."""
+        self.cache.discard(self.data_start + b for start, count in extents for b in range(start, start + count))
+
+    def new_data(self, node: FileNode) -> ImageData:
+        return ImageData(self, node)
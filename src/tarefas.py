@@ -0,0 +1,130 @@
+"""Execução de operações longas em segundo plano, com progresso e cancelamento.
+
+O Scheduler roda cada operação como um Job em um pool de threads. A
+função do job recebe o próprio Job, informa o progresso com report() e
+chama check() nos pontos em que pode parar; check() lança Cancelled se o
+job foi cancelado. Nada é chamado de dentro das threads do pool na
+interface: conclusões e notificações entram em uma fila que a thread
+principal esvazia com poll(), tipicamente a partir de um `after` do Tk.
+"""
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+WORKERS = 4
+
+PENDING = "pendente"
+RUNNING = "executando"
+DONE = "concluída"
+FAILED = "falhou"
+CANCELLED = "cancelada"
+
+
+class Cancelled(Exception):
+    """Lançada por Job.check() quando o job foi cancelado."""
+
+
+class Job:
+    """Operação em segundo plano com progresso (done de total) e cancelamento."""
+
+    def __init__(self, title: str):
+        self.title = title
+        self.status = PENDING
+        self.done = 0
+        self.total: Optional[int] = None
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def fraction(self) -> Optional[float]:
+        """Fração concluída, ou None enquanto o total é desconhecido."""
+        if not self.total:
+            return None
+        return min(1.0, self.done / self.total)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise Cancelled(self.title)
+
+    def report(self, done: int, total: Optional[int] = None):
+        self.done = done
+        if total is not None:
+            self.total = total
+
+    def __repr__(self):
+        return f"Job({self.title!r}, {self.status}, {self.done}/{self.total})"
+
+
+class Scheduler:
+    """Pool de threads para Jobs, com entrega dos resultados na thread principal."""
+
+    def __init__(self, workers: int = WORKERS):
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tarefa")
+        self.jobs: List[Job] = []  # jobs ainda não entregues por poll()
+        self.inbox: "queue.SimpleQueue" = queue.SimpleQueue()
+        self.main_thread = threading.current_thread()
+
+    def submit(self, title: str, fn: Callable[..., Any], *args,
+               on_done: Optional[Callable[[Any], None]] = None,
+               on_error: Optional[Callable[[BaseException], None]] = None) -> Job:
+        """Agenda fn(job, *args); on_done/on_error rodam na thread principal, em poll()."""
+        job = Job(title)
+        self.jobs.append(job)
+
+        def run():
+            if job.cancelled:
+                job.status = CANCELLED
+            else:
+                job.status = RUNNING
+                try:
+                    job.result = fn(job, *args)
+                    job.status = DONE
+                except Cancelled:
+                    job.status = CANCELLED
+                except Exception as e:
+                    job.error = e
+                    job.status = FAILED
+            self.inbox.put((self._finish, (job, on_done, on_error)))
+
+        self.pool.submit(run)
+        return job
+
+    def call_soon(self, fn: Callable[..., Any], *args):
+        """Executa fn(*args) na thread principal: já, se for ela, ou no próximo poll()."""
+        if threading.current_thread() is self.main_thread:
+            fn(*args)
+        else:
+            self.inbox.put((fn, args))
+
+    def poll(self) -> int:
+        """Executa as notificações pendentes; chamado periodicamente pela thread principal."""
+        count = 0
+        while True:
+            try:
+                fn, args = self.inbox.get_nowait()
+            except queue.Empty:
+                return count
+            fn(*args)
+            count += 1
+
+    def _finish(self, job: Job, on_done, on_error):
+        self.jobs.remove(job)
+        if job.status == DONE and on_done is not None:
+            on_done(job.result)
+        elif job.status == FAILED and on_error is not None:
+            on_error(job.error)
+
+    def shutdown(self, cancel: bool = True):
+        if cancel:
+            for job in self.jobs:
+                job.cancel()
+        self.pool.shutdown(wait=True)
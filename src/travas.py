@@ -0,0 +1,171 @@
+"""Travas para o uso concorrente do sistema de arquivos.
+
+Cada diretório e arquivo tem uma trava de leitores e escritor (RWLock),
+criada no primeiro uso. Protocolo de ordem, para que operações que
+envolvem mais de um diretório (mover, mandar para a lixeira, restaurar,
+copiar) não entrem em deadlock:
+
+1. a transação da imagem em disco, se houver, é tomada antes de tudo, e a
+   trava de movimentação do FileSystem (só o rename a usa) logo depois;
+2. as travas de diretórios são tomadas todas de uma vez com `lock_nodes`,
+   que as ordena pelo número de inode; como o ino nunca muda, nem quando o
+   nó é movido, a ordem é a mesma para todas as threads;
+3. travas de arquivos vêm depois das de diretórios (lock_nodes também as
+   põe no fim); quem tem a trava de um arquivo nunca espera a de um
+   diretório;
+4. as travas internas (totais, índices, chunks, carga preguiçosa) são
+   folhas: quem as tem não toma nenhuma outra trava de nó, a não ser sem
+   esperar, como `while_idle` faz ao despejar diretórios da memória.
+
+A resolução de caminhos não trava: cada passo é uma consulta a um dict,
+atômica no interpretador, e um nó encontrado continua válido mesmo que
+seja removido em seguida.
+"""
+import contextlib
+import threading
+from typing import Dict, Optional
+
+_creation = threading.Lock()
+
+
+class RWLock:
+    """Trava de leitores e escritor, com preferência para o escritor.
+
+    Vários leitores entram juntos; o escritor espera os leitores saírem e
+    bloqueia novos leitores enquanto espera. É reentrante para a mesma
+    thread: quem escreve pode escrever ou ler de novo, e quem lê pode ler
+    de novo. Passar de leitura para escrita não é permitido (deadlock).
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers: Dict[int, int] = {}  # thread -> leituras em aberto
+        self._writer: Optional[int] = None
+        self._writes = 0
+        self._waiting = 0  # escritores esperando
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me or me in self._readers:
+                self._readers[me] = self._readers.get(me, 0) + 1
+                return
+            while self._writer is not None or self._waiting:
+                self._cond.wait()
+            self._readers[me] = 1
+
+    def release_read(self):
+        me = threading.get_ident()
+        with self._cond:
+            count = self._readers[me] - 1
+            if count:
+                self._readers[me] = count
+            else:
+                del self._readers[me]
+                if not self._readers:
+                    self._cond.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writes += 1
+                return
+            if me in self._readers:
+                raise RuntimeError("Não é possível passar de leitura para escrita na mesma trava")
+            self._waiting += 1
+            while self._writer is not None or self._readers:
+                self._cond.wait()
+            self._waiting -= 1
+            self._writer = me
+            self._writes = 1
+
+    def try_acquire_idle(self) -> bool:
+        """Toma a trava para escrita só se ninguém a tiver, nem a própria thread; não espera."""
+        with self._cond:
+            if self._writer is not None or self._readers or self._waiting:
+                return False
+            self._writer = threading.get_ident()
+            self._writes = 1
+            return True
+
+    def release_write(self):
+        with self._cond:
+            self._writes -= 1
+            if not self._writes:
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def reading(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def writing(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+def lock_of(node) -> RWLock:
+    """Trava do nó, criada no primeiro uso."""
+    lock = node._lock
+    if lock is None:
+        with _creation:
+            lock = node._lock
+            if lock is None:
+                lock = node._lock = RWLock()
+    return lock
+
+
+@contextlib.contextmanager
+def lock_nodes(*nodes, write: bool = True):
+    """Toma as travas dos nós na ordem do protocolo; nós repetidos ou None são ignorados."""
+    unique = {id(n): n for n in nodes if n is not None}
+    ordered = sorted(unique.values(), key=lambda n: (n.kind == "file", n.ino))
+    taken = []
+    try:
+        for node in ordered:
+            lock = lock_of(node)
+            if write:
+                lock.acquire_write()
+            else:
+                lock.acquire_read()
+            taken.append(lock)
+        yield
+    finally:
+        for lock in reversed(taken):
+            if write:
+                lock.release_write()
+            else:
+                lock.release_read()
+
+
+@contextlib.contextmanager
+def while_idle(nodes):
+    """Executa o bloco só se nenhum dos nós estiver em uso; produz False se algum estiver.
+
+    Toma para escrita, sem esperar, as travas já existentes dos nós e
+    impede que outras sejam criadas durante o bloco, então nenhuma thread
+    começa a operar nesses nós antes de ele terminar.
+    """
+    taken = []
+    with _creation:
+        try:
+            for node in nodes:
+                lock = node._lock
+                if lock is not None:
+                    if not lock.try_acquire_idle():
+                        yield False
+                        return
+                    taken.append(lock)
+            yield True
+        finally:
+            for lock in taken:
+                lock.release_write()